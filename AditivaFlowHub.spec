@@ -5,8 +5,8 @@ a = Analysis(
     ['deployments\\windows\\hub_gui.py'],
     pathex=['.'],
     binaries=[],
-    datas=[('templates', 'templates'), ('favicon.ico', '.'), ('favicon-32x32.png', '.')],
-    hiddenimports=['app', 'PIL', 'pystray'],
+    datas=[('templates', 'templates'), ('static', 'static'), ('favicon.ico', '.'), ('favicon-32x32.png', '.')],
+    hiddenimports=['app', 'PIL', 'pystray', 'waitress'],
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
@@ -25,5 +25,5 @@ fi
 
 # Run the application
 cd /app
-export WERKZEUG_RUN_MAIN=true # Ensure background threads start
-python3 app.py
+# Production server (waitress); exec so the supervisor's SIGTERM reaches Python
+exec python3 app.py --host 0.0.0.0 --port 5000 --threads 32
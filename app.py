@@ -1,74 +1,80 @@
-from flask import Flask, render_template, request, jsonify, abort
-import threading
+from flask import Flask, render_template, request, jsonify, abort, Response, send_file
+import argparse
 import time
 import json
 import os
-import psutil
 import signal
 import sys
 import requests
 import base64
+import queue
+import uuid
 from datetime import datetime
-from printer_drivers import create_printer_from_config
+from printer_drivers import create_printer_from_config, PRINTER_CLASSES
+from discovery import DiscoveryService
+from supervisor import SUPERVISOR, sleep as supervised_sleep
+from mqtt_reactor import MQTT_REACTOR
+from camera_reactor import CAMERA_REACTOR
+from frame_variants import FRAME_VARIANTS, FRAME_SIZES
+from timelapse import TIMELAPSE
+from metrics import METRICS, CONTENT_TYPE as METRICS_CONTENT_TYPE
+import profiler
+from system_monitor import SYSTEM_STATS
+from command_queue import COMMANDS
+from uploads import UPLOADS
+from job_queue import JOBS
+from werkzeug.utils import secure_filename
+from compression import AssetCache, compress_response, STATIC_MAX_AGE
 from concurrent.futures import ThreadPoolExecutor
 
-app = Flask(__name__)
+app = Flask(__name__, static_folder=None)  # /static servido pelo ASSETS (comprimido, com ETag)
+ASSETS = AssetCache(os.path.join(app.root_path, 'static'))
+app.jinja_env.globals['asset_url'] = ASSETS.url
+
+@app.after_request
+def _compress_json(response):
+    return compress_response(request, response)
 
 CONFIG_FILE = 'config.json'
 PRINTERS = []
 STATUS_CACHE = {}
 APP_START_TIME = time.time()
 APP_START_TIME = time.time()
-from logger_config import log_info as py_log_info, log_error as py_log_error, log_warn as py_log_warn, log_debug as py_log_debug
+from logger_config import console_logger, add_log_handler, shutdown_logging, log_stats, LOG_ARGS
+from log_store import LogStore, ConsoleLogHandler
 
-LOG_BUFFER = []
 MAX_LOG_SIZE = 500
-LOG_ID_COUNTER = 0
-
-def add_to_console(level, message):
-    global LOG_ID_COUNTER
-    LOG_ID_COUNTER += 1
-    log_entry = {
-        'id': LOG_ID_COUNTER,
-        'time': time.strftime('%H:%M:%S'),
-        'level': level,
-        'message': str(message)
-    }
-    LOG_BUFFER.append(log_entry)
-    if len(LOG_BUFFER) > MAX_LOG_SIZE:
-        LOG_BUFFER.pop(0)
+CONSOLE_LOG = LogStore(MAX_LOG_SIZE, history_file=LOG_ARGS.console_history)
+add_log_handler(ConsoleLogHandler(CONSOLE_LOG))
 
-# Redefine log helpers to also send to console
-def log_info(msg): 
-    py_log_info(msg)
-    add_to_console("INFO", msg)
+# Log helpers do app: stderr (conforme --log-level) e console web, pela fila de log
+def log_info(msg):
+    console_logger.info(msg)
 
-def log_error(msg): 
-    py_log_error(msg)
-    add_to_console("ERROR", msg)
+def log_error(msg):
+    console_logger.error(msg)
 
-def log_warn(msg): 
-    py_log_warn(msg)
-    add_to_console("WARN", msg)
+def log_warn(msg):
+    console_logger.warning(msg)
 
-def log_debug(msg): 
-    py_log_debug(msg)
-    add_to_console("DEBUG", msg)
+def log_debug(msg):
+    console_logger.debug(msg)
 
 def log_cloud(msg):
-    py_log_info(f"[Cloud] {msg}")
-    add_to_console("CLOUD", msg)
+    console_logger.info(f"[Cloud] {msg}", extra={'console_level': 'CLOUD'})
 
 AUTH_FILE = 'auth_token.json'
 
-# Global state for rate calculations
-LAST_PROC_IO = None
-LAST_PROC_TIME = None
 APP_START_TIME = time.time()
-executor = ThreadPoolExecutor(max_workers=20)
+executor = ThreadPoolExecutor(max_workers=20, thread_name_prefix='PrinterUpdate')
 KEEP_RUNNING = True
 PREVIOUS_PRINTER_STATES = {} # Para detecção de conclusão de impressão
 CLOUD_METADATA = {'user_id': None, 'machines': {}, 'last_refresh': 0}
+# Câmera sob demanda: por quanto tempo um GET mantém o stream ligado e com que
+# frequência a nuvem recebe uma imagem de impressoras paradas
+CAMERA_VIEW_TTL = 20
+CAMERA_STREAM_MAX_MISSES = 6    # esperas seguidas sem frame (~10 s cada) antes de encerrar o MJPEG
+CLOUD_IDLE_FRAME_INTERVAL = 300
 
 def load_config():
     if not os.path.exists(CONFIG_FILE):
@@ -118,7 +124,7 @@ def refresh_cloud_metadata(token):
     
     try:
         # Get User ID
-        auth_resp = requests.get(f"{base_url}/auth", headers=headers, timeout=5)
+        auth_resp = cloud_request('GET', f"{base_url}/auth", 'auth', headers=headers, timeout=5)
         if auth_resp.status_code == 200:
             data = auth_resp.json()
             if data.get('success'):
@@ -126,7 +132,7 @@ def refresh_cloud_metadata(token):
                 CLOUD_METADATA['user_id'] = d.get('id') or d.get('user_id') or d.get('email')
         
         # Get Machines list (sync_code -> machine_id)
-        m_resp = requests.get(f"{base_url}/hub/machines", headers=headers, timeout=5)
+        m_resp = cloud_request('GET', f"{base_url}/hub/machines", 'machines', headers=headers, timeout=5)
         if m_resp.status_code == 200:
             m_data = m_resp.json()
             if m_data.get('success'):
@@ -159,6 +165,12 @@ def update_printers_once():
             except: pass
             if pid in STATUS_CACHE:
                 del STATUS_CACHE[pid]
+            FRAME_VARIANTS.forget(pid)
+            TIMELAPSE.finish(pid)
+            COMMANDS.forget_printer(pid)
+            JOBS.forget_printer(pid)
+            POLL_SECONDS.remove(pid, p.type)
+            POLL_ERRORS.remove(pid, p.type)
     PRINTERS[:] = [p for p in PRINTERS if p.config['id'] in config_map]
 
     # Update existing or add new
@@ -169,6 +181,11 @@ def update_printers_once():
             new_p = create_printer_from_config(p_conf)
             if new_p:
                 PRINTERS.append(new_p)
+                # Descoberta/conexão em paralelo, fora do loop de polling
+                try:
+                    executor.submit(new_p.connect)
+                except RuntimeError:
+                    pass
         else:
             for p in PRINTERS:
                 if p.config['id'] == p_conf['id']:
@@ -180,18 +197,74 @@ def update_printers_once():
     id_to_pos = {p['id']: i for i, p in enumerate(current_config)}
     PRINTERS.sort(key=lambda p: id_to_pos.get(p.config['id'], 999))
 
+def on_printer_discovered(entry):
+    """Atualiza o IP de uma impressora cadastrada que reapareceu em outro endereço (DHCP)."""
+    serial = entry['serial'].upper()
+    printer = next((p for p in PRINTERS if p.type == entry['type']
+                    and str(p.config.get('serial', '')).upper() == serial), None)
+    if not printer:
+        return
+    old_host, _, old_port = str(printer.ip or '').partition(':')
+    new_host = entry['ip'].split(':')[0]
+    if old_host == new_host:
+        return
+    # Só troca se o endereço antigo parou de responder (evita oscilar entre Wi-Fi e cabo)
+    if printer.status.get('state') != 'offline':
+        return
+    new_ip = f"{new_host}:{old_port}" if old_port else new_host
+    p_id = printer.config['id']
+    config = load_config()
+    if not config:
+        return
+    for p_cfg in config:
+        if p_cfg['id'] == p_id:
+            p_cfg['ip'] = new_ip
+    save_config(config)
+    log_warn(f"[Discovery] {printer.name} mudou de IP: {printer.ip} -> {new_ip}. Reconectando...")
+    try: printer.stop()
+    except: pass
+    PRINTERS[:] = [pr for pr in PRINTERS if pr.config['id'] != p_id]
+    update_printers_once()
+
+DISCOVERY = DiscoveryService(on_found=on_printer_discovered)
+
+POLL_SECONDS = METRICS.histogram('hub_printer_poll_seconds', 'Duração de update() + get_status() por impressora',
+                                 ('printer', 'type'))
+POLL_ERRORS = METRICS.counter('hub_printer_poll_errors_total', 'Falhas em update() por impressora', ('printer', 'type'))
+CLOUD_REQUEST_SECONDS = METRICS.histogram('hub_cloud_request_seconds', 'Duração das chamadas HTTP à nuvem AditivaFlow',
+                                          ('endpoint', 'status'))
+
 def update_p(p):
+    started = time.perf_counter()
     try:
         if not p.config.get('enabled', True):
             s = p.get_status()
             s['state'] = 'off'
             STATUS_CACHE[p.config['id']] = s
+            TIMELAPSE.observe(p, s)
+            JOBS.observe(p, s)
             return
         p.update()
-        STATUS_CACHE[p.config['id']] = p.get_status()
+        s = p.get_status()
+        STATUS_CACHE[p.config['id']] = s
+        TIMELAPSE.observe(p, s)
+        JOBS.observe(p, s)
+        POLL_SECONDS.labels(p.config['id'], p.type).observe(time.perf_counter() - started)
     except Exception as e:
+        POLL_ERRORS.labels(p.config.get('id'), p.type).inc()
         log_error(f"Update failed for {p.config.get('name')}: {e}")
 
+def cloud_request(method, url, endpoint, **kwargs):
+    """`requests.request` com tempo e status registrados em hub_cloud_request_seconds."""
+    started = time.perf_counter()
+    status = 'error'
+    try:
+        resp = requests.request(method, url, **kwargs)
+        status = f"{resp.status_code // 100}xx"
+        return resp
+    finally:
+        CLOUD_REQUEST_SECONDS.labels(endpoint, status).observe(time.perf_counter() - started)
+
 def polling_loop():
     while KEEP_RUNNING:
         try:
@@ -203,11 +276,11 @@ def polling_loop():
                     executor.submit(update_p, p)
                 except RuntimeError:
                     break
-            time.sleep(2)
+            if supervised_sleep(2): break
         except Exception as e:
             if KEEP_RUNNING:
                 log_error(f"Error in polling loop: {e}")
-            time.sleep(5)
+            if supervised_sleep(5): break
 
 def signal_handler(sig, frame):
     global KEEP_RUNNING
@@ -219,37 +292,76 @@ def signal_handler(sig, frame):
     for p in PRINTERS:
         try: p.stop()
         except: pass
+    SUPERVISOR.shutdown(timeout=3)
+    shutdown_logging()
     print("[System] Finalizado.")
     os._exit(0)
 
 signal.signal(signal.SIGINT, signal_handler)
 
+def _page(template):
+    # As páginas são estáticas (dados chegam por /api): renderiza uma vez por rota
+    if app.debug:
+        return render_template(template)
+    entry = ASSETS.page(request.path, lambda: render_template(template))
+    return entry.response(request, Response)
+
+@app.route('/static/<path:filename>')
+def static_file(filename):
+    entry = ASSETS.file(filename)
+    if entry is None:
+        abort(404)
+    # URLs com ?v=<hash> (asset_url) mudam a cada versão: cache longo no navegador
+    cache_control = f'public, max-age={STATIC_MAX_AGE}, immutable' if request.args.get('v') else 'no-cache'
+    return entry.response(request, Response, cache_control)
+
 @app.route('/')
 def index():
-    return render_template('index.html')
+    return _page('index.html')
 
 @app.route('/monitor')
 def monitor():
-    return render_template('monitor.html')
+    return _page('monitor.html')
 
 @app.route('/console')
 def console_page():
-    return render_template('console.html')
+    return _page('console.html')
 
 @app.route('/auth')
 def auth():
-    return render_template('auth.html')
+    return _page('auth.html')
+
+def _log_filters():
+    # ?level=ERROR,WARN  ?printer=<id>  ?q=texto  ?limit=N
+    args = request.args
+    levels = {l.strip().upper() for l in args.get('level', '').split(',') if l.strip()}
+    sources = None
+    printer_id = args.get('printer')
+    if printer_id:
+        # As mensagens dos drivers começam com [ip] ou [nome]
+        p = next((p for p in PRINTERS if p.config['id'] == printer_id), None)
+        sources = {str(v).lower() for v in (printer_id, p and p.ip, p and p.name) if v}
+    limit = args.get('limit', '')
+    return {'levels': levels or None, 'sources': sources, 'text': args.get('q') or None,
+            'limit': int(limit) if limit.isdigit() else None}
 
 @app.route('/api/logs')
 def get_logs():
     try:
         raw_id = request.args.get('last_id', '0')
         last_id = int(raw_id) if raw_id and raw_id.isdigit() else 0
-        new_logs = [log for log in LOG_BUFFER if log['id'] > last_id]
-        return jsonify(new_logs)
+        return jsonify(CONSOLE_LOG.since(last_id, **_log_filters()))
     except:
         return jsonify([])
 
+@app.route('/api/logs/history')
+def get_logs_history():
+    # Linhas antigas do arquivo de histórico (--console-history), antes de ?before=<timestamp>
+    before = request.args.get('before', type=float)
+    filters = _log_filters()
+    filters['limit'] = filters['limit'] or 200
+    return jsonify(CONSOLE_LOG.history(before, **filters))
+
 @app.route('/api/auth/profile', methods=['GET'])
 def get_profile():
     token = load_token()
@@ -274,68 +386,10 @@ def get_profile():
 
 @app.route('/api/system_stats')
 def system_stats():
-    global LAST_PROC_IO, LAST_PROC_TIME
-    
-    # Process specific stats
-    process = psutil.Process(os.getpid())
-    
-    # App CPU & Memory
-    app_cpu = process.cpu_percent(interval=None) / psutil.cpu_count()
-    mem_info = process.memory_info()
-    app_mem_bytes = mem_info.rss
-    
-    # App I/O Rate Calculation (Proxy for Net/Disk Activity)
-    read_speed = 0
-    write_speed = 0
-    total_io_bytes = 0
-    try:
-        current_io = process.io_counters()
-        current_time = time.time()
-        
-        # Total Accumulated
-        total_io_bytes = current_io.read_bytes + current_io.write_bytes
-        
-        if LAST_PROC_IO and LAST_PROC_TIME:
-            duration = current_time - LAST_PROC_TIME
-            if duration > 0:
-                read_speed = (current_io.read_bytes - LAST_PROC_IO.read_bytes) / duration
-                write_speed = (current_io.write_bytes - LAST_PROC_IO.write_bytes) / duration
-        
-        LAST_PROC_IO = current_io
-        LAST_PROC_TIME = current_time
-    except Exception as e:
-        # io_counters might not be available on all platforms
-        pass
-
-    # System metrics
-    sys_cpu = psutil.cpu_percent(interval=None)
-    sys_mem = psutil.virtual_memory()
-    disk = psutil.disk_usage('/')
-    net = psutil.net_io_counters()
-
-    return jsonify({
-        'app': {
-            'cpu': round(app_cpu, 2),
-            'memory_bytes': app_mem_bytes,
-            'memory_percent': round(process.memory_percent(), 2),
-            'io_read_speed': round(read_speed, 2),
-            'io_write_speed': round(write_speed, 2),
-            'io_read_bytes': current_io.read_bytes,
-            'io_write_bytes': current_io.write_bytes,
-            'uptime_seconds': int(time.time() - APP_START_TIME)
-        },
-        'system': {
-            'cpu': sys_cpu,
-            'memory_percent': sys_mem.percent,
-            'memory_used_bytes': sys_mem.used,
-            'memory_total_bytes': sys_mem.total,
-            'disk_percent': disk.percent,
-            'disk_used_bytes': disk.used,
-            'disk_total_bytes': disk.total,
-            'net_sent_bytes': net.bytes_sent,
-            'net_recv_bytes': net.bytes_recv
-        }
-    })
+    # Valores amostrados em segundo plano; ?since=<ts> ou ?history=N incluem o histórico
+    since = request.args.get('since', type=float)
+    history = request.args.get('history', type=int)
+    return jsonify(SYSTEM_STATS.snapshot(since=since, history=history))
 
 @app.route('/api/save_token', methods=['POST'])
 def save_token_api():
@@ -363,24 +417,81 @@ def get_printers():
             ordered_status.append(p.get_status())
     return jsonify(ordered_status)
 
+def _frame_size_arg():
+    # ?size=thumb|medium|full (padrão: full)
+    size = request.args.get('size', 'full')
+    return size if size in FRAME_SIZES else None
+
 @app.route('/api/camera/<printer_id>', methods=['GET'])
 def get_camera_frame(printer_id):
+    size = _frame_size_arg()
+    if size is None:
+        return jsonify({'error': f"Invalid size, use one of: {', '.join(FRAME_SIZES)}"}), 400
     printer = next((p for p in PRINTERS if p.config['id'] == printer_id), None)
     if printer:
+        # Cada visualização renova o lease do dashboard; sem visualizações o stream desliga
+        printer.acquire_camera(f"ui:{request.remote_addr}", ttl=CAMERA_VIEW_TTL)
         # Check for cached frame (Bambu)
-        if hasattr(printer, 'last_frame') and printer.last_frame:
-            from flask import Response
-            return Response(printer.last_frame, mimetype='image/jpeg')
-        
+        frame = getattr(printer, 'last_frame', None)
+
         # Check for on-demand snapshot (Moonraker)
-        if hasattr(printer, 'get_snapshot'):
+        if not frame and hasattr(printer, 'get_snapshot'):
             frame = printer.get_snapshot()
-            if frame:
-                from flask import Response
-                return Response(frame, mimetype='image/jpeg')
-                
+
+        if frame:
+            return Response(FRAME_VARIANTS.get(printer_id, frame, size), mimetype='image/jpeg')
+
     return jsonify({'error': 'No frame available'}), 404
 
+@app.route('/api/camera/<printer_id>/stream', methods=['GET'])
+def get_camera_stream(printer_id):
+    size = _frame_size_arg()
+    if size is None:
+        return jsonify({'error': f"Invalid size, use one of: {', '.join(FRAME_SIZES)}"}), 400
+    printer = next((p for p in PRINTERS if p.config['id'] == printer_id), None)
+    if not printer:
+        return jsonify({'error': 'Printer not found'}), 404
+    if not printer.has_camera():
+        return jsonify({'error': 'No camera source'}), 404
+    consumer = f"mjpeg:{uuid.uuid4().hex[:8]}"
+
+    def generate():
+        seq = -1
+        misses = 0
+        try:
+            while KEEP_RUNNING:
+                printer.acquire_camera(consumer, ttl=30)
+                frame, seq = printer.wait_frame(seq, timeout=10)
+                if frame is None:
+                    misses += 1
+                    if misses >= CAMERA_STREAM_MAX_MISSES:
+                        return
+                    # Escreve algo no socket: é assim que a desconexão do cliente aparece
+                    yield b'\r\n'
+                    continue
+                misses = 0
+                frame = FRAME_VARIANTS.get(printer_id, frame, size)
+                yield (b'--frame\r\nContent-Type: image/jpeg\r\nContent-Length: ' +
+                       str(len(frame)).encode() + b'\r\n\r\n' + frame + b'\r\n')
+        finally:
+            # Cliente desconectou: libera o lease (o stream desliga após o período de graça)
+            printer.release_camera(consumer)
+
+    return Response(generate(), mimetype='multipart/x-mixed-replace; boundary=frame',
+                    headers={'Cache-Control': 'no-cache'})
+
+@app.route('/api/timelapses', methods=['GET'])
+@app.route('/api/timelapses/<printer_id>', methods=['GET'])
+def list_timelapses(printer_id=None):
+    return jsonify(TIMELAPSE.list(printer_id))
+
+@app.route('/api/timelapses/<printer_id>/<name>', methods=['GET'])
+def download_timelapse(printer_id, name):
+    path = TIMELAPSE.path_for(printer_id, name)
+    if not path:
+        return jsonify({'error': 'Timelapse not found'}), 404
+    return send_file(os.path.abspath(path), mimetype='video/x-msvideo', as_attachment=True, download_name=name)
+
 @app.route('/api/raw_status/<printer_id>', methods=['GET'])
 def raw_status(printer_id):
     printer = next((p for p in PRINTERS if p.config['id'] == printer_id), None)
@@ -392,6 +503,73 @@ def raw_status(printer_id):
         })
     return jsonify({'error': 'Printer not found'}), 404
 
+@app.route('/api/discovery', methods=['GET'])
+def get_discovery():
+    if request.args.get('refresh'):
+        DISCOVERY.refresh()
+    by_serial = {str(p.config.get('serial', '')).upper(): p for p in PRINTERS if p.config.get('serial')}
+    result = []
+    for entry in DISCOVERY.snapshot():
+        p = by_serial.get(entry['serial'].upper())
+        entry['configured'] = p is not None
+        entry['printer_id'] = p.config['id'] if p else None
+        entry['configured_ip'] = p.ip if p else None
+        result.append(entry)
+    return jsonify(result)
+
+# Gauges lidos só na coleta
+METRICS.gauge('hub_printers', 'Impressoras configuradas', callback=lambda: len(PRINTERS))
+METRICS.gauge('hub_mqtt_connected_clients', 'Clientes MQTT conectados', callback=lambda: MQTT_REACTOR.stats()['connected'])
+METRICS.gauge('hub_camera_streaming_sessions', 'Câmeras em streaming', callback=lambda: CAMERA_REACTOR.stats()['streaming'])
+METRICS.gauge('hub_log_queue_depth', 'Linhas aguardando na fila de log', callback=lambda: log_stats().get('queued', 0))
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(METRICS.render(), mimetype=None, content_type=METRICS_CONTENT_TYPE)
+
+@app.route('/api/debug/profile', methods=['GET'])
+def debug_profile():
+    # Perfil por amostragem, só com --enable-profiler:
+    # ?seconds=N (máx. 60)  ?hz=100  ?format=json|collapsed  ?active=1 (só threads que usaram CPU)
+    if not LOG_ARGS.enable_profiler:
+        return jsonify({'error': 'Profiler disabled, start the hub with --enable-profiler'}), 403
+    seconds = request.args.get('seconds', 10, type=float)
+    hz = max(1, min(request.args.get('hz', 100, type=int), 1000))
+    try:
+        stacks, threads, elapsed = profiler.sample(seconds, 1.0 / hz)
+    except profiler.ProfilerBusy:
+        return jsonify({'error': 'Another profile is already running'}), 409
+    only = None
+    if request.args.get('active') == '1':
+        only = {t['name'] for t in threads if t.get('cpu_percent', 1) >= 1.0}
+    if request.args.get('format') == 'collapsed':
+        return Response(profiler.collapsed(stacks, only), mimetype='text/plain',
+                        headers={'Content-Disposition': f'attachment; filename=hub-profile-{int(time.time())}.folded'})
+    return jsonify({
+        'duration': round(elapsed, 3),
+        'interval': 1.0 / hz,
+        'samples': sum(stacks.values()),
+        'threads': threads,
+        'top_stacks': [{'stack': s, 'samples': c} for s, c in stacks.most_common(50)
+                       if only is None or s.split(';', 1)[0] in only][:20],
+        'collapsed': profiler.collapsed(stacks, only),
+    })
+
+@app.route('/api/threads', methods=['GET'])
+def get_threads():
+    snapshot = SUPERVISOR.snapshot()
+    snapshot['mqtt'] = MQTT_REACTOR.stats()
+    snapshot['camera'] = CAMERA_REACTOR.stats()
+    snapshot['frame_variants'] = FRAME_VARIANTS.stats()
+    snapshot['logging'] = log_stats()
+    return jsonify(snapshot)
+
+def _parse_tags(value):
+    # Lista ou texto separado por vírgulas ("sala-a, resina")
+    if isinstance(value, str):
+        value = value.split(',')
+    return [str(t).strip() for t in (value or []) if str(t).strip()]
+
 @app.route('/api/add_printer', methods=['POST'])
 def add_printer():
     data = request.json
@@ -408,12 +586,17 @@ def add_printer():
         'camera_url': data.get('camera_url', ''),
         'custom_camera': data.get('custom_camera', False),
         'camera_refresh': data.get('camera_refresh', False),
+        'timelapse': data.get('timelapse', False),
         'refresh_interval': int(data.get('refresh_interval', 5000)),
         'platform_token': data.get('platform_token', ''),
+        'tags': _parse_tags(data.get('tags')),
+        'job_queue': data.get('job_queue', False),
+        'filament': _parse_tags(data.get('filament')),
         'enabled': True
     }
     if new_printer['type'] == 'elegoo':
         new_printer['port'] = 3000
+        new_printer['elegoo_mode'] = data.get('elegoo_mode', 'auto')
     config.append(new_printer)
     save_config(config)
     return jsonify({"success": True, "id": new_id})
@@ -432,12 +615,19 @@ def update_printer():
             p['camera_url'] = data.get('camera_url', p.get('camera_url', ''))
             p['custom_camera'] = data.get('custom_camera', p.get('custom_camera', False))
             p['camera_refresh'] = data.get('camera_refresh', p.get('camera_refresh', False))
+            p['timelapse'] = data.get('timelapse', p.get('timelapse', False))
             p['refresh_interval'] = int(data.get('refresh_interval', p.get('refresh_interval', 5000)))
             p['access_code'] = data.get('access_code', p.get('access_code', ''))
             p['platform_token'] = data.get('platform_token', p.get('platform_token', ''))
+            if 'tags' in data:
+                p['tags'] = _parse_tags(data['tags'])
+            p['job_queue'] = data.get('job_queue', p.get('job_queue', False))
+            if 'filament' in data:
+                p['filament'] = _parse_tags(data['filament'])
             p['total_usage'] = float(data.get('total_usage', p.get('total_usage', 0.0)))
             if p['type'] == 'elegoo':
                 p['port'] = 3000
+                p['elegoo_mode'] = data.get('elegoo_mode', p.get('elegoo_mode', 'auto'))
             else:
                 p['port'] = int(data.get('port', p.get('port', 80)))
             break
@@ -472,8 +662,8 @@ def toggle_printer():
                 pr.stop()
             else:
                 log_info(f"[System] Reativando impressora {pr.name}...")
-                try: pr.connect()
-                except: pass
+                try: executor.submit(pr.connect)
+                except RuntimeError: pass
             
             # Update cache immediately for frontend responsiveness
             STATUS_CACHE[p_id] = pr.get_status()
@@ -487,8 +677,8 @@ def send_gcode():
     gcode = data.get('gcode', '')
     printer = next((p for p in PRINTERS if p.config['id'] == p_id), None)
     if printer and gcode:
-        printer.send_command('gcode', gcode=gcode)
-        return jsonify({"success": True})
+        cmd = COMMANDS.submit(printer, 'gcode', {'gcode': gcode}, source='gcode')
+        return jsonify({"success": True, "command_id": cmd['id'], "state": cmd['state']}), 202
     return jsonify({"success": False, "error": "Printer not found or empty gcode"}), 404
 
 @app.route('/api/delete_printer', methods=['POST'])
@@ -543,10 +733,241 @@ def control_printer():
             kwargs['val'] = val
         
         log_info(f"Command '{command}' sent to {printer.name}")
-        printer.send_command(command, **kwargs)
-        return jsonify({"success": True})
+        # Não espera a impressora: o estado fica em /api/commands/<id>
+        cmd = COMMANDS.submit(printer, command, kwargs)
+        return jsonify({"success": True, "command_id": cmd['id'], "state": cmd['state']}), 202
     return jsonify({"success": False, "error": "Printer not found"}), 404
 
+def _as_set(value):
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = value.split(',')
+    return {str(v).strip().lower() for v in value if str(v).strip()}
+
+# Bambu reporta 'running' (gcode_state); para o seletor é o mesmo que 'printing'
+_STATE_ALIASES = {'running': 'printing'}
+
+def _select_printers(selector):
+    """Impressoras habilitadas que batem com todos os seletores informados.
+
+    `ids`, `type`, `state` e `tag` aceitam um valor ou uma lista (qualquer um
+    da lista vale). Sem nenhum seletor, só `all: true` seleciona a frota toda.
+    Retorna None se nenhum seletor foi informado.
+    """
+    ids = _as_set(selector.get('ids'))
+    types = _as_set(selector.get('type'))
+    states = _as_set(selector.get('state'))
+    if states:
+        states = {_STATE_ALIASES.get(s, s) for s in states}
+    tags = _as_set(selector.get('tag'))
+    if not (ids or types or states or tags or selector.get('all') is True):
+        return None
+    selected = []
+    for p in list(PRINTERS):
+        if not p.config.get('enabled', True):
+            continue
+        if ids and str(p.config['id']).lower() not in ids:
+            continue
+        if types and p.type not in types:
+            continue
+        if states:
+            state = str(p.status.get('state', '')).lower()
+            if _STATE_ALIASES.get(state, state) not in states:
+                continue
+        if tags and not tags & {t.lower() for t in p.config.get('tags', [])}:
+            continue
+        selected.append(p)
+    return selected
+
+@app.route('/api/control/bulk', methods=['POST'])
+def control_bulk():
+    """Mesmo comando para várias impressoras de uma vez, em paralelo.
+
+    Corpo: {"command": "stop", "val": ..., "ids": [...], "type": "bambu",
+    "state": "printing", "tag": "sala-a"} (ou "all": true). Responde em NDJSON:
+    uma linha com as impressoras selecionadas, uma por impressora à medida que
+    cada uma confirma (ou falha) e um resumo no fim. `?stream=0` devolve tudo
+    num único JSON depois que todas terminarem.
+    """
+    data = request.json or {}
+    command = data.get('command')
+    if not command:
+        return jsonify({"success": False, "error": "command is required"}), 400
+    selected = _select_printers(data)
+    if selected is None:
+        return jsonify({"success": False, "error": "Informe ids, type, state, tag ou all=true"}), 400
+    val = data.get('val')
+    kwargs = val if isinstance(val, dict) else ({} if val is None else {'val': val})
+
+    results = queue.Queue()
+    names = {p.config['id']: p.name for p in selected}
+    records = [COMMANDS.submit(p, command, kwargs, source='bulk', on_done=results.put) for p in selected]
+    log_info(f"Comando '{command}' enviado em massa para {len(records)} impressoras")
+
+    def outcomes():
+        yield {'matched': len(records),
+               'commands': [{'id': r['id'], 'printer_id': r['printer_id'], 'name': names.get(r['printer_id'])}
+                            for r in records]}
+        pending = {r['id'] for r in records}
+        summary = {}
+        deadline = time.monotonic() + COMMANDS.ack_timeout + 5
+        while pending:
+            try:
+                rec = results.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                break
+            if rec['id'] not in pending:
+                continue
+            pending.discard(rec['id'])
+            summary[rec['state']] = summary.get(rec['state'], 0) + 1
+            yield dict(rec, name=names.get(rec['printer_id']))
+        for cmd_id in pending:
+            # Ainda sem resposta no prazo: estado atual (segue em /api/commands/<id>)
+            rec = COMMANDS.get(cmd_id)
+            if rec:
+                summary[rec['state']] = summary.get(rec['state'], 0) + 1
+                yield dict(rec, name=names.get(rec['printer_id']))
+        yield {'done': True, 'summary': summary}
+
+    if request.args.get('stream') == '0':
+        items = list(outcomes())
+        return jsonify({'success': True, 'matched': items[0]['matched'],
+                        'results': items[1:-1], 'summary': items[-1]['summary']})
+    return Response((json.dumps(item) + '\n' for item in outcomes()), mimetype='application/x-ndjson',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/api/commands', methods=['GET'])
+def list_commands():
+    limit = request.args.get('limit', 50, type=int)
+    return jsonify(COMMANDS.list(request.args.get('printer'), limit=max(1, min(limit, 500))))
+
+@app.route('/api/commands/<command_id>', methods=['GET'])
+def get_command(command_id):
+    # ?wait=N: segura a resposta até N s (máx. 60) esperando a confirmação
+    cmd = COMMANDS.get(command_id, wait=request.args.get('wait', 0, type=float))
+    if cmd is None:
+        return jsonify({'error': 'Command not found'}), 404
+    return jsonify(cmd)
+
+@app.route('/api/files/upload', methods=['POST'])
+def upload_file():
+    """Envia um arquivo de impressão para uma ou mais impressoras.
+
+    multipart/form-data com o campo `file`, ou o corpo cru com `?filename=`.
+    Destinos pelos mesmos seletores do bulk (`ids`, `type`, `state`, `tag`,
+    `all`, em campos do form ou na query); `start=1` inicia a impressão ao terminar e
+    `plate`/`use_ams`/`timelapse` são repassados ao início (Bambu .3mf).
+    Responde 202 na hora; o progresso fica em /api/files/uploads/<id>.
+    """
+    args = request.values
+    selected = _select_printers({'ids': args.get('ids'), 'type': args.get('type'),
+                                 'state': args.get('state'), 'tag': args.get('tag'),
+                                 'all': args.get('all', '').lower() in ('1', 'true')})
+    if not selected:
+        return jsonify({"success": False, "error": "Nenhuma impressora selecionada"}), 400
+    filename, source = _upload_source(args)
+    if not filename:
+        return jsonify({"success": False, "error": "filename is required"}), 400
+    start = args.get('start', '').lower() in ('1', 'true', 'on')
+    job = UPLOADS.submit(source, filename, selected, start_print=start, options=_start_options(args))
+    return jsonify(dict(job, success=True)), 202
+
+@app.route('/api/files/uploads', methods=['GET'])
+def list_uploads():
+    return jsonify(UPLOADS.list(limit=request.args.get('limit', 20, type=int)))
+
+@app.route('/api/files/uploads/<job_id>', methods=['GET'])
+def get_upload(job_id):
+    job = UPLOADS.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Upload not found'}), 404
+    return jsonify(job)
+
+def _upload_source(args):
+    # multipart (campo `file`) ou corpo cru com `?filename=`
+    upload = request.files.get('file')
+    if upload is not None:
+        filename, source = upload.filename, upload.stream
+    else:
+        filename, source = args.get('filename', ''), request.stream
+    return secure_filename(filename or ''), source
+
+def _start_options(args):
+    options = {}
+    if args.get('plate'):
+        options['plate'] = args.get('plate', type=int)
+    for flag in ('use_ams', 'timelapse', 'bed_leveling'):
+        if flag in args:
+            options[flag] = args.get(flag).lower() in ('1', 'true', 'on')
+    return options
+
+@app.route('/api/jobs', methods=['POST'])
+def create_job():
+    """Coloca um arquivo na fila de impressão da fazenda.
+
+    Mesmo formato de /api/files/upload. Exigências opcionais: `printer_type`,
+    `tag` e `filament` (tipo carregado no AMS ou `filament` do config);
+    `priority` maior sai antes. O job vai para a primeira impressora livre com
+    `job_queue` ativado que atenda às exigências.
+    """
+    args = request.values
+    filename, source = _upload_source(args)
+    if not filename:
+        return jsonify({"success": False, "error": "filename is required"}), 400
+    try:
+        priority = int(args.get('priority', 0))
+    except ValueError:
+        return jsonify({"success": False, "error": "priority must be an integer"}), 400
+    printer_type = (args.get('printer_type') or '').lower() or None
+    if printer_type and not getattr(PRINTER_CLASSES.get(printer_type), 'supports_upload', False):
+        types = ', '.join(t for t, cls in PRINTER_CLASSES.items() if cls.supports_upload)
+        return jsonify({"success": False, "error": f"printer_type must be one of: {types}"}), 400
+    job = JOBS.submit(source, filename, printer_type=printer_type, tag=args.get('tag'),
+                      filament=args.get('filament'), priority=priority, options=_start_options(args))
+    return jsonify(dict(job, success=True)), 201
+
+@app.route('/api/jobs', methods=['GET'])
+def list_jobs():
+    states = _as_set(request.args.get('state'))
+    return jsonify(JOBS.list(states))
+
+@app.route('/api/jobs/printers', methods=['GET'])
+def job_printers():
+    return jsonify(JOBS.printers())
+
+@app.route('/api/jobs/printers/<printer_id>/ready', methods=['POST'])
+def job_printer_ready(printer_id):
+    # Mesa liberada depois do último job
+    JOBS.mark_ready(printer_id)
+    return jsonify({"success": True})
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    job = JOBS.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job)
+
+@app.route('/api/jobs/<job_id>', methods=['PATCH'])
+def update_job(job_id):
+    data = request.json or {}
+    try:
+        priority = int(data['priority']) if data.get('priority') is not None else None
+    except ValueError:
+        return jsonify({"success": False, "error": "priority must be an integer"}), 400
+    job, error = JOBS.update(job_id, priority=priority, requeue=data.get('state') == 'queued')
+    if job is None:
+        return jsonify({"success": False, "error": error}), 404 if error == 'Job not found' else 409
+    return jsonify(dict(job, success=True))
+
+@app.route('/api/jobs/<job_id>', methods=['DELETE'])
+def delete_job(job_id):
+    error = JOBS.cancel(job_id)
+    if error:
+        return jsonify({"success": False, "error": error}), 404 if error == 'Job not found' else 409
+    return jsonify({"success": True})
+
 @app.route('/api/auth/verify', methods=['GET'])
 def verify_auth():
     token = load_token()
@@ -564,6 +985,22 @@ def verify_auth():
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)})
 
+def _confirm_cloud_command(base_url, headers, cmd_id, success, msg):
+    # Confirmar via PATCH (especificação) ou POST (fallback) enviando no corpo
+    conf_payload = {
+        "success": success,
+        "status": "completed" if success else "failed",
+        "confirmed_at": datetime.now().isoformat(),
+        "confirmation_message": msg or "Comando executado com sucesso"
+    }
+    try:
+        cloud_request('PATCH', f"{base_url}/hub/command-confirm/{cmd_id}", 'command_confirm', headers=headers, json=conf_payload, timeout=5)
+    except:
+        try:
+            cloud_request('POST', f"{base_url}/hub/command-confirm/{cmd_id}", 'command_confirm', headers=headers, json=conf_payload, timeout=5)
+        except Exception as e:
+            log_error(f"[Cloud] Falha ao confirmar comando {cmd_id}: {e}")
+
 def aditivaflow_sync_loop():
     log_info("[Cloud] Iniciando loop de sincronização AditivaFlow...")
     base_url = "https://iwsqfjngeicyrcdowdbi.supabase.co/functions/v1/device-api"
@@ -571,7 +1008,7 @@ def aditivaflow_sync_loop():
     while KEEP_RUNNING:
         token = load_token()
         if not token:
-            time.sleep(10)
+            if supervised_sleep(10): break
             continue
             
         headers = {
@@ -688,7 +1125,7 @@ def aditivaflow_sync_loop():
                             ]
                         }
                         # Enviar para o endpoint de API geral com a action solicitada
-                        requests.post(base_url, headers=headers, json=history_payload, timeout=10)
+                        cloud_request('POST', base_url, 'history', headers=headers, json=history_payload, timeout=10)
                         log_cloud(f"Histórico de {p.name} sincronizado com sucesso.")
                         prev_data['started_at'] = None # Reset
                     except Exception as e:
@@ -699,14 +1136,25 @@ def aditivaflow_sync_loop():
                 # 1. Câmera Handling (Bucket Upload)
                 frame = None
                 img_info = ""
-                if hasattr(p, 'last_frame') and p.last_frame:
-                    frame = p.last_frame
-                    img_info = " [Stream]"
+                # Em impressão a nuvem mantém a câmera ligada; parada, pede um frame a cada CLOUD_IDLE_FRAME_INTERVAL
+                now_mono = time.monotonic()
+                if user_id and machine_id and (is_printing_now or curr_state == 'paused' or
+                        now_mono - getattr(p, '_cloud_frame_at', 0) >= CLOUD_IDLE_FRAME_INTERVAL):
+                    p.acquire_camera('cloud', ttl=30)
+                if hasattr(p, 'frame_seq'):
+                    # Só envia frames novos: câmera desligada não reenvia a mesma imagem
+                    if p.last_frame and p.frame_seq != getattr(p, '_cloud_frame_seq', None):
+                        frame = p.last_frame
+                        p._cloud_frame_seq = p.frame_seq
+                        p._cloud_frame_at = now_mono
+                        img_info = " [Stream]"
                 elif hasattr(p, 'get_snapshot'):
                     frame = p.get_snapshot()
                     img_info = " [Snapshot]"
                 
                 if frame and user_id and machine_id:
+                    # A nuvem só mostra prévia: envia a variante média
+                    frame = FRAME_VARIANTS.get(p.config['id'], frame, 'medium')
                     try:
                         storage_url = "https://iwsqfjngeicyrcdowdbi.supabase.co/storage/v1/object/machine-media"
                         cam_path = f"camera/{user_id}/{machine_id}/latest.jpg"
@@ -715,7 +1163,7 @@ def aditivaflow_sync_loop():
                             'x-device-token': token,
                             'Content-Type': 'image/jpeg'
                         }
-                        requests.put(f"{storage_url}/{cam_path}", headers=storage_headers, data=frame, timeout=8)
+                        cloud_request('PUT', f"{storage_url}/{cam_path}", 'camera_upload', headers=storage_headers, data=frame, timeout=8)
                         img_info += f" {len(frame)/1024:.1f}KB (Bucket)"
                     except Exception as e:
                         log_error(f"Erro upload câmera {p.name}: {e}")
@@ -729,7 +1177,7 @@ def aditivaflow_sync_loop():
                     elif p.type == 'moonraker' and str(cover).startswith('http'):
                         if not hasattr(p, '_last_thumb_url') or p._last_thumb_url != cover:
                             try:
-                                t_resp = requests.get(cover, timeout=5)
+                                t_resp = cloud_request('GET', cover, 'thumbnail', timeout=5)
                                 if t_resp.status_code == 200:
                                     p._last_thumb_url = cover
                                     p._last_thumb_b64 = base64.b64encode(t_resp.content).decode('utf-8')
@@ -749,17 +1197,17 @@ def aditivaflow_sync_loop():
                 
                 # Tentar PATCH (preferencial) ou POST (fallback)
                 try:
-                    sync_resp = requests.patch(f"{base_url}/hub/sync", headers=headers, json=payload, timeout=12)
+                    sync_resp = cloud_request('PATCH', f"{base_url}/hub/sync", 'sync', headers=headers, json=payload, timeout=12)
                     if sync_resp.status_code in [404, 405]:
                         # Se PATCH não existir, tenta POST
-                        sync_resp = requests.post(f"{base_url}/hub/sync", headers=headers, json=payload, timeout=12)
+                        sync_resp = cloud_request('POST', f"{base_url}/hub/sync", 'sync', headers=headers, json=payload, timeout=12)
                 except:
-                    sync_resp = requests.post(f"{base_url}/hub/sync", headers=headers, json=payload, timeout=12)
+                    sync_resp = cloud_request('POST', f"{base_url}/hub/sync", 'sync', headers=headers, json=payload, timeout=12)
 
                 if sync_resp.status_code == 200:
                     # Polling de comandos pendentes
                     if machine_id:
-                        cmd_resp = requests.get(f"{base_url}/hub/commands?machine_id={machine_id}&status=pending", headers=headers, timeout=5)
+                        cmd_resp = cloud_request('GET', f"{base_url}/hub/commands?machine_id={machine_id}&status=pending", 'commands', headers=headers, timeout=5)
                         if cmd_resp.status_code == 200:
                             commands = cmd_resp.json().get('data', [])
                             for cmd_obj in commands:
@@ -767,46 +1215,28 @@ def aditivaflow_sync_loop():
                                 cmd_name = cmd_obj.get('command')
                                 log_cloud(f"Comando recebido para {p.name}: {cmd_name}")
                                 
-                                # Executar
-                                success = False
-                                msg = ""
-                                try:
-                                    if cmd_name in ['pause', 'resume', 'stop']:
-                                        p.send_command(cmd_name)
-                                        success = True
-                                    elif cmd_name == 'led_on':
-                                        p.send_command('led', val=100)
-                                        success = True
-                                    elif cmd_name == 'led_off':
-                                        p.send_command('led', val=0)
-                                        success = True
-                                    else:
-                                        msg = f"Comando desconhecido: {cmd_name}"
-                                except Exception as e:
-                                    msg = str(e)
-                                
-                                # Confirmar via PATCH (especificação) ou POST (fallback) enviando no corpo
-                                conf_payload = {
-                                    "success": success,
-                                    "status": "completed" if success else "failed",
-                                    "confirmed_at": datetime.now().isoformat(),
-                                    "confirmation_message": msg or "Comando executado com sucesso"
-                                }
-                                try:
-                                    requests.patch(f"{base_url}/hub/command-confirm/{cmd_id}", headers=headers, json=conf_payload, timeout=5)
-                                except:
-                                    requests.post(f"{base_url}/hub/command-confirm/{cmd_id}", headers=headers, json=conf_payload, timeout=5)
+                                # Executar pela fila: a confirmação vai para a nuvem quando a impressora responder
+                                cloud_cmd = {'pause': ('pause', {}), 'resume': ('resume', {}), 'stop': ('stop', {}),
+                                             'led_on': ('led', {'val': 100}), 'led_off': ('led', {'val': 0})}.get(cmd_name)
+                                if cloud_cmd is None:
+                                    executor.submit(_confirm_cloud_command, base_url, headers, cmd_id,
+                                                    False, f"Comando desconhecido: {cmd_name}")
+                                    continue
+                                COMMANDS.submit(p, cloud_cmd[0], cloud_cmd[1], source='cloud', key=f"cloud:{cmd_id}",
+                                                on_done=lambda rec, cmd_id=cmd_id: executor.submit(
+                                                    _confirm_cloud_command, base_url, headers, cmd_id,
+                                                    rec['state'] == 'done', rec['error'] or ''))
                 else:
                     log_warn(f"Erro Cloud ({p.name}): Status {sync_resp.status_code} - {sync_resp.text[:120]}")
                 
             except Exception as e:
                 log_error(f"[Cloud] Erro ao sincronizar {p.config.get('name')}: {e}")
         
-        time.sleep(5) # Intervalo entre ciclos de sync
+        if supervised_sleep(5): break # Intervalo entre ciclos de sync
 
 def save_usage_periodically():
     while KEEP_RUNNING:
-        time.sleep(300) # Save every 5 minutes
+        if supervised_sleep(300): break # Save every 5 minutes
         config = load_config()
         if not config: continue
         changed = False
@@ -821,18 +1251,87 @@ def save_usage_periodically():
             save_config(config)
             log_info(f"[System] Horas de uso persistidas no config.json")
 
+_BACKGROUND_STARTED = False
+
 def start_background_tasks():
-    global KEEP_RUNNING
+    global KEEP_RUNNING, _BACKGROUND_STARTED
+    if _BACKGROUND_STARTED and KEEP_RUNNING:
+        return  # já rodando (create_app + hub_gui, ou chamado duas vezes)
+    _BACKGROUND_STARTED = True
     KEEP_RUNNING = True
     log_info("[System] Iniciando serviços de background...")
+    JOBS.load()
     update_printers_once()
-    threading.Thread(target=save_usage_periodically, daemon=True, name="UsageSaver").start()
-    threading.Thread(target=polling_loop, daemon=True, name="PollingLoop").start()
-    threading.Thread(target=aditivaflow_sync_loop, daemon=True, name="CloudSync").start()
+    SUPERVISOR.spawn("UsageSaver", save_usage_periodically, restart='on_failure')
+    SUPERVISOR.spawn("PollingLoop", polling_loop, restart='on_failure')
+    SUPERVISOR.spawn("CloudSync", aditivaflow_sync_loop, restart='on_failure')
+    DISCOVERY.start()
+    SYSTEM_STATS.start()
 
-if __name__ == '__main__':
-    # Flask reloader will run this twice. We only want to start threads in the child process.
-    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+def create_app(start_tasks=True):
+    """App WSGI para servidores de produção (waitress, gunicorn --threads).
+
+    As tarefas de fundo sobem uma única vez por processo, aqui, e não no
+    import: rode um único processo (vários workers duplicariam o polling e o
+    sync com a nuvem). Ex.: `waitress-serve --threads=32 --call app:create_app`.
+    """
+    if start_tasks:
         start_background_tasks()
-    
-    app.run(host='0.0.0.0', port=5000, debug=True, use_reloader=True, use_debugger=False)
+    return app
+
+class _WaitressServer:
+    # Mesma interface do servidor do Werkzeug (serve_forever/shutdown), usada pelo hub_gui
+    def __init__(self, wsgi_app, host, port, threads, keepalive):
+        from waitress.server import create_server
+        self._server = create_server(wsgi_app, host=host, port=port, threads=threads,
+                                     channel_timeout=keepalive, connection_limit=max(100, threads * 4),
+                                     ident='AditivaFlow Hub')
+
+    def serve_forever(self):
+        self._server.run()
+
+    def shutdown(self):
+        self._server.close()
+        self._server.task_dispatcher.shutdown(timeout=1)
+
+def make_server(host='0.0.0.0', port=5000, threads=32, keepalive=120):
+    """Servidor HTTP de produção: waitress (pool de `threads`, keep-alive) se
+    instalado; senão o servidor do Werkzeug com uma thread por conexão."""
+    try:
+        server = _WaitressServer(app, host, port, threads, keepalive)
+        log_info(f"[System] Servidor waitress em http://{host}:{port} ({threads} threads)")
+        return server
+    except ImportError:
+        from werkzeug.serving import make_server as werkzeug_server, WSGIRequestHandler
+        WSGIRequestHandler.protocol_version = 'HTTP/1.1'  # keep-alive
+        log_warn("[System] waitress não instalado: usando o servidor do Werkzeug (thread por conexão)")
+        return werkzeug_server(host, port, app, threaded=True)
+
+def parse_server_args(argv=None):
+    # Só as opções do servidor; as de log (--log-level etc.) ficam com o logger_config
+    parser = argparse.ArgumentParser(description="3D Printer Connection Hub")
+    parser.add_argument('--host', default='0.0.0.0', help="Endereço de escuta do servidor HTTP")
+    parser.add_argument('--port', type=int, default=5000, help="Porta do servidor HTTP")
+    parser.add_argument('--threads', type=int, default=32,
+                        help="Threads do servidor HTTP (cada stream MJPEG aberto ocupa uma)")
+    parser.add_argument('--keepalive', type=int, default=120,
+                        help="Segundos que uma conexão keep-alive ociosa fica aberta")
+    parser.add_argument('--dev', action='store_true',
+                        help="Servidor de desenvolvimento do Flask com reloader (não usar em produção)")
+    args, _ = parser.parse_known_args(argv)
+    return args
+
+def serve(args):
+    if args.dev:
+        # O reloader roda o script duas vezes: as tarefas só sobem no processo filho
+        if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+            start_background_tasks()
+        app.run(host=args.host, port=args.port, debug=True, use_reloader=True, use_debugger=False)
+        return
+    signal.signal(signal.SIGTERM, signal_handler)  # systemd/docker param com SIGTERM
+    server = make_server(args.host, args.port, args.threads, args.keepalive)
+    create_app()
+    server.serve_forever()
+
+if __name__ == '__main__':
+    serve(parse_server_args())
@@ -0,0 +1,300 @@
+import ftplib
+import io
+import os
+import ssl
+import tempfile
+import threading
+import time
+import zipfile
+from collections import OrderedDict
+from contextlib import contextmanager
+from logger_config import log_debug
+
+# Acima disso o fallback (download completo) vai para disco em vez de RAM
+SPILL_MAX_MEMORY = 8 * 1024 * 1024
+
+_context_lock = threading.Lock()
+_shared_context = None
+
+
+def shared_ssl_context():
+    """SSLContext único para todo FTPS da Bambu (certificado autoassinado, TLS 1.2)."""
+    global _shared_context
+    with _context_lock:
+        if _shared_context is None:
+            context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+            context.check_hostname = False
+            context.verify_mode = ssl.CERT_NONE
+            # Retomada de sessão no canal de dados é exigida pelo servidor e só é
+            # previsível em TLS 1.2 (em 1.3 o ticket chega depois do handshake)
+            context.maximum_version = ssl.TLSVersion.TLSv1_2
+            _shared_context = context
+        return _shared_context
+
+
+# Helper for Implicit FTP TLS (used by Bambu Lab)
+class ImplicitFTP_TLS(ftplib.FTP_TLS):
+    def __init__(self, *args, tls_session=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._sock = None
+        # Sessão TLS de uma conexão anterior: reconectar sem handshake completo
+        self.tls_session = tls_session
+
+    @property
+    def sock(self):
+        return self._sock
+
+    @sock.setter
+    def sock(self, value):
+        if value is not None and not isinstance(value, ssl.SSLSocket):
+            value = self.context.wrap_socket(value, session=self.tls_session)
+        self._sock = value
+
+    def ntransfercmd(self, cmd, rest=None):
+        conn, size = ftplib.FTP.ntransfercmd(self, cmd, rest)
+        if self._prot_p:
+            session = self.sock.session if isinstance(self.sock, ssl.SSLSocket) else None
+            conn = self.context.wrap_socket(conn, server_hostname=self.host, session=session)
+        return conn, size
+
+    def store(self, path, fp, blocksize=64 * 1024):
+        """STOR de `fp` em `path`, lido em blocos (o arquivo nunca fica inteiro na memória).
+
+        Igual a `storbinary`, mas sem o `unwrap()` do canal de dados: o
+        firmware da Bambu não responde ao close_notify e o unwrap trava até o
+        timeout.
+        """
+        self.voidcmd('TYPE I')
+        with self.transfercmd(f"STOR {path}") as conn:
+            while True:
+                buf = fp.read(blocksize)
+                if not buf:
+                    break
+                conn.sendall(buf)
+        return self.voidresp()
+
+
+class FTPSession:
+    """Conexão FTPS persistente de uma impressora (login + PROT P feitos uma vez).
+
+    `session()` entrega a conexão com exclusividade; se ela caiu, reconecta
+    reaproveitando a sessão TLS anterior. Em erro durante o uso a conexão é
+    descartada. `close_idle()` devolve o slot ao firmware (que aceita poucas
+    sessões simultâneas) depois de `idle_timeout` segundos sem uso.
+    """
+
+    def __init__(self, host, user, password, port=990, timeout=10, idle_timeout=60):
+        self.host = host
+        self.user = user
+        self.password = password
+        self.port = port
+        self.timeout = timeout
+        self.idle_timeout = idle_timeout
+        self.lock = threading.Lock()
+        self._ftp = None
+        self._tls_session = None
+        self._last_used = 0
+
+    def _connect(self):
+        ftp = ImplicitFTP_TLS(context=shared_ssl_context(), tls_session=self._tls_session)
+        ftp.connect(self.host, self.port, timeout=self.timeout)
+        ftp.login(self.user, self.password)
+        ftp.prot_p()
+        if isinstance(ftp.sock, ssl.SSLSocket):
+            self._tls_session = ftp.sock.session
+        return ftp
+
+    def _drop(self, quit=False):
+        ftp, self._ftp = self._ftp, None
+        if ftp is None:
+            return
+        try:
+            ftp.quit() if quit else ftp.close()
+        except Exception:
+            try: ftp.close()
+            except Exception: pass
+
+    @contextmanager
+    def session(self):
+        with self.lock:
+            if self._ftp is not None and time.monotonic() - self._last_used > 15:
+                # Parada longa: confirmar que o servidor não fechou a sessão
+                try:
+                    self._ftp.voidcmd('NOOP')
+                except Exception:
+                    self._drop()
+            if self._ftp is None:
+                self._ftp = self._connect()
+            try:
+                yield self._ftp
+            except Exception:
+                self._drop()
+                raise
+            finally:
+                self._last_used = time.monotonic()
+
+    def close_idle(self):
+        if self._ftp is None or time.monotonic() - self._last_used < self.idle_timeout:
+            return
+        if self.lock.acquire(blocking=False):
+            try:
+                self._drop(quit=True)
+            finally:
+                self.lock.release()
+
+    def close(self):
+        with self.lock:
+            self._drop(quit=True)
+
+
+def list_dir(ftp, path):
+    """Lista `path` numa única transferência: {nome: (tamanho, mtime)}.
+
+    Usa MLSD (tamanho e data vêm juntos); servidores sem MLSD caem no NLST e
+    devolvem tamanho/data como None.
+    """
+    try:
+        return {name: (int(facts['size']) if 'size' in facts else None, facts.get('modify'))
+                for name, facts in ftp.mlsd(path, facts=['size', 'modify'])
+                if facts.get('type', 'file') == 'file'}
+    except ftplib.error_perm:
+        return {os.path.basename(name.rstrip('/')): (None, None) for name in ftp.nlst(path)}
+
+
+def find_file(ftp, names, folders=('/cache', '/')):
+    """Procura o primeiro de `names` listando cada pasta uma vez.
+
+    Retorna `(caminho, tamanho, mtime)` ou None.
+    """
+    for folder in folders:
+        try:
+            listing = list_dir(ftp, folder)
+        except ftplib.error_perm:
+            continue
+        for name in names:
+            if name in listing:
+                size, mtime = listing[name]
+                return f"{folder.rstrip('/')}/{name}", size, mtime
+    return None
+
+
+class FTPRangeFile(io.RawIOBase):
+    """Arquivo remoto somente leitura com acesso aleatório via `REST <offset>` + `RETR`.
+
+    Cada leitura baixa apenas os blocos que faltam (uma conexão de dados por
+    trecho contíguo) e fecha o canal de dados assim que tem os bytes pedidos.
+    Os blocos ficam num LRU pequeno, suficiente para o ZipFile reler o
+    diretório central e os cabeçalhos locais sem ir de novo à rede.
+    """
+
+    def __init__(self, ftp, path, size, block_size=64 * 1024, max_blocks=32):
+        super().__init__()
+        self.ftp = ftp
+        self.path = path
+        self.size = size
+        self.block_size = block_size
+        self.max_blocks = max_blocks
+        self.pos = 0
+        self.bytes_fetched = 0
+        self.requests = 0
+        self._blocks = OrderedDict()
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            self.pos = offset
+        elif whence == io.SEEK_CUR:
+            self.pos += offset
+        elif whence == io.SEEK_END:
+            self.pos = self.size + offset
+        else:
+            raise ValueError(f"whence inválido: {whence}")
+        self.pos = max(0, self.pos)
+        return self.pos
+
+    def _fetch(self, offset, length):
+        self.ftp.voidcmd('TYPE I')
+        conn = self.ftp.transfercmd(f"RETR {self.path}", rest=offset)
+        buf = bytearray()
+        try:
+            while len(buf) < length:
+                chunk = conn.recv(min(65536, length - len(buf)))
+                if not chunk:
+                    break
+                buf += chunk
+        finally:
+            # Fechar o canal de dados no meio do arquivo é o "abort" aqui:
+            # ABOR em canal TLS não é confiável no firmware da Bambu.
+            conn.close()
+        try:
+            self.ftp.voidresp()
+        except ftplib.error_temp:
+            pass  # 426/451: transferência interrompida por nós, esperado
+        self.requests += 1
+        self.bytes_fetched += len(buf)
+        if len(buf) < length:
+            raise EOFError(f"{self.path}: esperados {length} bytes em {offset}, recebidos {len(buf)}")
+        return bytes(buf)
+
+    def _load(self, first, last):
+        missing = [i for i in range(first, last + 1) if i not in self._blocks]
+        if missing:
+            start, end = missing[0], missing[-1]
+            offset = start * self.block_size
+            data = self._fetch(offset, min(self.size, (end + 1) * self.block_size) - offset)
+            for i in range(start, end + 1):
+                rel = (i - start) * self.block_size
+                self._blocks[i] = data[rel:rel + self.block_size]
+        for i in range(first, last + 1):
+            self._blocks.move_to_end(i)
+        while len(self._blocks) > max(self.max_blocks, last - first + 1):
+            self._blocks.popitem(last=False)
+
+    def readinto(self, b):
+        n = min(len(b), self.size - self.pos)
+        if n <= 0:
+            return 0
+        first = self.pos // self.block_size
+        last = (self.pos + n - 1) // self.block_size
+        self._load(first, last)
+        out = memoryview(b)
+        written = 0
+        for i in range(first, last + 1):
+            block = self._blocks[i]
+            start = self.pos + written - i * self.block_size
+            chunk = block[start:start + n - written]
+            out[written:written + len(chunk)] = chunk
+            written += len(chunk)
+        self.pos += written
+        return written
+
+
+def open_remote_zip(ftp, path, size=None):
+    """Abre um ZIP (3MF) no servidor FTP lendo só o necessário.
+
+    Usa `FTPRangeFile` quando o servidor aceita SIZE/REST; senão baixa o
+    arquivo inteiro para um buffer que transborda para disco. `size` (já
+    conhecido de uma listagem) evita o SIZE. Retorna
+    `(zipfile, arquivo)`; quem chama fecha os dois.
+    """
+    try:
+        if size is None:
+            size = ftp.size(path)
+        if size:
+            raw = FTPRangeFile(ftp, path, size)
+            return zipfile.ZipFile(raw), raw
+    except (ftplib.error_perm, ftplib.error_reply, EOFError, zipfile.BadZipFile) as e:
+        log_debug(f"FTP: leitura parcial indisponível para {path} ({e}), baixando inteiro")
+
+    spool = tempfile.SpooledTemporaryFile(max_size=SPILL_MAX_MEMORY)
+    ftp.retrbinary(f"RETR {path}", spool.write)
+    spool.seek(0)
+    return zipfile.ZipFile(spool), spool
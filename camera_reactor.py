@@ -0,0 +1,337 @@
+import errno
+import random
+import selectors
+import socket
+import ssl
+import struct
+import threading
+import time
+from collections import deque
+from logger_config import log_info, log_debug
+from supervisor import SUPERVISOR, heartbeat, cancelled
+from metrics import METRICS
+
+CAMERA_FRAMES = METRICS.counter('hub_camera_frames_total', 'Frames JPEG recebidos das câmeras Bambu', ('host',))
+CAMERA_BYTES = METRICS.counter('hub_camera_received_bytes_total', 'Bytes de imagem recebidos das câmeras Bambu', ('host',))
+CAMERA_FAILURES = METRICS.counter('hub_camera_connection_failures_total', 'Quedas/falhas de conexão de câmera', ('host',))
+
+CAMERA_PORT = 6000
+
+# Estados de uma sessão
+IDLE, CONNECTING, HANDSHAKE, AUTH_WAIT, AUTH_SEND, STREAMING = range(6)
+
+
+def build_auth_payload(access_code, username='bblp'):
+    # Payload de autenticação - Montagem byte a byte idêntica ao exemplo funcional
+    auth_data = bytearray()
+    auth_data += struct.pack("<I", 0x40)   # Payload size (64 bytes)
+    auth_data += struct.pack("<I", 0x3000) # Type
+    auth_data += struct.pack("<I", 0)      # Seq
+    auth_data += struct.pack("<I", 0)      # Reserved
+    # Username e Access Code (32 bytes cada) - Respeita o case fornecido pelo usuário
+    auth_data += username.encode('ascii').ljust(32, b'\0')
+    auth_data += access_code.encode('ascii').ljust(32, b'\0')
+    return bytes(auth_data)
+
+
+def camera_ssl_context():
+    # Contexto SSL - Refinado para X1C
+    ctx = ssl.create_default_context()
+    ctx.check_hostname = False
+    ctx.verify_mode = ssl.CERT_NONE
+    ctx.set_ciphers('DEFAULT@SECLEVEL=1:AES128-SHA')
+    # Desabilita protocolos inseguros mas mantém TLS 1.2
+    ctx.minimum_version = ssl.TLSVersion.TLSv1_2
+    return ctx
+
+
+class CameraSession:
+    """Conexão de câmera de uma impressora (porta 6000, TLS + JPEGs com cabeçalho de 16 bytes)."""
+
+    CONNECT_TIMEOUT = 5
+    STALL_TIMEOUT = 30     # sem bytes nesse tempo: reconecta
+    AUTH_DELAY = 0.5       # Atraso crucial para a X1C processar o handshake antes do auth
+
+    def __init__(self, host, access_code, on_frame, group=None):
+        self.host = host
+        self.auth = build_auth_payload(access_code)
+        self.subscribers = [on_frame] if on_frame else []
+        self.group = group
+        self.state = IDLE
+        self.sock = None
+        self.events = 0
+        self.buffer = bytearray()
+        self.out = b''
+        self.deadline = 0          # próximo evento temporizado do estado atual
+        self.last_data = 0
+        self.failures = 0
+        self.frames = 0
+        self.closed = False
+
+    def backoff(self):
+        # Backoff exponencial com jitter: câmeras que caem juntas não voltam juntas
+        base = min(60, 5 * (2 ** min(max(self.failures - 1, 0), 4)))
+        return base * random.uniform(0.5, 1.5)
+
+
+class CameraReactor:
+    """Uma thread, um selector, todas as câmeras Bambu.
+
+    Conexão, handshake TLS e autenticação são não bloqueantes; cada sessão é
+    uma pequena máquina de estados. Frames completos vão para os
+    `subscribers` da sessão (chamados na thread do reactor: devem ser rápidos).
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.sel = None
+        self.ctx = None
+        self.sessions = set()
+        self._ops = deque()
+        self._wake_r = self._wake_w = None
+        self._task = None
+
+    # --- API -----------------------------------------------------------------
+    def open(self, host, access_code, on_frame, group=None):
+        self._ensure_started()
+        session = CameraSession(host, access_code, on_frame, group)
+        self._post(('open', session))
+        return session
+
+    def close(self, session):
+        if session is None:
+            return
+        session.closed = True
+        self._post(('close', session))
+
+    def stats(self):
+        with self.lock:
+            sessions = list(self.sessions)
+        return {
+            'sessions': len(sessions),
+            'streaming': sum(1 for s in sessions if s.state == STREAMING),
+            'frames': sum(s.frames for s in sessions),
+        }
+
+    # --- Internos ------------------------------------------------------------
+    def _ensure_started(self):
+        with self.lock:
+            if self._task and self._task.is_alive():
+                return
+            self.sel = selectors.DefaultSelector()
+            self.ctx = camera_ssl_context()
+            self._wake_r, self._wake_w = socket.socketpair()
+            self._wake_r.setblocking(False)
+            self._wake_w.setblocking(False)
+            self.sel.register(self._wake_r, selectors.EVENT_READ, None)
+            self._task = SUPERVISOR.spawn("CameraReactor", self._run, on_cancel=self._wake)
+
+    def _wake(self):
+        try:
+            self._wake_w.send(b'\0')
+        except (BlockingIOError, OSError, AttributeError):
+            pass
+
+    def _post(self, op):
+        self._ops.append(op)
+        self._wake()
+
+    def _apply_ops(self, now):
+        while self._ops:
+            op, session = self._ops.popleft()
+            if op == 'open':
+                with self.lock:
+                    self.sessions.add(session)
+                session.deadline = now
+            elif op == 'close':
+                self._disconnect(session)
+                with self.lock:
+                    self.sessions.discard(session)
+                    host_in_use = any(s.host == session.host for s in self.sessions)
+                if not host_in_use:
+                    # Impressora removida ou com IP novo: não deixa a série do host antigo para sempre
+                    for metric in (CAMERA_FRAMES, CAMERA_BYTES, CAMERA_FAILURES):
+                        metric.remove(session.host)
+
+    def _watch(self, session, events):
+        if events == session.events:
+            return
+        if session.events and events:
+            self.sel.modify(session.sock, events, session)
+        elif events:
+            self.sel.register(session.sock, events, session)
+        else:
+            self.sel.unregister(session.sock)
+        session.events = events
+
+    def _disconnect(self, session, error=None):
+        if session.sock is not None:
+            if session.events:
+                try: self.sel.unregister(session.sock)
+                except (KeyError, ValueError): pass
+            try: session.sock.close()
+            except OSError: pass
+        if error is not None and session.state == STREAMING:
+            log_debug(f"[{session.host}] Câmera desconectada: {error}")
+        session.sock = None
+        session.events = 0
+        session.buffer = bytearray()
+        session.state = IDLE
+        if error is not None:
+            CAMERA_FAILURES.labels(session.host).inc()
+            session.failures += 1
+            session.deadline = time.monotonic() + session.backoff()
+
+    def _start_connect(self, session, now):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setblocking(False)
+        try:
+            err = sock.connect_ex((session.host, CAMERA_PORT))
+        except OSError as e:  # ex.: nome não resolve
+            sock.close()
+            session.state = CONNECTING
+            return self._disconnect(session, e)
+        session.sock = sock
+        session.state = CONNECTING
+        session.deadline = now + session.CONNECT_TIMEOUT
+        if err not in (0, errno.EINPROGRESS, errno.EWOULDBLOCK):
+            return self._disconnect(session, OSError(err, 'connect'))
+        self._watch(session, selectors.EVENT_WRITE)
+
+    def _on_connected(self, session, now):
+        err = session.sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+        if err:
+            return self._disconnect(session, OSError(err, 'connect'))
+        # server_hostname=None to avoid SNI issues with IP addresses on some firmware
+        raw = session.sock
+        self._watch(session, 0)
+        session.sock = self.ctx.wrap_socket(raw, server_hostname=None, do_handshake_on_connect=False)
+        session.state = HANDSHAKE
+        self._handshake(session, now)
+
+    def _handshake(self, session, now):
+        try:
+            session.sock.do_handshake()
+        except ssl.SSLWantReadError:
+            return self._watch(session, selectors.EVENT_READ)
+        except ssl.SSLWantWriteError:
+            return self._watch(session, selectors.EVENT_WRITE)
+        except (ssl.SSLError, OSError) as e:
+            return self._disconnect(session, e)
+        self._watch(session, 0)
+        session.state = AUTH_WAIT
+        session.deadline = now + session.AUTH_DELAY
+
+    def _send_auth(self, session, now):
+        try:
+            while session.out:
+                sent = session.sock.send(session.out)
+                session.out = session.out[sent:]
+        except (ssl.SSLWantWriteError, BlockingIOError):
+            return self._watch(session, selectors.EVENT_WRITE)
+        except ssl.SSLWantReadError:
+            return self._watch(session, selectors.EVENT_READ)
+        except (ssl.SSLError, OSError) as e:
+            return self._disconnect(session, e)
+        log_debug(f"[{session.host}] Câmera: Conexão SSL estabelecida, autenticada")
+        session.state = STREAMING
+        session.last_data = now
+        session.deadline = now + session.STALL_TIMEOUT
+        self._watch(session, selectors.EVENT_READ)
+
+    def _read(self, session, now):
+        sock = session.sock
+        try:
+            while True:
+                data = sock.recv(65536)
+                if not data:
+                    return self._disconnect(session, EOFError('conexão fechada'))
+                session.buffer += data
+                if not sock.pending():
+                    break
+        except (ssl.SSLWantReadError, BlockingIOError):
+            pass
+        except (ssl.SSLError, OSError) as e:
+            return self._disconnect(session, e)
+        session.last_data = now
+        session.deadline = now + session.STALL_TIMEOUT
+        self._parse(session)
+
+    def _parse(self, session):
+        buffer = session.buffer
+        start = 0
+        while len(buffer) - start >= 16:
+            payload_size = int.from_bytes(buffer[start:start + 4], byteorder='little')
+            if payload_size > 1000000 or payload_size < 100:
+                start += 1
+                continue
+            if len(buffer) - start < 16 + payload_size:
+                break
+            img_data = bytes(buffer[start + 16:start + 16 + payload_size])
+            start += 16 + payload_size
+            if img_data.startswith(b'\xff\xd8'):
+                session.frames += 1
+                CAMERA_FRAMES.labels(session.host).inc()
+                CAMERA_BYTES.labels(session.host).inc(payload_size)
+                if session.failures:
+                    session.failures = 0
+                for cb in list(session.subscribers):
+                    try:
+                        cb(img_data)
+                    except Exception as e:
+                        log_debug(f"[{session.host}] Câmera: erro no consumidor de frames: {e}")
+        if start:
+            del buffer[:start]
+
+    def _on_event(self, session, mask, now):
+        if session.closed or session.sock is None:
+            return
+        if session.state == CONNECTING:
+            self._on_connected(session, now)
+        elif session.state == HANDSHAKE:
+            self._handshake(session, now)
+        elif session.state == AUTH_SEND:
+            self._send_auth(session, now)
+        elif session.state == STREAMING:
+            self._read(session, now)
+
+    def _on_timer(self, session, now):
+        if session.state == IDLE:
+            self._start_connect(session, now)
+        elif session.state == AUTH_WAIT:
+            session.state = AUTH_SEND
+            session.out = session.auth
+            session.deadline = now + session.CONNECT_TIMEOUT
+            self._send_auth(session, now)
+        elif session.state == STREAMING:
+            self._disconnect(session, TimeoutError('sem dados da câmera'))
+        else:
+            self._disconnect(session, TimeoutError('tempo de conexão esgotado'))
+
+    def _run(self):
+        log_info("[Camera] Reactor de câmeras iniciado")
+        while not cancelled():
+            heartbeat()
+            now = time.monotonic()
+            self._apply_ops(now)
+            with self.lock:
+                sessions = list(self.sessions)
+            next_deadline = now + 5
+            for session in sessions:
+                if session.deadline <= now:
+                    self._on_timer(session, now)
+                next_deadline = min(next_deadline, session.deadline)
+            timeout = max(0.0, next_deadline - time.monotonic())
+            for key, mask in self.sel.select(timeout=timeout):
+                if key.data is None:
+                    try:
+                        while self._wake_r.recv(4096):
+                            pass
+                    except (BlockingIOError, OSError):
+                        pass
+                    continue
+                self._on_event(key.data, mask, time.monotonic())
+
+
+# Instância global usada pelos drivers Bambu
+CAMERA_REACTOR = CameraReactor()
@@ -0,0 +1,243 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from logger_config import log_warn, log_debug
+from metrics import METRICS
+from supervisor import SUPERVISOR, sleep as supervised_sleep
+
+COMMANDS_TOTAL = METRICS.counter('hub_commands_total', 'Comandos enviados às impressoras, por resultado',
+                                 ('type', 'state'))
+COMMAND_SECONDS = METRICS.histogram('hub_command_seconds', 'Tempo do enfileiramento à confirmação do comando',
+                                    ('type',))
+
+FINAL_STATES = ('done', 'failed', 'timeout')
+
+
+def _json_safe(value):
+    if value is None or isinstance(value, (str, int, float, bool, list, dict)):
+        return value
+    return str(value)
+
+
+class CommandQueue:
+    """Fila assíncrona de comandos por impressora, com rastreio de confirmação.
+
+    `submit` só registra o comando e devolve na hora (o request HTTP não espera
+    a impressora). Cada impressora tem sua fila FIFO, drenada por um pool
+    compartilhado: comandos da mesma impressora saem em ordem, impressoras
+    diferentes em paralelo. O driver devolve o resultado já confirmado, None
+    (protocolo sem ack) ou um Future resolvido pela resposta (sequence_id do
+    MQTT, RequestID do SDCP); sem resposta em `ack_timeout` o estado vira
+    'timeout'.
+
+    Estados: queued -> sending -> waiting_ack -> done | failed | timeout.
+    """
+
+    def __init__(self, workers=32, ack_timeout=15, keep=1000):
+        self.ack_timeout = ack_timeout
+        self.keep = keep
+        self.lock = threading.Lock()
+        self._cond = threading.Condition(self.lock)
+        self._records = OrderedDict()   # id -> registro (dict), os mais antigos saem primeiro
+        self._keys = {}                 # chave de deduplicação -> id
+        self._callbacks = {}            # id -> on_done
+        self._waiting = {}              # id -> prazo (monotonic) do ack
+        self._queues = {}               # printer_id -> deque[(registro, impressora)]
+        self._draining = set()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='CommandDispatch')
+        self._sweeper = None
+
+    def submit(self, printer, command, args=None, source='api', key=None, on_done=None):
+        """Enfileira `command` para `printer` e devolve o registro (cópia).
+
+        `key` evita duplicar um comando já aceito (ex.: id do comando da nuvem,
+        entregue de novo enquanto ainda não foi confirmado). Se o comando da
+        chave já terminou, `on_done` roda de novo com o resultado, na thread de
+        quem chamou: a confirmação que falhou é refeita sem reenviar o comando.
+        `on_done(registro)` roda na thread que concluiu o comando: deve ser rápido.
+        """
+        printer_id = printer.config.get('id')
+        with self.lock:
+            existing = self._records.get(self._keys.get(key)) if key is not None else None
+            if existing is not None:
+                snapshot = dict(existing)
+            else:
+                snapshot, start = self._enqueue_locked(printer, command, args, source, key, on_done)
+        if existing is None:
+            if start:
+                self._executor.submit(self._drain, printer_id)
+        elif on_done is not None and snapshot['state'] in FINAL_STATES:
+            try:
+                on_done(snapshot)
+            except Exception as e:
+                log_debug(f"[Comandos] Callback de {snapshot['id']} falhou: {e}")
+        return snapshot
+
+    def _enqueue_locked(self, printer, command, args, source, key, on_done):
+        # Chamado com o lock. Retorna (cópia do registro, precisa iniciar o dreno)
+        printer_id = printer.config.get('id')
+        record = {
+            'id': uuid.uuid4().hex[:12],
+            'printer_id': printer_id,
+            'printer_type': printer.type,
+            'command': command,
+            'args': dict(args or {}),
+            'source': source,
+            'state': 'queued',
+            'created_at': time.time(),
+            'sent_at': None,
+            'finished_at': None,
+            'acked': False,
+            'result': None,
+            'error': None,
+        }
+        self._records[record['id']] = record
+        if key is not None:
+            record['key'] = key
+            self._keys[key] = record['id']
+        if on_done is not None:
+            self._callbacks[record['id']] = on_done
+        self._trim()
+        self._queues.setdefault(printer_id, deque()).append((record, printer))
+        start = printer_id not in self._draining
+        self._draining.add(printer_id)
+        return dict(record), start
+
+    def get(self, command_id, wait=0):
+        """Registro do comando; com `wait`, espera até `wait` s por um estado final."""
+        self.expire()
+        deadline = time.monotonic() + min(max(wait, 0), 60)
+        with self._cond:
+            while True:
+                record = self._records.get(command_id)
+                if record is None:
+                    return None
+                remaining = deadline - time.monotonic()
+                if record['state'] in FINAL_STATES or remaining <= 0:
+                    return dict(record)
+                self._cond.wait(min(remaining, 1))
+
+    def list(self, printer_id=None, limit=50):
+        self.expire()
+        with self.lock:
+            records = [dict(r) for r in reversed(self._records.values())
+                       if printer_id is None or r['printer_id'] == printer_id]
+        return records[:limit]
+
+    def forget_printer(self, printer_id):
+        """Impressora removida: descarta o que ainda não saiu."""
+        with self.lock:
+            pending = self._queues.pop(printer_id, deque())
+        for record, _ in pending:
+            self._finish(record, 'failed', error='Impressora removida')
+
+    # --- Execução -------------------------------------------------------------
+    def _drain(self, printer_id):
+        while True:
+            with self.lock:
+                queue = self._queues.get(printer_id)
+                if not queue:
+                    self._queues.pop(printer_id, None)
+                    self._draining.discard(printer_id)
+                    return
+                record, printer = queue.popleft()
+                record['state'] = 'sending'
+                record['sent_at'] = time.time()
+            try:
+                result = printer.send_command(record['command'], **record['args'])
+            except Exception as e:
+                self._finish(record, 'failed', error=str(e) or type(e).__name__)
+                continue
+            if isinstance(result, Future):
+                with self.lock:
+                    if record['state'] == 'sending':
+                        record['state'] = 'waiting_ack'
+                        self._waiting[record['id']] = time.monotonic() + self.ack_timeout
+                    self._ensure_sweeper()
+                result.add_done_callback(lambda fut, record=record: self._on_ack(record, fut))
+            else:
+                # Protocolo síncrono (HTTP) confirma na resposta; None = enviado sem ack
+                self._finish(record, 'done', result=result, acked=result is not None)
+
+    def _on_ack(self, record, fut):
+        error = fut.exception()
+        if error is None:
+            self._finish(record, 'done', result=fut.result(), acked=True)
+        elif isinstance(error, TimeoutError):
+            self._finish(record, 'timeout', error='Sem confirmação da impressora')
+        else:
+            self._finish(record, 'failed', error=str(error) or type(error).__name__)
+
+    def _finish(self, record, state, result=None, acked=False, error=None):
+        with self._cond:
+            if record['state'] in FINAL_STATES:
+                return  # já expirou; resposta atrasada é ignorada
+            self._complete_locked(record, state, result, acked, error)
+            callback = self._callbacks.pop(record['id'], None)
+            snapshot = dict(record)
+        self._after_finish(snapshot, callback)
+
+    def _complete_locked(self, record, state, result=None, acked=False, error=None):
+        record['state'] = state
+        record['finished_at'] = time.time()
+        record['acked'] = acked
+        record['result'] = _json_safe(result)
+        record['error'] = error
+        self._waiting.pop(record['id'], None)
+        self._cond.notify_all()
+
+    def _after_finish(self, record, callback):
+        COMMANDS_TOTAL.labels(record['printer_type'], record['state']).inc()
+        COMMAND_SECONDS.labels(record['printer_type']).observe(record['finished_at'] - record['created_at'])
+        if record['state'] != 'done':
+            log_warn(f"[Comandos] '{record['command']}' para {record['printer_id']}: "
+                     f"{record['state']} ({record['error']})")
+        if callback is not None:
+            try:
+                callback(record)
+            except Exception as e:
+                log_debug(f"[Comandos] Callback de {record['id']} falhou: {e}")
+
+    def _expire_locked(self, now):
+        expired = []
+        for command_id, deadline in list(self._waiting.items()):
+            record = self._records.get(command_id)
+            if record is None:
+                self._waiting.pop(command_id, None)
+            elif deadline <= now:
+                self._complete_locked(record, 'timeout', error='Sem confirmação da impressora')
+                expired.append((dict(record), self._callbacks.pop(command_id, None)))
+        return expired
+
+    def expire(self):
+        with self.lock:
+            expired = self._expire_locked(time.monotonic())
+        for record, callback in expired:
+            self._after_finish(record, callback)
+
+    def _ensure_sweeper(self):
+        # Chamado com o lock. Expira acks sem resposta mesmo sem ninguém consultando (ex.: nuvem esperando on_done)
+        if self._sweeper is None or not self._sweeper.is_alive():
+            self._sweeper = SUPERVISOR.spawn("CommandAcks", self._sweep, restart='on_failure')
+
+    def _sweep(self):
+        while True:
+            if supervised_sleep(1):
+                return
+            self.expire()
+
+    def _trim(self):
+        while len(self._records) > self.keep:
+            command_id, record = next(iter(self._records.items()))
+            if record['state'] not in FINAL_STATES:
+                break  # nunca descarta um comando em andamento
+            self._records.popitem(last=False)
+            self._callbacks.pop(command_id, None)
+            if record.get('key') is not None:
+                self._keys.pop(record['key'], None)
+
+
+# Instância global usada pelo app
+COMMANDS = CommandQueue()
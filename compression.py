@@ -0,0 +1,147 @@
+import gzip
+import hashlib
+import os
+import threading
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+MIN_SIZE = 1024          # JSON menor que isso vai sem compressão (não compensa)
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5       # on-the-fly: qualidade média, rápida o bastante por requisição
+STATIC_MAX_AGE = 365 * 24 * 3600
+
+
+def _accepted(request):
+    """Melhor codificação aceita pelo cliente: 'br', 'gzip' ou None."""
+    accepted = request.accept_encodings
+    if brotli is not None and accepted['br']:
+        return 'br'
+    if accepted['gzip']:
+        return 'gzip'
+    return None
+
+
+def _compress(data, encoding, quality=None):
+    if encoding == 'br':
+        return brotli.compress(data, quality=BROTLI_QUALITY if quality is None else quality)
+    return gzip.compress(data, compresslevel=GZIP_LEVEL if quality is None else quality, mtime=0)
+
+
+class Precompressed:
+    """Um corpo pronto nas três formas (identidade, gzip e, se houver, brotli), com ETag.
+
+    Comprime uma única vez, no nível máximo: quem serve só escolhe a variante.
+    """
+
+    def __init__(self, body, mimetype):
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        self.mimetype = mimetype
+        self.etag = hashlib.sha1(body).hexdigest()[:20]
+        self.variants = {None: body}
+        if mimetype.startswith('image/') and mimetype != 'image/svg+xml':
+            return  # PNG/ICO já são comprimidos
+        self.variants['gzip'] = _compress(body, 'gzip', 9)
+        if brotli is not None:
+            self.variants['br'] = _compress(body, 'br', 11)
+
+    def response(self, request, response_class, cache_control='no-cache'):
+        encoding = _accepted(request)
+        if encoding not in self.variants:
+            encoding = None
+        # ETag por variante (são bytes diferentes); qualquer uma revalida
+        etags = [self._etag(e) for e in self.variants]
+        if any(request.if_none_match.contains(e) for e in etags):
+            response = response_class(status=304)
+        else:
+            response = response_class(self.variants[encoding], mimetype=self.mimetype)
+            if encoding:
+                response.headers['Content-Encoding'] = encoding
+        response.set_etag(self._etag(encoding))
+        response.headers['Cache-Control'] = cache_control
+        response.vary.add('Accept-Encoding')
+        return response
+
+    def _etag(self, encoding):
+        return f"{self.etag}-{encoding}" if encoding else self.etag
+
+
+class AssetCache:
+    """Cache em memória de páginas renderizadas e arquivos estáticos já comprimidos.
+
+    As páginas do Hub não dependem do usuário nem de dados (tudo vem depois por
+    /api), então o HTML de cada rota é renderizado uma vez. Arquivos de
+    `static/` são relidos só quando o mtime muda; `url(path)` devolve o
+    caminho com `?v=<hash>`, o que permite cache de um ano no navegador.
+    """
+
+    def __init__(self, static_dir):
+        self.static_dir = os.path.abspath(static_dir)
+        self.lock = threading.Lock()
+        self._pages = {}
+        self._files = {}    # caminho relativo -> (mtime, Precompressed)
+
+    def page(self, key, render):
+        entry = self._pages.get(key)
+        if entry is None:
+            entry = Precompressed(render(), 'text/html')
+            with self.lock:
+                self._pages[key] = entry
+        return entry
+
+    def file(self, path):
+        full = os.path.abspath(os.path.join(self.static_dir, path))
+        if not full.startswith(self.static_dir + os.sep) or not os.path.isfile(full):
+            return None
+        mtime = os.path.getmtime(full)
+        cached = self._files.get(path)
+        if cached is None or cached[0] != mtime:
+            with open(full, 'rb') as f:
+                cached = (mtime, Precompressed(f.read(), _mimetype(path)))
+            with self.lock:
+                self._files[path] = cached
+        return cached[1]
+
+    def url(self, path):
+        entry = self.file(path)
+        version = f"?v={entry.etag[:10]}" if entry else ''
+        return f"/static/{path}{version}"
+
+    def clear(self):
+        with self.lock:
+            self._pages.clear()
+            self._files.clear()
+
+
+_MIMETYPES = {
+    '.css': 'text/css', '.js': 'text/javascript', '.svg': 'image/svg+xml',
+    '.json': 'application/json', '.png': 'image/png', '.ico': 'image/x-icon',
+}
+
+
+def _mimetype(path):
+    return _MIMETYPES.get(os.path.splitext(path)[1].lower(), 'application/octet-stream')
+
+
+def compress_response(request, response):
+    """`after_request`: comprime respostas JSON acima de `MIN_SIZE`.
+
+    Streams (MJPEG, NDJSON), arquivos (`send_file`) e o que já tem
+    Content-Encoding passam direto.
+    """
+    if (response.status_code != 200 or response.direct_passthrough or response.is_streamed
+            or response.mimetype != 'application/json' or 'Content-Encoding' in response.headers):
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = _accepted(request)
+    if encoding is None:
+        return response
+    data = response.get_data()
+    if len(data) < MIN_SIZE:
+        return response
+    response.set_data(_compress(data, encoding))
+    response.headers['Content-Encoding'] = encoding
+    return response
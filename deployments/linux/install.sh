@@ -63,7 +63,9 @@ After=network.target
 Type=simple
 User=$USER_NAME
 WorkingDirectory=$INSTALL_DIR
-ExecStart=$INSTALL_DIR/venv/bin/python $INSTALL_DIR/app.py
+ExecStart=$INSTALL_DIR/venv/bin/python $INSTALL_DIR/app.py --threads 32
+KillSignal=SIGTERM
+TimeoutStopSec=15
 Restart=always
 RestartSec=10
 
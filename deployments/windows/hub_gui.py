@@ -29,7 +29,6 @@ else:
 CONFIG_FILE = os.path.join(CONFIG_DIR, 'config.json')
 
 import app as server_app
-from werkzeug.serving import make_server
 
 # ---------------------------------------------------------------------------
 class HubLauncher:
@@ -218,7 +217,7 @@ class HubLauncher:
 
     def run_flask(self):
         try:
-            self.server = make_server('0.0.0.0', 5000, server_app.app)
+            self.server = server_app.make_server('0.0.0.0', 5000)
             self.server.serve_forever()
         except Exception as e:
             print(f"Flask erro: {e}")
@@ -0,0 +1,255 @@
+import json
+import selectors
+import socket
+import struct
+import threading
+import time
+from logger_config import log_info, log_debug, log_warn
+from supervisor import SUPERVISOR, heartbeat
+
+# Bambu: NOTIFY SSDP periódico em broadcast (2021) e multicast (1990)
+BAMBU_SSDP_PORTS = (2021, 1990)
+SSDP_GROUP = '239.255.255.250'
+# Elegoo: o mesmo M99999 do polling, enviado em broadcast
+ELEGOO_PORT = 3000
+# Moonraker: consulta mDNS (RFC 6762) pelo serviço _moonraker._tcp
+MDNS_GROUP = '224.0.0.251'
+MDNS_PORT = 5353
+MOONRAKER_SERVICE = '_moonraker._tcp.local'
+
+
+def _read_name(data, pos):
+    """Decodifica um nome DNS (com ponteiros de compressão). Retorna (nome, próxima posição)."""
+    labels = []
+    end = None
+    for _ in range(64):
+        length = data[pos]
+        if length & 0xC0 == 0xC0:
+            if end is None:
+                end = pos + 2
+            pos = ((length & 0x3F) << 8) | data[pos + 1]
+            continue
+        pos += 1
+        if length == 0:
+            break
+        labels.append(data[pos:pos + length].decode(errors='ignore'))
+        pos += length
+    return '.'.join(labels), (end if end is not None else pos)
+
+
+def parse_mdns(data):
+    """Extrai registros PTR/SRV/TXT/A de um pacote mDNS."""
+    records = []
+    _, _, qd, an, ns, ar = struct.unpack('>HHHHHH', data[:12])
+    pos = 12
+    for _ in range(qd):
+        _, pos = _read_name(data, pos)
+        pos += 4
+    for _ in range(an + ns + ar):
+        name, pos = _read_name(data, pos)
+        rtype, _, _, rdlen = struct.unpack('>HHIH', data[pos:pos + 10])
+        pos += 10
+        rdata = data[pos:pos + rdlen]
+        if rtype == 12:
+            records.append(('PTR', name, _read_name(data, pos)[0]))
+        elif rtype == 33:
+            port = struct.unpack('>H', rdata[4:6])[0]
+            records.append(('SRV', name, (_read_name(data, pos + 6)[0], port)))
+        elif rtype == 1 and rdlen == 4:
+            records.append(('A', name, socket.inet_ntoa(rdata)))
+        elif rtype == 16:
+            txt = {}
+            i = 0
+            while i < len(rdata):
+                n = rdata[i]
+                key, _, val = rdata[i + 1:i + 1 + n].decode(errors='ignore').partition('=')
+                txt[key] = val
+                i += 1 + n
+            records.append(('TXT', name, txt))
+        pos += rdlen
+    return records
+
+
+def build_mdns_query(service):
+    # ID 0, sem flags, 1 pergunta PTR com o bit QU (resposta unicast)
+    qname = b''.join(bytes([len(part)]) + part.encode() for part in service.split('.')) + b'\x00'
+    return struct.pack('>HHHHHH', 0, 0, 1, 0, 0, 0) + qname + struct.pack('>HH', 12, 0x8001)
+
+
+def parse_ssdp(data):
+    text = data.decode(errors='ignore')
+    headers = {}
+    for line in text.split('\r\n')[1:]:
+        key, sep, val = line.partition(':')
+        if sep:
+            headers[key.strip().lower()] = val.strip()
+    return headers
+
+
+class DiscoveryService:
+    """Descoberta de impressoras na LAN (Bambu SSDP, Moonraker mDNS, Elegoo UDP).
+
+    Os resultados ficam num cache com TTL, deduplicado por serial. Cada
+    avistamento é repassado a `on_found(entry)`, que o app usa para detectar
+    impressoras cadastradas que mudaram de IP.
+    """
+
+    def __init__(self, ttl=300, sweep_interval=60, on_found=None):
+        self.ttl = ttl
+        self.sweep_interval = sweep_interval
+        self.on_found = on_found
+        self.entries = {}
+        self.lock = threading.Lock()
+        self.sel = selectors.DefaultSelector()
+        self._task = None
+        self._stop_event = threading.Event()
+        self._sweep_now = threading.Event()
+        self._query_sock = None
+
+    # --- Cache ---------------------------------------------------------------
+    def _record(self, serial, p_type, ip, name='', model='', source='', port=None):
+        if not serial or not ip:
+            return
+        now = time.time()
+        key = serial.upper()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                log_info(f"[Discovery] Nova impressora {p_type} encontrada: {name or serial} ({ip})")
+            entry = {
+                'serial': serial,
+                'type': p_type,
+                'ip': ip,
+                'port': port,
+                'name': name or (entry or {}).get('name', ''),
+                'model': model or (entry or {}).get('model', ''),
+                'source': source,
+                'first_seen': (entry or {}).get('first_seen', now),
+                'last_seen': now,
+                'expires': now + self.ttl,
+            }
+            self.entries[key] = entry
+        if self.on_found:
+            try:
+                self.on_found(dict(entry))
+            except Exception as e:
+                log_warn(f"[Discovery] Erro ao aplicar descoberta de {serial}: {e}")
+
+    def snapshot(self):
+        now = time.time()
+        with self.lock:
+            for key in [k for k, e in self.entries.items() if e['expires'] < now]:
+                del self.entries[key]
+            return [dict(e) for e in self.entries.values()]
+
+    def refresh(self):
+        self._sweep_now.set()
+
+    # --- Fontes --------------------------------------------------------------
+    def _open_sockets(self):
+        for port in BAMBU_SSDP_PORTS:
+            try:
+                s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+                s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+                if hasattr(socket, 'SO_REUSEPORT'):
+                    s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+                s.bind(('', port))
+                if port == 1990:
+                    mreq = struct.pack('4s4s', socket.inet_aton(SSDP_GROUP), socket.inet_aton('0.0.0.0'))
+                    s.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, mreq)
+                s.setblocking(False)
+                self.sel.register(s, selectors.EVENT_READ, self._on_ssdp)
+            except OSError as e:
+                log_warn(f"[Discovery] SSDP Bambu indisponível na porta {port}: {e}")
+
+        # Socket efêmero para as varreduras ativas (broadcast Elegoo + consulta mDNS)
+        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        s.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+        s.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, 255)
+        s.bind(('', 0))
+        s.setblocking(False)
+        self.sel.register(s, selectors.EVENT_READ, self._on_query_reply)
+        self._query_sock = s
+
+    def _on_ssdp(self, sock):
+        data, (src_ip, _) = sock.recvfrom(4096)
+        h = parse_ssdp(data)
+        if 'bambu' not in h.get('nt', '').lower() and 'devmodel.bambu.com' not in h:
+            return
+        self._record(h.get('usn', ''), 'bambu', h.get('location') or src_ip,
+                     name=h.get('devname.bambu.com', ''), model=h.get('devmodel.bambu.com', ''), source='ssdp')
+
+    def _on_query_reply(self, sock):
+        data, (src_ip, src_port) = sock.recvfrom(65535)
+        if src_port == MDNS_PORT:
+            self._on_mdns(data, src_ip)
+            return
+        try:
+            payload = json.loads(data.decode())
+        except ValueError:
+            return
+        d = payload.get('Data', {}) if isinstance(payload, dict) else {}
+        attrs = d.get('Attributes', d)
+        self._record(attrs.get('MainboardID') or payload.get('Id', ''), 'elegoo', attrs.get('MainboardIP') or src_ip,
+                     name=attrs.get('Name', ''), model=attrs.get('MachineName', ''), source='udp', port=ELEGOO_PORT)
+
+    def _on_mdns(self, data, src_ip):
+        try:
+            records = parse_mdns(data)
+        except (struct.error, IndexError):
+            return
+        instances = [r[2] for r in records if r[0] == 'PTR' and r[1].lower() == MOONRAKER_SERVICE]
+        srv = {r[1]: r[2] for r in records if r[0] == 'SRV'}
+        txt = {r[1]: r[2] for r in records if r[0] == 'TXT'}
+        addrs = {r[1]: r[2] for r in records if r[0] == 'A'}
+        for inst in instances:
+            host, port = srv.get(inst, ('', 7125))
+            ip = addrs.get(host, src_ip)
+            props = txt.get(inst, {})
+            serial = props.get('uuid') or inst.split('.')[0]
+            name = inst.split('._moonraker')[0]
+            addr = f"{ip}:{port}" if port and port != 80 else ip
+            self._record(serial, 'moonraker', addr, name=name, model=host.split('.')[0], source='mdns', port=port)
+
+    def _sweep(self):
+        try:
+            self._query_sock.sendto(b'M99999', ('255.255.255.255', ELEGOO_PORT))
+        except OSError as e:
+            log_debug(f"[Discovery] Broadcast Elegoo falhou: {e}")
+        try:
+            self._query_sock.sendto(build_mdns_query(MOONRAKER_SERVICE), (MDNS_GROUP, MDNS_PORT))
+        except OSError as e:
+            log_debug(f"[Discovery] Consulta mDNS falhou: {e}")
+
+    # --- Ciclo de vida -------------------------------------------------------
+    def start(self):
+        if self._task and self._task.is_alive():
+            return
+        self._stop_event.clear()
+        self._open_sockets()
+        self._task = SUPERVISOR.spawn("Discovery", self._run, on_cancel=self._stop_event.set)
+
+    def stop(self):
+        self._stop_event.set()
+        if self._task:
+            self._task.join(2)
+
+    def _run(self):
+        log_info("[Discovery] Serviço de descoberta iniciado (SSDP/mDNS/UDP)")
+        next_sweep = 0
+        while not self._stop_event.is_set():
+            heartbeat()
+            now = time.monotonic()
+            if now >= next_sweep or self._sweep_now.is_set():
+                self._sweep_now.clear()
+                self._sweep()
+                next_sweep = now + self.sweep_interval
+            for key, _ in self.sel.select(timeout=1.0):
+                try:
+                    key.data(key.fileobj)
+                except (OSError, ValueError, KeyError, IndexError) as e:
+                    log_debug(f"[Discovery] Pacote ignorado: {e}")
+        for key in list(self.sel.get_map().values()):
+            try: key.fileobj.close()
+            except: pass
+        self.sel = selectors.DefaultSelector()
@@ -0,0 +1,321 @@
+import json
+import logging
+import socket
+import select
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import Future
+from logger_config import log_info, log_debug, log_error
+from supervisor import SUPERVISOR, heartbeat, cancelled
+
+try:
+    import websocket  # websocket-client (opcional, usado pelo SDCP)
+    # A lib loga cada reconexão recusada; os erros relevantes já passam pelo log_debug
+    logging.getLogger('websocket').setLevel(logging.CRITICAL)
+except ImportError:
+    websocket = None
+
+SDCP_PORT = 3030
+
+
+class ElegooUDPMux:
+    """Endpoint UDP único compartilhado por todas as impressoras Elegoo.
+
+    Cada requisição é enviada pelo mesmo socket e recebe um Future. Uma única
+    thread recebe as respostas, separa por IP de origem e resolve o Future
+    pendente mais antigo daquele IP (ou falha com TimeoutError no prazo).
+    """
+
+    def __init__(self):
+        self._sock = None
+        self._lock = threading.Lock()
+        self._pending = {}  # ip -> deque[(future, deadline, match)]
+        self._task = None
+
+    def _ensure_started(self):
+        if self._task and self._task.is_alive():
+            return
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+        sock.bind(('', 0))
+        sock.setblocking(False)
+        self._sock = sock
+        self._task = SUPERVISOR.spawn("ElegooUDP", self._run)
+
+    def request(self, addr, message, timeout=1.5, match=None):
+        """Envia `message` para `addr` e devolve um Future com o JSON da resposta.
+
+        `addr` é (IP, porta), já resolvido: as respostas são casadas pelo IP de
+        origem. `match(payload)` permite ignorar respostas que não pertencem a
+        este pedido (ex.: o ack de um M25 chegando enquanto um M99999 espera).
+        """
+        fut = Future()
+        fut.set_running_or_notify_cancel()
+        ip = addr[0]
+        with self._lock:
+            self._ensure_started()
+            self._pending.setdefault(ip, deque()).append((fut, time.monotonic() + timeout, match))
+            try:
+                self._sock.sendto(message.encode(), (ip, addr[1]))
+            except OSError as e:
+                self._pending[ip].pop()
+                fut.set_exception(e)
+        return fut
+
+    def _expire(self, now):
+        expired = []
+        next_deadline = None
+        with self._lock:
+            for ip in list(self._pending):
+                q = self._pending[ip]
+                # Prazos diferentes na mesma fila (poll 1.5 s atrás de um comando de 10 s): olha todos
+                late = [item for item in q if item[1] <= now]
+                for item in late:
+                    q.remove(item)
+                    expired.append(item[0])
+                if not q:
+                    del self._pending[ip]
+                    continue
+                dl = min(item[1] for item in q)
+                next_deadline = dl if next_deadline is None else min(next_deadline, dl)
+        for fut in expired:
+            if not fut.done():
+                fut.set_exception(TimeoutError())
+        return next_deadline
+
+    def _resolve(self, ip, payload):
+        target = None
+        with self._lock:
+            q = self._pending.get(ip)
+            if not q:
+                return
+            for item in q:
+                if item[2] is None or item[2](payload):
+                    target = item
+                    break
+            if target is None:
+                return
+            q.remove(target)
+            if not q:
+                del self._pending[ip]
+        if not target[0].done():
+            target[0].set_result(payload)
+
+    def _run(self):
+        while not cancelled():
+            heartbeat()
+            now = time.monotonic()
+            next_deadline = self._expire(now)
+            wait = 0.5 if next_deadline is None else max(0.0, min(0.5, next_deadline - now))
+            try:
+                ready, _, _ = select.select([self._sock], [], [], wait)
+            except (OSError, ValueError) as e:
+                log_error(f"Elegoo UDP select error: {e}")
+                time.sleep(1)
+                continue
+            if not ready:
+                continue
+            while True:
+                try:
+                    data, (ip, _) = self._sock.recvfrom(65535)
+                except (BlockingIOError, InterruptedError):
+                    break
+                except OSError as e:
+                    log_debug(f"Elegoo UDP recv error: {e}")
+                    break
+                try:
+                    payload = json.loads(data.decode())
+                except ValueError:
+                    payload = data.decode(errors='ignore')
+                self._resolve(ip, payload)
+
+
+# Instância global usada por todos os ElegooPrinter
+ELEGOO_UDP = ElegooUDPMux()
+
+
+class ElegooSDCPClient:
+    """Cliente SDCP (WebSocket na porta 3030) para firmwares Elegoo mais novos.
+
+    A impressora empurra mensagens em `sdcp/status/<MainboardID>` sempre que o
+    estado muda; `on_status` recebe o dicionário `Status` de cada push. Em caso
+    de queda, reconecta com backoff exponencial até `stop()`.
+    """
+    CMD_STATUS = 0
+    CMD_ATTRIBUTES = 1
+    CMD_PAUSE = 129
+    CMD_STOP = 130
+    CMD_RESUME = 131
+    CMD_PUSH_PERIOD = 512
+
+    available = websocket is not None
+
+    def __init__(self, ip, on_status, mainboard_id='', push_period_ms=1000, group=None):
+        self.ip = ip
+        self.group = group
+        self.on_status = on_status
+        self.mainboard_id = mainboard_id
+        self.push_period_ms = push_period_ms
+        self.connected = False
+        self.last_push = 0
+        self.last_heartbeat = 0
+        self.failures = 0
+        self._ws = None
+        self._task = None
+        self._stop_event = threading.Event()
+        self._acks = {}  # RequestID -> (Future, prazo)
+
+    def start(self):
+        if not self.available or (self._task and self._task.is_alive() and not self._task.cancelled):
+            return
+        # Evento novo a cada start: uma thread antiga ainda encerrando não é "ressuscitada"
+        self._stop_event = threading.Event()
+        self._task = SUPERVISOR.spawn(f"ElegooSDCP-{self.ip}", self._run, self._stop_event,
+                                      group=self.group, on_cancel=self._stop_event.set)
+
+    def stop(self):
+        self._stop_event.set()
+        ws, self._ws = self._ws, None
+        if ws:
+            # Não esperar o close frame da impressora: o join abaixo tem prazo curto
+            try: ws.close(timeout=0.2)
+            except: pass
+        self.connected = False
+        self._expire_acks(float('inf'))
+        if self._task:
+            self._task.cancel()
+            self._task.join(1.5)
+
+    def _run(self, stop_event):
+        host = self.ip.split(':')[0]
+        while not stop_event.is_set():
+            heartbeat()
+            ws = websocket.WebSocketApp(
+                f"ws://{host}:{SDCP_PORT}/websocket",
+                on_open=self._on_open,
+                on_message=self._on_message,
+                on_close=self._on_close,
+                on_error=lambda ws, e: log_debug(f"[{self.ip}] SDCP erro: {e}"),
+            )
+            if stop_event.is_set():
+                break
+            self._ws = ws
+            try:
+                # ping_timeout limita o select interno: o stop() é atendido em ~1 s
+                ws.run_forever(ping_interval=0, ping_timeout=1)
+            except Exception as e:
+                log_debug(f"[{self.ip}] SDCP run_forever: {e}")
+            if stop_event.is_set():
+                break
+            self.connected = False
+            self.failures += 1
+            # Firmware legado não fala SDCP: espaçar as tentativas até 5 min
+            backoff = min(300, 5 * (2 ** min(self.failures - 1, 6)))
+            if stop_event.wait(backoff):
+                break
+
+    def _on_open(self, ws):
+        if ws is not self._ws:
+            return  # conexão de um start() anterior, já descartada
+        self.connected = True
+        self.failures = 0
+        self.last_heartbeat = time.time()
+        log_info(f"[{self.ip}] SDCP conectado (push de status ativo)")
+        self.request(self.CMD_ATTRIBUTES)
+        self.request(self.CMD_STATUS)
+        self.request(self.CMD_PUSH_PERIOD, {"TimePeriod": self.push_period_ms})
+
+    def _on_close(self, ws, code=None, reason=None):
+        if ws is not self._ws:
+            return
+        if self.connected:
+            log_debug(f"[{self.ip}] SDCP desconectado ({code})")
+        self.connected = False
+
+    def _on_message(self, ws, message):
+        if message == 'pong' or ws is not self._ws:
+            return
+        try:
+            data = json.loads(message)
+        except ValueError:
+            return
+        if not self.mainboard_id:
+            self.mainboard_id = data.get('MainboardID') or data.get('Data', {}).get('MainboardID', '')
+        topic = data.get('Topic', '')
+        if topic.startswith('sdcp/response/') and self._acks:
+            self._resolve_ack(data.get('Data', {}))
+            return
+        if 'Status' in data and (not topic or topic.startswith('sdcp/status/')):
+            self.last_push = time.time()
+            heartbeat()
+            try:
+                self.on_status(data['Status'])
+            except Exception as e:
+                log_error(f"[{self.ip}] Erro ao aplicar status SDCP: {e}")
+
+    def request(self, cmd, data=None, request_id=None):
+        ws = self._ws
+        if not self.connected or not ws:
+            return False
+        msg = {
+            "Id": uuid.uuid4().hex,
+            "Data": {
+                "Cmd": cmd,
+                "Data": data or {},
+                "RequestID": request_id or uuid.uuid4().hex,
+                "MainboardID": self.mainboard_id,
+                "TimeStamp": int(time.time()),
+                "From": 0,
+            },
+            "Topic": f"sdcp/request/{self.mainboard_id}",
+        }
+        try:
+            ws.send(json.dumps(msg))
+            return True
+        except Exception as e:
+            log_debug(f"[{self.ip}] SDCP envio falhou: {e}")
+            return False
+
+    def request_ack(self, cmd, data=None, timeout=10):
+        """Como `request`, mas devolve um Future resolvido pela resposta
+        (`sdcp/response/...` com o mesmo RequestID), ou None se não enviou."""
+        self._expire_acks(time.monotonic())
+        request_id = uuid.uuid4().hex
+        fut = Future()
+        fut.set_running_or_notify_cancel()
+        self._acks[request_id] = (fut, time.monotonic() + timeout)
+        if not self.request(cmd, data, request_id=request_id):
+            self._acks.pop(request_id, None)
+            return None
+        return fut
+
+    def _resolve_ack(self, payload):
+        entry = self._acks.pop(payload.get('RequestID', ''), None)
+        if entry is None or entry[0].done():
+            return
+        result = payload.get('Data', {})
+        ack = result.get('Ack', 0) if isinstance(result, dict) else 0
+        if ack == 0:
+            entry[0].set_result(result)
+        else:
+            entry[0].set_exception(RuntimeError(f"SDCP Ack={ack}"))
+
+    def _expire_acks(self, now):
+        for request_id, (fut, deadline) in list(self._acks.items()):
+            if deadline <= now:
+                self._acks.pop(request_id, None)
+                if not fut.done():
+                    fut.set_exception(TimeoutError())
+
+    def heartbeat(self):
+        """Texto 'ping' periódico exigido pelo SDCP para manter a sessão."""
+        ws = self._ws
+        if not self.connected or not ws:
+            return
+        try:
+            ws.send('ping')
+            self.last_heartbeat = time.time()
+        except Exception:
+            pass
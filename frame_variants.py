@@ -0,0 +1,90 @@
+import io
+import threading
+from logger_config import log_warn, log_debug
+
+try:
+    from PIL import Image  # opcional: sem Pillow todos os tamanhos devolvem o frame original
+except ImportError:
+    Image = None
+
+# Escada de resoluções (caixa máxima). As câmeras Bambu mandam 1920x1080 / 1280x720:
+# 1/4 e 1/2 caem direto nas escalas de decodificação do JPEG (draft), sem IDCT completo.
+FRAME_SIZES = {
+    'thumb': (480, 270),
+    'medium': (960, 540),
+    'full': None,
+}
+JPEG_QUALITY = {'thumb': 70, 'medium': 80}
+
+
+def scale_jpeg(data, box, quality=75):
+    """Reduz um JPEG para caber em `box`. Retorna o original se já couber ou se falhar."""
+    if Image is None:
+        return data
+    try:
+        img = Image.open(io.BytesIO(data))
+        if img.width <= box[0] and img.height <= box[1]:
+            return data
+        # Decodifica já reduzido (1/2, 1/4, 1/8) e termina com um resize pequeno
+        img.draft('RGB', box)
+        img = img.convert('RGB')
+        img.thumbnail(box, Image.BILINEAR)
+        out = io.BytesIO()
+        img.save(out, 'JPEG', quality=quality)
+        return out.getvalue()
+    except Exception as e:
+        log_debug(f"Erro ao redimensionar frame: {e}")
+        return data
+
+
+class FrameVariants:
+    """Variantes reduzidas do último frame de cada impressora, geradas uma única vez.
+
+    `get(chave, frame, tamanho)` devolve a variante pedida do `frame`; enquanto o
+    frame for o mesmo (mesmo objeto ou mesmos bytes) todos os consumidores
+    (tiles do dashboard, streams MJPEG, upload da nuvem) recebem o resultado
+    em cache. A conversão acontece sob um lock por impressora, então pedidos
+    simultâneos não decodificam o mesmo frame duas vezes.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self._entries = {}      # chave -> [frame de origem, {tamanho: bytes}, lock]
+        self.transcoded = 0
+        self.hits = 0
+        self._warned = False
+
+    def get(self, key, frame, size='full'):
+        if not frame or size == 'full' or size not in FRAME_SIZES:
+            return frame
+        if Image is None:
+            if not self._warned:
+                self._warned = True
+                log_warn("Pillow não instalado: câmera servida sempre em resolução cheia")
+            return frame
+        with self.lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = [None, {}, threading.Lock()]
+        with entry[2]:
+            if entry[0] is not frame and entry[0] != frame:
+                entry[0], entry[1] = frame, {}
+            variant = entry[1].get(size)
+            if variant is None:
+                variant = entry[1][size] = scale_jpeg(frame, FRAME_SIZES[size], JPEG_QUALITY[size])
+                self.transcoded += 1
+            else:
+                self.hits += 1
+            return variant
+
+    def forget(self, key):
+        with self.lock:
+            self._entries.pop(key, None)
+
+    def stats(self):
+        return {'pillow': Image is not None, 'printers': len(self._entries),
+                'transcoded': self.transcoded, 'hits': self.hits}
+
+
+# Instância global usada pelo app (endpoints de câmera e upload da nuvem)
+FRAME_VARIANTS = FrameVariants()
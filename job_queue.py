@@ -0,0 +1,452 @@
+import heapq
+import itertools
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from logger_config import log_info, log_warn, log_error
+from command_queue import COMMANDS
+from uploads import UPLOADS, COPY_BUFFER
+
+JOBS_DIR = 'jobs'
+JOBS_FILE = os.path.join(JOBS_DIR, 'jobs.json')
+MAX_ATTEMPTS = 3            # falhas de envio/início antes de o job ficar 'failed'
+RETRY_COOLDOWN = 60         # impressora que falhou um envio fica fora do despacho por N s
+START_TIMEOUT = 300         # início enviado e a impressora não começou: falha
+KEEP_FINISHED = 200
+
+READY_STATES = ('idle', 'standby', 'ready')
+PRINTING_STATES = ('printing', 'running', 'prepare', 'slicing', 'paused', 'pause')
+FINISHED_STATES = ('complete', 'finish', 'success')
+# Parada, mas com peça (ou restos) na mesa: só recebe job depois de `mark_ready`
+AFTER_PRINT_STATES = FINISHED_STATES + ('cancelled', 'failed')
+ACTIVE_JOB_STATES = ('dispatching', 'started', 'printing')
+
+ANY = '*'
+
+
+def printer_filaments(printer, status):
+    """Materiais carregados: bandejas do AMS (Bambu) ou o `filament` do config."""
+    loaded = {str(t.get('type', '')).upper() for t in status.get('ams') or []
+              if t.get('type') and not t.get('empty')}
+    configured = printer.config.get('filament') or []
+    if isinstance(configured, str):
+        configured = configured.split(',')
+    loaded.update(str(f).strip().upper() for f in configured if str(f).strip())
+    return loaded
+
+
+def capability_keys(printer_type, tags, filaments):
+    """Todas as chaves (tipo, tag, filamento) que uma impressora atende; `*` = sem exigência."""
+    return frozenset(itertools.product(
+        (printer_type, ANY),
+        {t.lower() for t in tags} | {ANY},
+        set(filaments) | {ANY}))
+
+
+def requirement_key(job):
+    return ((job['printer_type'] or ANY).lower(), (job['tag'] or ANY).lower(), job['filament'] or ANY)
+
+
+class _LazyHeapIndex:
+    """Heaps por chave com remoção preguiçosa.
+
+    Um item é inserido sob várias chaves; `discard` só invalida a versão, e as
+    entradas velhas saem do topo quando aparecem. Inserção, remoção e consulta
+    do melhor item de uma chave custam O(log n).
+    """
+
+    def __init__(self):
+        self._heaps = {}
+        self._live = {}     # item -> versão válida
+        self._version = itertools.count(1)
+
+    def __contains__(self, item):
+        return item in self._live
+
+    def __len__(self):
+        return len(self._live)
+
+    def add(self, item, keys, rank):
+        version = next(self._version)
+        self._live[item] = version
+        for key in keys:
+            heap = self._heaps.setdefault(key, [])
+            heapq.heappush(heap, (rank, version, item))
+            if len(heap) > 64 and len(heap) > 4 * len(self._live):
+                self._compact(key)
+
+    def discard(self, item):
+        self._live.pop(item, None)
+
+    def peek(self, key):
+        """(rank, item) do melhor item válido da chave, ou None."""
+        heap = self._heaps.get(key)
+        while heap:
+            rank, version, item = heap[0]
+            if self._live.get(item) == version:
+                return rank, item
+            heapq.heappop(heap)
+        return None
+
+    def _compact(self, key):
+        heap = [e for e in self._heaps[key] if self._live.get(e[2]) == e[1]]
+        heapq.heapify(heap)
+        self._heaps[key] = heap
+
+
+class JobQueue:
+    """Fila de impressão da fazenda com despacho automático para impressoras livres.
+
+    Jobs (arquivo + exigências de tipo, tag e filamento + prioridade) ficam em
+    `jobs/` e sobrevivem a reinícios. Só participam impressoras com
+    `job_queue: true` no config que aceitam upload.
+
+    O despacho reage a eventos: `observe` (chamado a cada atualização de status)
+    detecta quando uma impressora fica livre ou termina um job, e `submit`
+    tenta despachar o job novo na hora. Impressoras livres ficam num índice por
+    capacidade e jobs na fila num índice por exigência, os dois heaps: casar um
+    job novo é O(log n) e uma impressora livre consulta só as poucas chaves que
+    atende, sem varrer a frota nem a fila.
+
+    Depois de um job (ou de uma impressão feita fora da fila), a impressora só
+    volta a receber outro quando alguém confirma que a mesa foi liberada
+    (`mark_ready`).
+    """
+
+    def __init__(self, directory=JOBS_DIR):
+        self.directory = directory
+        self.path = os.path.join(directory, 'jobs.json')
+        self.lock = threading.RLock()
+        self.jobs = {}
+        self._printers = {}             # printer_id -> estado do despacho
+        self._idle = _LazyHeapIndex()   # impressoras livres, por capacidade
+        self._queued = _LazyHeapIndex() # jobs na fila, por exigência
+        self._seq = itertools.count()
+        self._loaded = False
+
+    # --- Persistência ---------------------------------------------------------
+    def load(self):
+        with self.lock:
+            if self._loaded:
+                return
+            self._loaded = True
+            try:
+                with open(self.path, 'r') as f:
+                    data = json.load(f)
+            except FileNotFoundError:
+                return
+            except (ValueError, OSError) as e:
+                log_error(f"[Jobs] Falha ao ler {self.path}: {e}")
+                return
+            for pid, info in data.get('printers', {}).items():
+                self._printers[pid] = self._new_printer_state(needs_clear=info.get('needs_clear', False))
+            for job in data.get('jobs', []):
+                if job['state'] == 'dispatching':
+                    job['state'] = 'queued'  # envio interrompido pelo reinício
+                self.jobs[job['id']] = job
+                if job['state'] == 'queued':
+                    self._queued.add(job['id'], [requirement_key(job)], self._job_rank(job))
+                elif job['state'] in ACTIVE_JOB_STATES:
+                    # Continua acompanhando o job na impressora em que estava
+                    self._printers.setdefault(job['printer_id'], self._new_printer_state())['job'] = job['id']
+            log_info(f"[Jobs] {len(self._queued)} jobs na fila")
+
+    def _save(self):
+        os.makedirs(self.directory, exist_ok=True)
+        data = {
+            'jobs': sorted(self.jobs.values(), key=lambda j: j['created_at']),
+            'printers': {pid: {'needs_clear': True} for pid, st in self._printers.items() if st['needs_clear']},
+        }
+        tmp = self.path + '.tmp'
+        try:
+            with open(tmp, 'w') as f:
+                json.dump(data, f, indent=1)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            log_error(f"[Jobs] Falha ao salvar a fila: {e}")
+
+    # --- API ------------------------------------------------------------------
+    def submit(self, source, filename, printer_type=None, tag=None, filament=None, priority=0, options=None):
+        """Guarda o arquivo em `jobs/` e enfileira. Despacha na hora se houver impressora livre."""
+        job_id = uuid.uuid4().hex[:12]
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"{job_id}_{filename}")
+        with open(path, 'wb') as out:
+            shutil.copyfileobj(source, out, COPY_BUFFER)
+        job = {
+            'id': job_id,
+            'filename': filename,
+            'file': path,
+            'size': os.path.getsize(path),
+            'printer_type': printer_type.lower() if printer_type else None,
+            'tag': tag or None,
+            'filament': filament.upper() if filament else None,
+            'priority': int(priority or 0),
+            'options': dict(options or {}),
+            'state': 'queued',
+            'printer_id': None,
+            'upload_id': None,
+            'command_id': None,
+            'attempts': 0,
+            'error': None,
+            'created_at': time.time(),
+            'started_at': None,
+            'finished_at': None,
+        }
+        with self.lock:
+            self.jobs[job_id] = job
+            self._enqueue(job)
+            self._trim()
+            self._save()
+            assignment = self._match_job(job)
+        log_info(f"[Jobs] Job {job_id} ({filename}) na fila, prioridade {job['priority']}")
+        self._dispatch(assignment)
+        return self.get(job_id)
+
+    def get(self, job_id):
+        with self.lock:
+            job = self.jobs.get(job_id)
+            return dict(job) if job else None
+
+    def list(self, states=None):
+        with self.lock:
+            jobs = [dict(j) for j in self.jobs.values() if not states or j['state'] in states]
+        # Fila primeiro, na ordem em que seriam despachados
+        jobs.sort(key=lambda j: (j['state'] != 'queued', -j['priority'], j['created_at']))
+        return jobs
+
+    def update(self, job_id, priority=None, requeue=False):
+        """Muda a prioridade ou devolve à fila um job que falhou. Retorna (job, erro)."""
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return None, 'Job not found'
+            if requeue:
+                if job['state'] != 'failed':
+                    return None, f"Job em estado '{job['state']}' não pode voltar à fila"
+                if not os.path.exists(job['file']):
+                    return None, 'Arquivo do job não existe mais'
+                job.update(state='queued', attempts=0, error=None, printer_id=None, finished_at=None)
+            if priority is not None:
+                job['priority'] = int(priority)
+            if job['state'] == 'queued':
+                self._enqueue(job)  # nova versão no índice com a prioridade atual
+            self._save()
+            assignment = self._match_job(job) if job['state'] == 'queued' else None
+        self._dispatch(assignment)
+        return self.get(job_id), None
+
+    def cancel(self, job_id):
+        """Remove um job que não está em andamento (e o arquivo). Retorna erro ou None."""
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return 'Job not found'
+            if job['state'] in ACTIVE_JOB_STATES:
+                return f"Job em andamento ({job['state']}): cancele a impressão na impressora"
+            self._queued.discard(job_id)
+            del self.jobs[job_id]
+            self._remove_file(job)
+            self._save()
+        return None
+
+    def mark_ready(self, printer_id):
+        """Mesa liberada: a impressora volta a receber jobs."""
+        with self.lock:
+            state = self._printers.setdefault(printer_id, self._new_printer_state())
+            state['needs_clear'] = False
+            state['cooldown_until'] = 0
+            self._save()
+
+    def printers(self):
+        with self.lock:
+            return {pid: {'available': pid in self._idle, 'job': st['job'], 'needs_clear': st['needs_clear'],
+                          'state': st['state'], 'filaments': sorted(st['filaments'])}
+                    for pid, st in self._printers.items()}
+
+    def forget_printer(self, printer_id):
+        with self.lock:
+            state = self._printers.pop(printer_id, None)
+            self._idle.discard(printer_id)
+            job = self.jobs.get(state['job']) if state and state['job'] else None
+            if job and job['state'] in ('dispatching', 'started'):
+                self._requeue(job, 'Impressora removida')
+            self._save()
+
+    # --- Eventos --------------------------------------------------------------
+    def observe(self, printer, status):
+        """Chamado a cada atualização de status. Barato quando nada mudou."""
+        pid = printer.config.get('id')
+        enabled = (printer.config.get('job_queue', False) and printer.config.get('enabled', True)
+                   and printer.supports_upload)
+        state_name = str(status.get('state', '')).lower()
+        assignment = None
+        with self.lock:
+            st = self._printers.get(pid)
+            if st is None:
+                if not enabled:
+                    return
+                st = self._printers[pid] = self._new_printer_state()
+            previous, st['state'] = st['state'], state_name
+            changed = previous != state_name
+            job = self.jobs.get(st['job']) if st['job'] else None
+            if job is not None and (changed or job['state'] == 'started'):
+                self._track_job(job, st, state_name, previous)
+            elif job is None and changed and state_name in AFTER_PRINT_STATES and previous not in AFTER_PRINT_STATES:
+                st['needs_clear'] = True  # impressão de fora da fila (ou anterior ao Hub)
+                self._save()
+            available = (enabled and state_name in READY_STATES + AFTER_PRINT_STATES and st['job'] is None
+                         and not st['needs_clear'] and time.time() >= st['cooldown_until'])
+            if not available:
+                self._idle.discard(pid)
+                return
+            filaments = printer_filaments(printer, status)
+            keys = capability_keys(printer.type, printer.config.get('tags', []), filaments)
+            if pid in self._idle and keys == st['keys']:
+                return
+            st['keys'], st['filaments'], st['printer'] = keys, filaments, printer
+            # Mais tempo livre primeiro
+            self._idle.add(pid, keys, time.monotonic())
+            assignment = self._match_printer(pid)
+        self._dispatch(assignment)
+
+    def _track_job(self, job, st, state_name, previous):
+        if job['state'] == 'started':
+            if state_name in PRINTING_STATES:
+                job['state'] = 'printing'
+                self._save()
+                return
+            cmd = COMMANDS.get(job['command_id']) if job['command_id'] else None
+            if cmd and cmd['state'] in ('failed', 'timeout'):
+                self._requeue(job, f"Início falhou: {cmd['error']}", printer_state=st)
+            elif time.time() - (job['started_at'] or 0) > START_TIMEOUT:
+                self._requeue(job, 'A impressora não iniciou a impressão', printer_state=st)
+            return
+        if job['state'] == 'printing' and state_name not in PRINTING_STATES + ('offline', ''):
+            # Moonraker volta a 'standby' sem passar por 'complete'
+            ok = state_name in FINISHED_STATES or (state_name in READY_STATES and previous in PRINTING_STATES)
+            job['state'] = 'done' if ok else 'failed'
+            job['finished_at'] = time.time()
+            if ok:
+                self._remove_file(job)
+            else:
+                job['error'] = f"Impressão terminou em '{state_name}'"  # arquivo fica para reenfileirar
+            st['job'] = None
+            st['needs_clear'] = True
+            self._save()
+            log_info(f"[Jobs] Job {job['id']} ({job['filename']}) {job['state']} em {job['printer_id']}")
+
+    # --- Casamento ------------------------------------------------------------
+    def _match_job(self, job):
+        """Melhor impressora livre para um job (chamado com o lock)."""
+        best = self._idle.peek(requirement_key(job))
+        if best is None:
+            return None
+        return self._assign(job, best[1])
+
+    def _match_printer(self, pid):
+        """Melhor job da fila que a impressora atende (chamado com o lock)."""
+        st = self._printers[pid]
+        best = None
+        for key in st['keys']:
+            top = self._queued.peek(key)
+            if top is not None and (best is None or top[0] < best[0]):
+                best = top
+        if best is None:
+            return None
+        return self._assign(self.jobs[best[1]], pid)
+
+    def _assign(self, job, pid):
+        st = self._printers[pid]
+        self._queued.discard(job['id'])
+        self._idle.discard(pid)
+        st['job'] = job['id']
+        job.update(state='dispatching', printer_id=pid, error=None)
+        job['attempts'] += 1
+        self._save()
+        return job, st['printer']
+
+    def _dispatch(self, assignment):
+        # Fora do lock: o envio roda no pool do UPLOADS
+        if assignment is None:
+            return
+        job, printer = assignment
+        log_info(f"[Jobs] Job {job['id']} ({job['filename']}) -> {printer.name}")
+        try:
+            upload = UPLOADS.send(job['file'], job['filename'], [printer], start_print=True, options=job['options'],
+                                  on_done=lambda up, job_id=job['id']: self._on_upload(job_id, up))
+        except OSError as e:
+            with self.lock:
+                job.update(attempts=MAX_ATTEMPTS)  # arquivo sumiu: não adianta tentar de novo
+                self._requeue(job, f"Arquivo do job indisponível: {e}",
+                              printer_state=self._printers.get(job['printer_id']))
+            return
+        with self.lock:
+            job['upload_id'] = upload['id']
+
+    def _on_upload(self, job_id, upload):
+        target = upload['targets'][0]
+        assignment = None
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None or job['state'] != 'dispatching':
+                return
+            if target['state'] == 'done':
+                job.update(state='started', command_id=target['command_id'], started_at=time.time())
+                self._save()
+            else:
+                self._requeue(job, f"Envio falhou: {target['error']}",
+                              printer_state=self._printers.get(job['printer_id']))
+                if job['state'] == 'queued':
+                    assignment = self._match_job(job)  # outra impressora livre, se houver
+        self._dispatch(assignment)
+
+    def _requeue(self, job, error, printer_state=None):
+        if printer_state is not None:
+            printer_state['job'] = None
+            printer_state['cooldown_until'] = time.time() + RETRY_COOLDOWN
+        job['error'] = error
+        job['printer_id'] = None
+        if job['attempts'] >= MAX_ATTEMPTS:
+            job['state'] = 'failed'
+            job['finished_at'] = time.time()
+            log_warn(f"[Jobs] Job {job['id']} falhou após {job['attempts']} tentativas: {error}")
+        else:
+            self._enqueue(job)
+            log_warn(f"[Jobs] Job {job['id']} de volta à fila: {error}")
+        self._save()
+
+    # --- Internos -------------------------------------------------------------
+    def _enqueue(self, job):
+        job['state'] = 'queued'
+        self._queued.add(job['id'], [requirement_key(job)], self._job_rank(job))
+
+    def _job_rank(self, job):
+        # Maior prioridade primeiro; empate: mais antigo primeiro
+        return (-job['priority'], job['created_at'], next(self._seq))
+
+    @staticmethod
+    def _new_printer_state(needs_clear=False):
+        return {'state': None, 'job': None, 'needs_clear': needs_clear, 'cooldown_until': 0,
+                'keys': frozenset(), 'filaments': set(), 'printer': None}
+
+    @staticmethod
+    def _remove_file(job):
+        try:
+            os.remove(job['file'])
+        except OSError:
+            pass
+
+    def _trim(self):
+        finished = sorted((j for j in self.jobs.values() if j['state'] in ('done', 'failed')),
+                          key=lambda j: j['finished_at'] or 0)
+        for job in finished[:max(0, len(finished) - KEEP_FINISHED)]:
+            self._remove_file(job)
+            del self.jobs[job['id']]
+
+
+# Instância global usada pelo app
+JOBS = JobQueue()
@@ -0,0 +1,156 @@
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import deque
+
+_SOURCE_RE = re.compile(r'^\s*\[([^\]]+)\]')
+
+
+class LogStore:
+    """Buffer circular de tamanho fixo para as linhas do console web.
+
+    Os ids são sequenciais, então a posição de um id no anel é aritmética
+    (`(id - 1) % capacidade`): `since(last_id)` vai direto ao primeiro item novo
+    sem varrer o buffer. Cada entrada guarda também a "origem" (o primeiro
+    `[...]` da mensagem, normalmente IP ou nome da impressora) para o filtro
+    por impressora.
+
+    Com `history_file`, as linhas também vão para disco em JSON Lines, com
+    rotação em `max_bytes` e `backups` arquivos antigos (`.1`, `.2`...).
+    """
+
+    def __init__(self, capacity=500, history_file=None, max_bytes=1024 * 1024, backups=3):
+        self.capacity = capacity
+        self.lock = threading.Lock()
+        self._ring = [None] * capacity
+        self._next_id = 1
+        self.history_file = history_file
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self._history = None
+
+    @property
+    def last_id(self):
+        return self._next_id - 1
+
+    def append(self, level, message):
+        message = str(message)
+        match = _SOURCE_RE.match(message)
+        now = time.time()
+        with self.lock:
+            entry = {
+                'id': self._next_id,
+                'ts': now,
+                'time': time.strftime('%H:%M:%S', time.localtime(now)),
+                'level': level,
+                'message': message,
+                'source': match.group(1) if match else '',
+            }
+            self._ring[(self._next_id - 1) % self.capacity] = entry
+            self._next_id += 1
+            if self.history_file:
+                self._write_history(entry)
+        return entry
+
+    def since(self, last_id=0, levels=None, sources=None, text=None, limit=None):
+        """Entradas com id > `last_id`, opcionalmente filtradas.
+
+        `levels` e `sources` são conjuntos (comparação exata, sem caixa);
+        `text` é busca por substring, sem caixa.
+        """
+        with self.lock:
+            first = max(1, self._next_id - self.capacity)
+            start = max(last_id + 1, first)
+            entries = [self._ring[(i - 1) % self.capacity] for i in range(start, self._next_id)]
+        return self._filter(entries, levels, sources, text, limit)
+
+    @staticmethod
+    def _filter(entries, levels=None, sources=None, text=None, limit=None):
+        if levels:
+            entries = [e for e in entries if e['level'] in levels]
+        if sources:
+            entries = [e for e in entries if e['source'].lower() in sources]
+        if text:
+            text = text.lower()
+            entries = [e for e in entries if text in e['message'].lower()]
+        if limit:
+            entries = entries[-limit:]
+        return entries
+
+    # --- Histórico em disco --------------------------------------------------
+    def _write_history(self, entry):
+        try:
+            if self._history is None:
+                self._history = open(self.history_file, 'a', encoding='utf-8')
+            self._history.write(json.dumps(entry, ensure_ascii=False) + '\n')
+            self._history.flush()
+            if self._history.tell() >= self.max_bytes:
+                self._rotate()
+        except OSError:
+            pass  # histórico em disco é opcional: nunca derruba quem loga
+
+    def _rotate(self):
+        self._history.close()
+        self._history = None
+        for i in range(self.backups - 1, 0, -1):
+            src = f"{self.history_file}.{i}"
+            if os.path.exists(src):
+                os.replace(src, f"{self.history_file}.{i + 1}")
+        if self.backups:
+            os.replace(self.history_file, f"{self.history_file}.1")
+        else:
+            os.remove(self.history_file)
+
+    def history(self, before=None, levels=None, sources=None, text=None, limit=200):
+        """Últimas `limit` entradas do disco anteriores ao timestamp `before`, em ordem.
+
+        Usa o timestamp e não o id porque os ids recomeçam a cada execução.
+        """
+        if not self.history_file:
+            return []
+        files = [f"{self.history_file}.{i}" for i in range(self.backups, 0, -1)] + [self.history_file]
+        tail = deque(maxlen=limit)
+        # Leitura fora do lock: uma rotação no meio só faz pular/repetir linhas
+        for path in files:
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    for line in f:
+                        try:
+                            entry = json.loads(line)
+                        except ValueError:
+                            continue
+                        if before is not None and entry.get('ts', 0) >= before:
+                            continue
+                        if self._filter([entry], levels, sources, text):
+                            tail.append(entry)
+            except OSError:
+                continue
+        return list(tail)
+
+
+_CONSOLE_LEVELS = {'WARNING': 'WARN', 'CRITICAL': 'ERROR'}
+
+
+class ConsoleLogHandler(logging.Handler):
+    """Handler do pipeline de log (thread do listener) que alimenta um `LogStore`.
+
+    Só aceita registros do logger `logger_name`; `console_level` no `extra`
+    troca o nível exibido (ex.: CLOUD).
+    """
+
+    def __init__(self, store, logger_name="Hub.console"):
+        super().__init__()
+        self.store = store
+        self.logger_name = logger_name
+
+    def emit(self, record):
+        if record.name != self.logger_name:
+            return
+        level = getattr(record, 'console_level', None) or _CONSOLE_LEVELS.get(record.levelname, record.levelname)
+        message = record.getMessage()
+        if level == 'CLOUD' and message.startswith('[Cloud] '):
+            message = message[len('[Cloud] '):]
+        self.store.append(level, message)
@@ -1,6 +1,13 @@
-
 import logging
+import logging.handlers
 import argparse
+import atexit
+import collections
+import copy
+import queue
+import re
+import threading
+import time
 
 # Configuração Padrão
 LOG_LEVEL_MAP = {
@@ -12,30 +19,234 @@ LOG_LEVEL_MAP = {
     5: logging.NOTSET  # Ver tudo
 }
 
+LOG_QUEUE_SIZE = 5000      # linhas em trânsito; cheia = descarta (nunca bloqueia quem loga)
+RATE_PER_SOURCE = 20       # linhas/s por origem ([ip] da impressora ou nome do logger)
+BURST_PER_SOURCE = 100
+COLLAPSE_WINDOW = 10       # repetições idênticas são resumidas a cada N segundos
+
+_SOURCE_RE = re.compile(r'^\s*\[([^\]]+)\]')
+
+
+def _record_source(message, record):
+    match = _SOURCE_RE.match(message)
+    return match.group(1) if match else record.name
+
+
+class _LogQueue:
+    """Fila limitada para o QueueHandler/QueueListener.
+
+    `put_nowait` levanta `queue.Full` em vez de esperar. `get` acorda a cada
+    segundo com `_TICK` mesmo sem linhas, para o listener soltar os resumos de
+    repetição pendentes. Sem `task_done`: ninguém faz `join` nela.
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._items = collections.deque()
+        self._cond = threading.Condition(threading.Lock())
+
+    def put_nowait(self, item):
+        with self._cond:
+            if len(self._items) >= self.maxsize and item is not _SENTINEL:
+                raise queue.Full
+            self._items.append(item)
+            self._cond.notify()
+
+    def get(self, block=True, timeout=1.0):
+        with self._cond:
+            if not self._items and block:
+                self._cond.wait(timeout)
+            return self._items.popleft() if self._items else _TICK
+
+    def qsize(self):
+        return len(self._items)
+
+
+_SENTINEL = None   # QueueListener._sentinel
+_TICK = logging.makeLogRecord({'msg': '<tick>'})
+
+
+class RateLimitedQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler que nunca bloqueia: token bucket por origem e descarte com fila cheia.
+
+    Roda na thread de quem loga, então só faz contas: a formatação final e a
+    escrita acontecem na thread do listener.
+    """
+
+    def __init__(self, log_queue, rate=RATE_PER_SOURCE, burst=BURST_PER_SOURCE):
+        super().__init__(log_queue)
+        self.rate = rate
+        self.burst = burst
+        self._buckets = {}      # (origem, grave?) -> [tokens, último refill, suprimidas, última mensagem]
+        self.dropped = 0        # fila cheia
+        self.limited = 0        # token bucket
+
+    def _allow(self, key, message, now):
+        # Chamado dentro de emit(), já sob o lock do próprio Handler
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            if len(self._buckets) > 1000:
+                self._buckets.clear()
+            bucket = self._buckets[key] = [self.burst, now, 0, None]
+        if message == bucket[3]:
+            # Repetição exata não gasta token: o listener resume e conta todas
+            return True, 0
+        bucket[3] = message
+        bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+        bucket[1] = now
+        if bucket[0] < 1:
+            bucket[2] += 1
+            self.limited += 1
+            return False, 0
+        bucket[0] -= 1
+        suppressed, bucket[2] = bucket[2], 0
+        return True, suppressed
+
+    def emit(self, record):
+        try:
+            message = record.getMessage()
+            source = _record_source(message, record)
+            # Avisos e erros têm balde próprio: rajada de DEBUG não os esconde
+            key = (source, record.levelno >= logging.WARNING)
+            allowed, suppressed = self._allow(key, message, time.monotonic())
+            if not allowed:
+                return
+            record = self.prepare(record)
+            record.source = source
+            if suppressed:
+                record.msg = record.message = f"{record.msg} ({suppressed} linhas anteriores de [{source}] suprimidas pelo limite)"
+            self.enqueue(record)
+        except queue.Full:
+            self.dropped += 1
+        except Exception:
+            self.handleError(record)
+
+
+class CollapsingQueueListener(logging.handlers.QueueListener):
+    """Listener que resume repetições: a primeira linha sai, as idênticas seguintes
+    (mesma origem, nível e texto) viram um único "repetida N×" ao mudar a
+    mensagem ou a cada `COLLAPSE_WINDOW` segundos."""
+
+    def __init__(self, log_queue, *handlers, source_handler=None):
+        super().__init__(log_queue, *handlers, respect_handler_level=True)
+        self.source_handler = source_handler
+        self._last = {}         # origem -> [record, repetições, início]
+        self._last_drop_report = 0
+
+    def dequeue(self, block):
+        return self.queue.get(block)
+
+    def _flush(self, source, state):
+        record, count, _ = state
+        if count:
+            summary = copy.copy(record)
+            summary.msg = summary.message = f"{record.msg} [repetida {count}×]"
+            summary.args = None
+            super().handle(summary)
+
+    def _flush_expired(self, now):
+        for source, state in list(self._last.items()):
+            if now - state[2] >= COLLAPSE_WINDOW:
+                self._flush(source, state)
+                del self._last[source]
+        handler = self.source_handler
+        if handler is not None and handler.dropped != self._last_drop_report:
+            lost = handler.dropped - self._last_drop_report
+            self._last_drop_report = handler.dropped
+            super().handle(logging.makeLogRecord({
+                'name': 'Hub', 'levelno': logging.WARNING, 'levelname': 'WARNING',
+                'msg': f"[Log] Fila de log cheia: {lost} linhas descartadas"}))
+
+    def handle(self, record):
+        now = time.monotonic()
+        if record is _TICK:
+            return self._flush_expired(now)
+        source = getattr(record, 'source', record.name)
+        key = (record.levelno, record.msg)
+        state = self._last.get(source)
+        if state is not None and (state[0].levelno, state[0].msg) == key:
+            state[1] += 1
+            if now - state[2] >= COLLAPSE_WINDOW:
+                self._flush(source, state)
+                self._last[source] = [record, 0, now]
+            return
+        if state is not None:
+            self._flush(source, state)
+        self._last[source] = [record, 0, now]
+        super().handle(record)
+        if len(self._last) > 1000:
+            self._flush_expired(now + COLLAPSE_WINDOW)
+
+    def stop(self):
+        super().stop()
+        for source, state in list(self._last.items()):
+            self._flush(source, state)
+        self._last.clear()
+
+
 def setup_logger():
     parser = argparse.ArgumentParser(description="3D Printer Connection Hub")
-    parser.add_argument('--log-level', type=int, choices=range(0, 6), default=3, 
+    parser.add_argument('--log-level', type=int, choices=range(0, 6), default=3,
                         help="Nível de Log: 0=Critical, 1=Error, 2=Warning, 3=Info(Default), 4=Debug, 5=Trace(All)")
-    
+    parser.add_argument('--console-history', default=None,
+                        help="Arquivo (JSON Lines, com rotação) para guardar o histórico do console além das últimas 500 linhas")
+    parser.add_argument('--enable-profiler', action='store_true',
+                        help="Habilita /api/debug/profile (perfil por amostragem das threads)")
+
     # Parse just known args to avoid conflict with Flask reloader if any
     args, _ = parser.parse_known_args()
-    
+
     level = LOG_LEVEL_MAP.get(args.log_level, logging.INFO)
-    
-    logging.basicConfig(
-        level=level,
-        format='%(asctime)s [%(levelname)s] %(message)s',
-        datefmt='%H:%M:%S'
-    )
-    
+
+    # Quem loga só enfileira; formatação e escrita no stderr ficam na thread do listener
+    stream = logging.StreamHandler()
+    stream.setLevel(level)
+    stream.setFormatter(logging.Formatter('%(asctime)s [%(levelname)s] %(message)s', datefmt='%H:%M:%S'))
+    log_queue = _LogQueue(LOG_QUEUE_SIZE)
+    handler = RateLimitedQueueHandler(log_queue)
+    root = logging.getLogger()
+    for h in list(root.handlers):
+        root.removeHandler(h)
+    root.addHandler(handler)
+    root.setLevel(level)
+    listener = CollapsingQueueListener(log_queue, stream, source_handler=handler)
+    listener.start()
+    atexit.register(listener.stop)
+
     # Supress Flask/Werkzeug logs if level is below INFO (3)
     if args.log_level < 3:
         logging.getLogger('werkzeug').setLevel(logging.ERROR)
-    
+
     logger = logging.getLogger("Hub")
-    return logger
+    return logger, args, listener
+
+logger, LOG_ARGS, LOG_LISTENER = setup_logger()
+
+# O console web recebe tudo o que o app loga, inclusive DEBUG, independente do
+# --log-level (que vale para o stderr): logger próprio com nível fixo
+console_logger = logging.getLogger("Hub.console")
+console_logger.setLevel(logging.DEBUG)
+
+
+def add_log_handler(handler):
+    """Adiciona um handler executado na thread do listener (ex.: console web)."""
+    LOG_LISTENER.handlers = LOG_LISTENER.handlers + (handler,)
+
+
+def shutdown_logging():
+    """Esvazia a fila de log (antes de um os._exit, que pula o atexit)."""
+    try:
+        LOG_LISTENER.stop()
+    except Exception:
+        pass
+
+
+def log_stats():
+    handler = next((h for h in logging.getLogger().handlers if isinstance(h, RateLimitedQueueHandler)), None)
+    if handler is None:
+        return {}
+    return {'queued': handler.queue.qsize(), 'dropped': handler.dropped, 'rate_limited': handler.limited}
 
-logger = setup_logger()
 # Expor logging padrão para facilitar substituição de print
 def log_info(msg): logger.info(msg)
 def log_error(msg): logger.error(msg)
@@ -0,0 +1,115 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from logger_config import log_debug
+
+METADATA_CACHE_FILE = 'metadata_cache.json'
+THUMBNAIL_DIR = 'metadata_thumbs'
+
+
+class MetadataCache:
+    """Cache em disco dos metadados de impressão (peso, tempo estimado, placa, miniatura).
+
+    Chave: id da impressora + nome do arquivo. Cada entrada guarda a "impressão
+    digital" do arquivo (tamanho/mtime) para validar sem baixar nada: quem
+    consulta informa o que conseguiu medir (SIZE/MDTM no FTP, `file_size` do
+    Moonraker) e o cache só responde se bater. Miniaturas ficam em arquivos
+    separados, nomeados pelo hash do conteúdo.
+    """
+
+    def __init__(self, path=METADATA_CACHE_FILE, thumb_dir=THUMBNAIL_DIR, max_entries=500):
+        self.path = path
+        self.thumb_dir = thumb_dir
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self._entries = None
+
+    def _load(self):
+        if self._entries is None:
+            try:
+                with open(self.path, 'r') as f:
+                    self._entries = json.load(f)
+            except (IOError, ValueError):
+                self._entries = {}
+        return self._entries
+
+    def _save(self):
+        temp_file = self.path + '.tmp'
+        try:
+            with open(temp_file, 'w') as f:
+                json.dump(self._entries, f, indent=4)
+            os.replace(temp_file, self.path)
+        except Exception as e:
+            log_debug(f"Erro ao salvar cache de metadados: {e}")
+
+    @staticmethod
+    def _key(printer_id, filename):
+        return f"{printer_id}:{filename}"
+
+    def get(self, printer_id, filename, size=None, mtime=None):
+        """Retorna a entrada se existir e, quando informados, size/mtime coincidirem."""
+        with self.lock:
+            entry = self._load().get(self._key(printer_id, filename))
+            if not entry:
+                return None
+            if size is not None and entry.get('size') is not None and entry['size'] != size:
+                return None
+            if mtime and entry.get('mtime') and entry['mtime'] != mtime:
+                return None
+            entry['last_used'] = time.time()
+            return dict(entry)
+
+    def put(self, printer_id, filename, meta, size=None, mtime=None, thumbnail=None):
+        """Grava `meta` (weight, prediction, plate_index, thumb_url...) e a miniatura opcional."""
+        entry = dict(meta)
+        entry.update({'size': size, 'mtime': mtime, 'last_used': time.time()})
+        if thumbnail:
+            entry['thumb_hash'] = self._store_thumbnail(thumbnail)
+        with self.lock:
+            entries = self._load()
+            entries[self._key(printer_id, filename)] = entry
+            if len(entries) > self.max_entries:
+                self._evict(entries)
+            self._save()
+        return dict(entry)
+
+    def get_thumbnail(self, thumb_hash):
+        if not thumb_hash:
+            return None
+        try:
+            with open(os.path.join(self.thumb_dir, f"{thumb_hash}.png"), 'rb') as f:
+                return f.read()
+        except IOError:
+            return None
+
+    def _store_thumbnail(self, data):
+        thumb_hash = hashlib.sha1(data).hexdigest()
+        path = os.path.join(self.thumb_dir, f"{thumb_hash}.png")
+        if not os.path.exists(path):
+            try:
+                os.makedirs(self.thumb_dir, exist_ok=True)
+                with open(path + '.tmp', 'wb') as f:
+                    f.write(data)
+                os.replace(path + '.tmp', path)
+            except Exception as e:
+                log_debug(f"Erro ao salvar miniatura em cache: {e}")
+        return thumb_hash
+
+    def _evict(self, entries):
+        # Remove as menos usadas e as miniaturas que ficaram órfãs
+        by_age = sorted(entries, key=lambda k: entries[k].get('last_used', 0))
+        for key in by_age[:len(entries) - self.max_entries]:
+            del entries[key]
+        in_use = {e.get('thumb_hash') for e in entries.values()}
+        try:
+            for name in os.listdir(self.thumb_dir):
+                if name.endswith('.png') and name[:-4] not in in_use:
+                    os.remove(os.path.join(self.thumb_dir, name))
+        except OSError:
+            pass
+
+
+# Instância global usada pelos drivers
+METADATA_CACHE = MetadataCache()
@@ -0,0 +1,267 @@
+import queue
+import selectors
+import socket
+import ssl
+import threading
+import time
+import zlib
+from collections import deque
+from logger_config import log_info, log_debug, log_warn
+from supervisor import SUPERVISOR, heartbeat, cancelled
+
+
+class _Entry:
+    def __init__(self, client, name, on_message, group):
+        self.client = client
+        self.name = name
+        self.on_message = on_message
+        self.group = group
+        self.sock = None
+        self.events = 0
+        self.wanted = True          # False depois do detach: só falta fechar o socket
+        self.detach_deadline = 0
+        self.reconnecting = False
+        self.failures = 0
+        self.next_retry = 0
+        # Mensagens de uma mesma impressora sempre no mesmo worker (ordem preservada)
+        self.shard = zlib.crc32(name.encode())
+
+
+class MQTTReactor:
+    """Loop de rede único para todos os clientes MQTT (paho em modo "external loop").
+
+    Uma thread faz o select sobre os sockets de todos os clientes e chama
+    `loop_read`/`loop_write`/`loop_misc`. As mensagens recebidas não são
+    processadas nessa thread: vão para filas limitadas, uma por worker, e o
+    worker chama o `on_message` da impressora. Quedas de conexão são
+    reconectadas com backoff em tarefas curtas do supervisor, sem bloquear o
+    loop.
+    """
+
+    def __init__(self, workers=2, queue_size=500):
+        self.lock = threading.Lock()
+        self.sel = None
+        self.entries = {}
+        self._ops = deque()
+        self._wake_r = self._wake_w = None
+        self._task = None
+        self.queues = [queue.Queue(maxsize=queue_size) for _ in range(workers)]
+        self.dropped = 0
+        self.dispatched = 0
+
+    # --- API -----------------------------------------------------------------
+    def attach(self, client, name, on_message, group=None):
+        """Passa o `client` (ainda não conectado) para o reactor."""
+        self._ensure_started()
+        entry = _Entry(client, name, on_message, group)
+        client.on_socket_open = lambda c, u, sock: self._post('open', entry, sock)
+        client.on_socket_close = lambda c, u, sock: self._post('close', entry, sock)
+        client.on_socket_register_write = lambda c, u, sock: self._wake()
+        client.on_message = lambda c, u, msg: self._dispatch(entry, c, u, msg)
+        with self.lock:
+            self.entries[id(client)] = entry
+        return entry
+
+    def connect(self, client, host, port=1883, keepalive=60):
+        """Conexão inicial (bloqueante, na thread de quem chama). Em caso de falha
+        o reactor continua tentando sozinho, com backoff."""
+        entry = self.entries.get(id(client))
+        if entry is None:
+            raise ValueError("cliente não registrado no reactor")
+        entry.reconnecting = True
+        try:
+            client.connect(host, port, keepalive)
+            entry.failures = 0
+        except Exception:
+            entry.failures += 1
+            entry.next_retry = time.monotonic() + self._backoff(entry)
+            raise
+        finally:
+            entry.reconnecting = False
+
+    def detach(self, client):
+        with self.lock:
+            entry = self.entries.get(id(client))
+        if entry is None:
+            return
+        entry.wanted = False
+        entry.detach_deadline = time.monotonic() + 2
+        try:
+            client.disconnect()
+        except Exception:
+            pass
+        self._wake()
+
+    def stats(self):
+        with self.lock:
+            entries = list(self.entries.values())
+        return {
+            'clients': len(entries),
+            'connected': sum(1 for e in entries if e.sock is not None),
+            'queued': [q.qsize() for q in self.queues],
+            'dispatched': self.dispatched,
+            'dropped': self.dropped,
+        }
+
+    # --- Internos ------------------------------------------------------------
+    @staticmethod
+    def _backoff(entry):
+        return min(60, 2 ** min(entry.failures, 6))
+
+    def _ensure_started(self):
+        with self.lock:
+            if self._task and self._task.is_alive():
+                return
+            self.sel = selectors.DefaultSelector()
+            self._wake_r, self._wake_w = socket.socketpair()
+            self._wake_r.setblocking(False)
+            self._wake_w.setblocking(False)
+            self.sel.register(self._wake_r, selectors.EVENT_READ, None)
+            self._task = SUPERVISOR.spawn("MQTTReactor", self._run, on_cancel=self._wake)
+            for i, q in enumerate(self.queues):
+                SUPERVISOR.spawn(f"MQTTWorker-{i}", self._worker, i, restart='on_failure',
+                                 on_cancel=lambda q=q: self._stop_worker(q))
+
+    def _wake(self):
+        try:
+            self._wake_w.send(b'\0')
+        except (BlockingIOError, OSError, AttributeError):
+            pass
+
+    @staticmethod
+    def _stop_worker(q):
+        # Fila cheia: o worker está recebendo e vê o cancelamento no próximo get
+        try:
+            q.put_nowait(None)
+        except queue.Full:
+            pass
+
+    def _post(self, op, entry, sock):
+        self._ops.append((op, entry, sock))
+        self._wake()
+
+    def _dispatch(self, entry, client, userdata, msg):
+        try:
+            self.queues[entry.shard % len(self.queues)].put_nowait((entry, client, userdata, msg))
+        except queue.Full:
+            self.dropped += 1
+            if self.dropped % 100 == 1:
+                log_warn(f"[MQTT] Fila de mensagens cheia, descartando ({self.dropped} no total)")
+
+    def _worker(self, idx):
+        q = self.queues[idx]
+        while not cancelled():
+            try:
+                item = q.get(timeout=5)
+            except queue.Empty:
+                heartbeat()
+                continue
+            heartbeat()
+            if item is None:
+                continue  # sentinela do cancelamento
+            entry, client, userdata, msg = item
+            if not entry.wanted:
+                continue
+            try:
+                entry.on_message(client, userdata, msg)
+                self.dispatched += 1
+            except Exception as e:
+                log_debug(f"[MQTT] Erro ao processar mensagem de {entry.name}: {e}")
+
+    def _apply_ops(self):
+        while self._ops:
+            op, entry, sock = self._ops.popleft()
+            if op == 'open':
+                entry.sock = sock
+                entry.events = selectors.EVENT_READ
+                try:
+                    self.sel.register(sock, entry.events, entry)
+                except (KeyError, ValueError) as e:
+                    log_debug(f"[MQTT] Registro do socket de {entry.name} falhou: {e}")
+            elif op == 'close':
+                try:
+                    self.sel.unregister(sock)
+                except (KeyError, ValueError):
+                    pass
+                if entry.sock is sock:
+                    entry.sock = None
+                    entry.events = 0
+                    if entry.wanted:
+                        entry.next_retry = time.monotonic() + self._backoff(entry)
+
+    def _reconnect(self, entry):
+        try:
+            entry.client.reconnect()
+            entry.failures = 0
+            log_info(f"[MQTT] {entry.name} reconectado")
+        except Exception as e:
+            entry.failures += 1
+            entry.next_retry = time.monotonic() + self._backoff(entry)
+            log_debug(f"[MQTT] Reconexão de {entry.name} falhou: {e}")
+        finally:
+            entry.reconnecting = False
+
+    def _housekeeping(self, now):
+        with self.lock:
+            entries = list(self.entries.items())
+        for key, entry in entries:
+            if not entry.wanted:
+                if entry.sock is None or now > entry.detach_deadline:
+                    if entry.sock is not None:
+                        try: self.sel.unregister(entry.sock)
+                        except (KeyError, ValueError): pass
+                        try: entry.sock.close()
+                        except OSError: pass
+                    with self.lock:
+                        self.entries.pop(key, None)
+                continue
+            if entry.sock is not None:
+                entry.client.loop_misc()
+            elif not entry.reconnecting and now >= entry.next_retry:
+                entry.reconnecting = True
+                SUPERVISOR.spawn(f"MQTTReconnect-{entry.name}", self._reconnect, entry, group=entry.group)
+
+    def _run(self):
+        log_info("[MQTT] Reactor iniciado")
+        last_misc = 0
+        while not cancelled():
+            heartbeat()
+            self._apply_ops()
+            with self.lock:
+                entries = list(self.entries.values())
+            for entry in entries:
+                if entry.sock is None:
+                    continue
+                want = selectors.EVENT_READ | (selectors.EVENT_WRITE if entry.client.want_write() else 0)
+                if want != entry.events:
+                    try:
+                        self.sel.modify(entry.sock, want, entry)
+                        entry.events = want
+                    except (KeyError, ValueError):
+                        pass
+            for key, mask in self.sel.select(timeout=1.0):
+                if key.data is None:
+                    try:
+                        while self._wake_r.recv(4096):
+                            pass
+                    except (BlockingIOError, OSError):
+                        pass
+                    continue
+                entry = key.data
+                if mask & selectors.EVENT_READ:
+                    entry.client.loop_read()
+                    # Registros TLS já decifrados não acordam o select
+                    sock = entry.client.socket()
+                    while isinstance(sock, ssl.SSLSocket) and sock.pending():
+                        entry.client.loop_read()
+                        sock = entry.client.socket()
+                if mask & selectors.EVENT_WRITE:
+                    entry.client.loop_write()
+            now = time.monotonic()
+            if now - last_misc >= 1.0:
+                last_misc = now
+                self._housekeeping(now)
+
+
+# Instância global usada pelos drivers Bambu
+MQTT_REACTOR = MQTTReactor()
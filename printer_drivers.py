@@ -1,20 +1,42 @@
+import io
+import itertools
 import json
+import os
 import socket
 import threading
 import time
 import queue
 import ssl
 import requests
-import struct
-import select
 import paho.mqtt.client as mqtt
-import ftplib
-import zipfile
-import io
 import base64
+import uuid
 import xml.etree.ElementTree as ET
 from datetime import datetime, timedelta
+from concurrent.futures import Future
 from logger_config import log_info, log_error, log_debug, log_warn
+from elegoo_transport import ELEGOO_UDP, ElegooSDCPClient
+from bambu_ftp import FTPRangeFile, FTPSession, find_file, open_remote_zip
+from metadata_cache import METADATA_CACHE
+from supervisor import SUPERVISOR, sleep as supervised_sleep
+from mqtt_reactor import MQTT_REACTOR
+from camera_reactor import CAMERA_REACTOR
+from metrics import METRICS
+
+MQTT_MESSAGES = METRICS.counter('hub_mqtt_messages_total', 'Mensagens MQTT recebidas das impressoras Bambu', ('printer',))
+MQTT_BYTES = METRICS.counter('hub_mqtt_received_bytes_total', 'Bytes de payload MQTT recebidos', ('printer',))
+MQTT_ERRORS = METRICS.counter('hub_mqtt_parse_errors_total', 'Mensagens MQTT que falharam no parse', ('printer',))
+FTP_FETCH_SECONDS = METRICS.histogram('hub_ftp_metadata_fetch_seconds',
+                                      'Duração de cada tentativa de leitura de metadados via FTPS',
+                                      ('printer', 'result'))
+FTP_FETCH_BYTES = METRICS.counter('hub_ftp_metadata_bytes_total', 'Bytes lidos via FTPS para metadados', ('printer',))
+FTP_FETCH_RESULTS = ('not_found', 'cached', 'ok', 'error')
+
+# Prazo para a impressora confirmar um comando (MQTT/SDCP/UDP)
+COMMAND_ACK_TIMEOUT = 10
+# sequence_id dos comandos Bambu: único no processo e longe dos números baixos
+# usados pelo Bambu Studio/HA, para a resposta ser atribuída ao pedido certo
+_BAMBU_SEQUENCE = itertools.count(int(time.time()) % 100000 * 10000 + 1)
 
 # Bambu Lab Filament Mapping
 BAMBU_FILAMENTS = {
@@ -53,8 +75,44 @@ def get_bambu_filament_name(idx):
     if not idx: return ""
     return BAMBU_FILAMENTS.get(idx, "Unknown")
 
+# Cache em disco dos resultados de descoberta (pino de LED, webcam...) para
+# que um restart não precise esperar as consultas HTTP de cada impressora.
+DRIVER_CACHE_FILE = 'driver_cache.json'
+_driver_cache_lock = threading.Lock()
+_driver_cache = None
+
+def _load_driver_cache_file():
+    global _driver_cache
+    if _driver_cache is None:
+        try:
+            with open(DRIVER_CACHE_FILE, 'r') as f:
+                _driver_cache = json.load(f)
+        except (IOError, ValueError):
+            _driver_cache = {}
+    return _driver_cache
+
+def load_driver_cache(key):
+    with _driver_cache_lock:
+        return dict(_load_driver_cache_file().get(key, {}))
+
+def save_driver_cache(key, data):
+    with _driver_cache_lock:
+        cache = _load_driver_cache_file()
+        if cache.get(key) == data:
+            return
+        cache[key] = data
+        temp_file = DRIVER_CACHE_FILE + '.tmp'
+        try:
+            with open(temp_file, 'w') as f:
+                json.dump(cache, f, indent=4)
+            os.replace(temp_file, DRIVER_CACHE_FILE)
+        except Exception as e:
+            log_debug(f"Erro ao salvar cache de drivers: {e}")
+
 # Base Printer Class
 class BasePrinter:
+    supports_upload = False  # upload_file implementado (fila de jobs só usa essas)
+
     def __init__(self, config):
         self.config = config
         self.ip = config.get('ip')
@@ -76,10 +134,72 @@ class BasePrinter:
         }
         self.last_update = 0
         self.last_usage_time = time.time()
+        # Câmera sob demanda: consumidor -> validade do "lease" (time.monotonic)
+        self._camera_leases = {}
+        self._camera_lock = threading.Lock()
+        self._camera_idle_since = None
 
     def connect(self):
         pass
 
+    # --- Câmera sob demanda ---------------------------------------------------
+    CAMERA_IDLE_GRACE = 30  # segundos sem consumidores antes de desligar o stream
+
+    def acquire_camera(self, consumer, ttl=20):
+        """Registra (ou renova) um consumidor da câmera por `ttl` segundos e liga o stream."""
+        with self._camera_lock:
+            self._camera_leases[consumer] = time.monotonic() + ttl
+            self._camera_idle_since = None
+        self._start_camera()
+
+    def release_camera(self, consumer):
+        with self._camera_lock:
+            self._camera_leases.pop(consumer, None)
+
+    def camera_consumers(self):
+        now = time.monotonic()
+        with self._camera_lock:
+            for key in [k for k, exp in self._camera_leases.items() if exp < now]:
+                del self._camera_leases[key]
+            return list(self._camera_leases)
+
+    def _camera_tick(self):
+        """Chamado no polling: desliga o stream após o período de graça sem consumidores."""
+        if self.camera_consumers():
+            return
+        now = time.monotonic()
+        if self._camera_idle_since is None:
+            self._camera_idle_since = now
+        elif now - self._camera_idle_since >= self.CAMERA_IDLE_GRACE:
+            self._stop_camera()
+
+    def _start_camera(self):
+        pass
+
+    def _stop_camera(self):
+        pass
+
+    def has_camera(self):
+        """Há de onde tirar frames (snapshot HTTP ou stream próprio do driver)."""
+        return hasattr(self, 'get_snapshot')
+
+    def wait_frame(self, last_seq, timeout=10):
+        """Próximo frame mais novo que `last_seq`: retorna (frame, seq) ou (None, last_seq).
+
+        Padrão para câmeras só com snapshot HTTP: um frame por segundo.
+        """
+        if not self.has_camera():
+            time.sleep(timeout)
+            return None, last_seq
+        if last_seq >= 0:
+            time.sleep(1)
+        frame = self.get_snapshot()
+        if not frame:
+            if last_seq < 0:
+                time.sleep(1)  # câmera fora do ar: não martela o snapshot
+            return None, last_seq
+        return frame, last_seq + 1
+
     def update(self):
         pass
 
@@ -108,7 +228,18 @@ class BasePrinter:
         self.last_frame = None
 
     def send_command(self, command, **kwargs):
-        pass
+        """Envia um comando à impressora (chamado pela fila de comandos, nunca pelo request HTTP).
+
+        Retorna None (enviado, sem confirmação do protocolo), a resposta já
+        confirmada (envio síncrono) ou um Future resolvido pela resposta da
+        impressora. Levanta exceção se o comando não pôde ser enviado.
+        """
+        raise ValueError(f"Comando não suportado: {command}")
+
+    def upload_file(self, fileobj, filename, size):
+        """Envia um arquivo de impressão lendo `fileobj` em blocos. Retorna o
+        caminho remoto; o início da impressão é o comando 'start_print'."""
+        raise ValueError(f"Upload de arquivos não suportado ({self.type})")
 
     def stop(self):
         """Para todos os serviços e threads da impressora."""
@@ -131,13 +262,72 @@ class BasePrinter:
         return s
 
 # Moonraker (Klipper) Implementation
+class _MultipartBody:
+    """Corpo multipart/form-data lido sob demanda (campos + um arquivo).
+
+    Com `__len__` o requests manda Content-Length e lê o corpo em blocos via
+    `read`, então o arquivo vai para o socket sem passar inteiro pela memória.
+    """
+
+    def __init__(self, fields, file_field, filename, fileobj, size):
+        self.boundary = uuid.uuid4().hex
+        head = ''.join(f'--{self.boundary}\r\nContent-Disposition: form-data; name="{k}"\r\n\r\n{v}\r\n'
+                       for k, v in fields.items())
+        head += (f'--{self.boundary}\r\nContent-Disposition: form-data; name="{file_field}"; '
+                 f'filename="{filename}"\r\nContent-Type: application/octet-stream\r\n\r\n')
+        head = head.encode()
+        tail = f'\r\n--{self.boundary}--\r\n'.encode()
+        self._parts = [io.BytesIO(head), fileobj, io.BytesIO(tail)]
+        self._length = len(head) + size + len(tail)
+
+    @property
+    def content_type(self):
+        return f'multipart/form-data; boundary={self.boundary}'
+
+    def __len__(self):
+        return self._length
+
+    def read(self, size=-1):
+        size = size if size and size > 0 else 64 * 1024
+        while self._parts:
+            data = self._parts[0].read(size)
+            if data:
+                return data
+            self._parts.pop(0)
+        return b''
+
+
 class MoonrakerPrinter(BasePrinter):
+    supports_upload = True
+
     def __init__(self, config):
         super().__init__(config)
         self.current_filename = ""
         self.led_pin = "LED" 
+        self.discovered = False
+        # A descoberta (HTTP) fica em connect(), executado em paralelo pelo app
+
+    def _cache_key(self):
+        return f"{self.config.get('id')}@{self.ip}"
+
+    def connect(self):
+        if not self.config.get('enabled', True): return
+        # Resultado da última descoberta vale até a nova consulta responder
+        cached = load_driver_cache(self._cache_key())
+        if cached:
+            self.led_pin = cached.get('led_pin', self.led_pin)
+            if cached.get('auto_camera_url'):
+                self.status['auto_camera_url'] = cached['auto_camera_url']
+        self._discover()
+
+    def _discover(self):
         self._fetch_webcams()
-        self._discover_objects()
+        if self._discover_objects():
+            self.discovered = True
+            save_driver_cache(self._cache_key(), {
+                'led_pin': self.led_pin,
+                'auto_camera_url': self.status.get('auto_camera_url', ''),
+            })
 
     def _discover_objects(self):
         try:
@@ -150,8 +340,10 @@ class MoonrakerPrinter(BasePrinter):
                 elif 'output_pin LED' in objs: self.led_pin = "LED"
                 
                 log_info(f"[{self.ip}] Moonraker descoberto: LED={self.led_pin}")
+                return True
         except Exception as e:
             log_error(f"[{self.ip}] Erro ao descobrir objetos Moonraker: {e}")
+        return False
 
     def _fetch_webcams(self):
         try:
@@ -175,32 +367,45 @@ class MoonrakerPrinter(BasePrinter):
         s['auto_camera_url'] = self.status.get('auto_camera_url', '')
         return s
 
-    def _fetch_metadata(self, filename):
+    def _fetch_metadata(self, filename, file_size=None):
         if not filename:
             self.status['cover_image'] = None
             self.status['total_duration'] = 0
             return
+        # virtual_sdcard.file_size do próprio polling valida o cache sem requisição extra
+        cached = METADATA_CACHE.get(self.config.get('id'), filename, size=file_size) if file_size else None
+        if cached:
+            self._apply_metadata(cached)
+            return
         try:
             url = f"http://{self.ip}/server/files/metadata?filename={filename}"
             resp = requests.get(url, timeout=2)
             if resp.status_code == 200:
                 data = resp.json().get('result', {})
-                
-                # Total duration estimate from metadata (seconds to minutes)
-                est = data.get('estimated_time', 0)
-                if est > 0:
-                    self.status['total_duration'] = int(est / 60)
-                
                 thumbs = data.get('thumbnails', [])
-                if thumbs:
+                meta = {
+                    'weight': data.get('filament_weight_total', 0) or 0,
+                    'prediction': data.get('estimated_time', 0) or 0,
                     # Pick largest thumbnail
-                    thumb = thumbs[-1]
-                    self.status['cover_image'] = f"http://{self.ip}/server/files/gcodes/{thumb['relative_path']}"
-                else:
-                    self.status['cover_image'] = None
+                    'thumb_url': thumbs[-1]['relative_path'] if thumbs else '',
+                }
+                entry = METADATA_CACHE.put(self.config.get('id'), filename, meta,
+                                           size=data.get('size'), mtime=data.get('modified'))
+                self._apply_metadata(entry)
         except:
             self.status['cover_image'] = None
 
+    def _apply_metadata(self, meta):
+        if meta.get('weight'):
+            self.status['print_weight'] = meta['weight']
+        # Total duration estimate from metadata (seconds to minutes)
+        if meta.get('prediction', 0) > 0:
+            self.status['total_duration'] = int(meta['prediction'] / 60)
+        if meta.get('thumb_url'):
+            self.status['cover_image'] = f"http://{self.ip}/server/files/gcodes/{meta['thumb_url']}"
+        else:
+            self.status['cover_image'] = None
+
     def update(self):
         # Incrementar horas de uso se estiver imprimindo
         now = time.time()
@@ -225,7 +430,7 @@ class MoonrakerPrinter(BasePrinter):
                     filename = res['print_stats'].get('filename', '')
                     if filename != self.current_filename:
                         self.current_filename = filename
-                        self._fetch_metadata(filename)
+                        self._fetch_metadata(filename, res.get('virtual_sdcard', {}).get('file_size'))
                     
                     self.status['filename'] = filename
                     self.status['print_duration'] = res['print_stats'].get('print_duration', 0)
@@ -290,6 +495,9 @@ class MoonrakerPrinter(BasePrinter):
                 
                 
                 self.last_update = time.time()
+                # Impressora estava inacessível no connect(): descobrir agora que respondeu
+                if not self.discovered:
+                    self._discover()
                 return True
             else:
                 self.status['state'] = 'offline'
@@ -298,47 +506,65 @@ class MoonrakerPrinter(BasePrinter):
             self.status['state'] = 'offline'
         return False
 
+    def _gcode(self, script):
+        return self._post("/printer/gcode/script", json={'script': script})
+
+    def _post(self, path, **kwargs):
+        resp = requests.post(f"http://{self.ip}{path}", timeout=3, **kwargs)
+        resp.raise_for_status()
+        try:
+            return resp.json().get('result', 'ok')
+        except ValueError:
+            return 'ok'
+
     def send_command(self, command, **kwargs):
+        # HTTP síncrono: a resposta do Moonraker já é a confirmação
+        if command == 'pause':
+            return self._post("/printer/print/pause")
+        elif command == 'resume':
+            return self._post("/printer/print/resume")
+        elif command == 'stop':
+            return self._post("/printer/print/cancel")
+        elif command == 'home':
+            return self._gcode('G28')
+        elif command == 'motors_off':
+            return self._gcode('M84')
+        elif command == 'gcode':
+            gcode = kwargs.get('gcode', '')
+            if not gcode:
+                raise ValueError("G-code vazio")
+            return self._gcode(gcode)
+        elif command == 'fan':
+            val = int(kwargs.get('val', 0))
+            self.status['fan_val'] = val
+            pwm = int(val / 100 * 255)
+            # Part fan is standard M106 P0
+            return self._gcode(f'M106 P0 S{pwm}')
+        elif command == 'led':
+            val = int(kwargs.get('val', 0))
+            self.status['led_val'] = val
+            script = f'SET_PIN PIN={self.led_pin} VALUE={val / 100.0:.2f}'
+            # Se for M355 compatível, envia também (mesmo script, um único POST)
+            if self.led_pin == "LED":
+                script += f'\nM355 S{1 if val > 0 else 0} P{int(val / 100 * 255)}'
+            return self._gcode(script)
+        elif command == 'reboot':
+            return self._post("/machine/reboot")
+        elif command == 'start_print':
+            return self._post("/printer/print/start", params={'filename': kwargs['filename']})
+        raise ValueError(f"Comando não suportado: {command}")
+
+    def upload_file(self, fileobj, filename, size):
+        body = _MultipartBody({'root': 'gcodes'}, 'file', filename, fileobj, size)
+        # Sem timeout de leitura longo: arquivos grandes levam o tempo da rede
+        resp = requests.post(f"http://{self.ip}/server/files/upload", data=body,
+                             headers={'Content-Type': body.content_type}, timeout=(5, 120))
+        resp.raise_for_status()
         try:
-            if command == 'pause':
-                requests.post(f"http://{self.ip}/printer/print/pause", timeout=3)
-            elif command == 'resume':
-                requests.post(f"http://{self.ip}/printer/print/resume", timeout=3)
-            elif command == 'stop':
-                requests.post(f"http://{self.ip}/printer/print/cancel", timeout=3)
-            elif command == 'home':
-                requests.post(f"http://{self.ip}/printer/gcode/script",
-                    json={'script': 'G28'}, timeout=3)
-            elif command == 'motors_off':
-                requests.post(f"http://{self.ip}/printer/gcode/script",
-                    json={'script': 'M84'}, timeout=3)
-            elif command == 'gcode':
-                gcode = kwargs.get('gcode', '')
-                if gcode:
-                    requests.post(f"http://{self.ip}/printer/gcode/script",
-                        json={'script': gcode}, timeout=3)
-            elif command == 'fan':
-                val = int(kwargs.get('val', 0))
-                self.status['fan_val'] = val
-                pwm = int(val / 100 * 255)
-                # Part fan is standard M106 P0
-                requests.post(f"http://{self.ip}/printer/gcode/script",
-                    json={'script': f'M106 P0 S{pwm}'}, timeout=3)
-            elif command == 'led':
-                val = int(kwargs.get('val', 0))
-                self.status['led_val'] = val
-                fval = val / 100.0
-                requests.post(f"http://{self.ip}/printer/gcode/script",
-                    json={'script': f'SET_PIN PIN={self.led_pin} VALUE={fval:.2f}'}, timeout=3)
-                # Se for M355 compatível, envia também apenas para garantir
-                if self.led_pin == "LED":
-                    pwm = int(val / 100 * 255)
-                    requests.post(f"http://{self.ip}/printer/gcode/script",
-                        json={'script': f'M355 S{1 if val > 0 else 0} P{pwm}'}, timeout=3)
-            elif command == 'reboot':
-                requests.post(f"http://{self.ip}/machine/reboot", timeout=3)
-        except Exception as e:
-            log_error(f"Moonraker command error: {e}")
+            item = resp.json().get('result', {}).get('item', {})
+        except ValueError:
+            item = {}
+        return item.get('path') or filename
 
     def get_snapshot(self):
         try:
@@ -380,25 +606,34 @@ class ElegooPrinter(BasePrinter):
         # Resin printers don't have nozzle/bed temperatures
         self.status.pop('temp_nozzle', None)
         self.status.pop('temp_bed', None)
+        self.pending_poll = None
+        self._udp_resolved = None   # (host do config, (IP, porta)) para o ELEGOO_UDP
+        # 'auto' tenta SDCP (push via WebSocket) e cai para o polling UDP;
+        # 'sdcp' e 'udp' forçam um dos transportes.
+        self.mode = config.get('elegoo_mode', 'auto')
+        self.sdcp = None
 
-    def _send_command(self, message):
-        sock = None
-        try:
-            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-            sock.settimeout(1.5) # Aumentar ligeiramente
-            sock.sendto(message.encode(), (self.ip, self.port))
-            data, _ = sock.recvfrom(4096)
-            return json.loads(data.decode())
-        except socket.timeout:
-            # log_debug(f"Elegoo timeout: {self.ip}")
-            return None
-        except Exception as e:
-            log_debug(f"Elegoo error: {e}")
-            return None
-        finally:
-            if sock:
-                try: sock.close()
-                except: pass
+    def connect(self):
+        if not self.config.get('enabled', True): return
+        if self.mode == 'udp' or not ElegooSDCPClient.available: return
+        if not self.sdcp:
+            self.sdcp = ElegooSDCPClient(self.ip, self._apply_status, mainboard_id=self.config.get('serial', ''),
+                                         group=f"printer-{self.config.get('id')}")
+        self.sdcp.start()
+
+    def _udp_addr(self):
+        # Resolve o host só quando `ip` muda (troca pelo config ou pela descoberta), não a cada poll
+        if self._udp_resolved is None or self._udp_resolved[0] != self.ip:
+            self._udp_resolved = (self.ip, (socket.gethostbyname(self.ip), self.port))
+        return self._udp_resolved[1]
+
+    def _sdcp_live(self):
+        # Push recente = SDCP saudável; sem push há 15 s volta para o UDP
+        return bool(self.sdcp and self.sdcp.connected and time.time() - self.sdcp.last_push < 15)
+
+    @staticmethod
+    def _is_status_reply(payload):
+        return isinstance(payload, dict) and 'Status' in payload.get('Data', {})
 
     def update(self):
         # Incrementar horas de uso se estiver imprimindo
@@ -408,205 +643,142 @@ class ElegooPrinter(BasePrinter):
             self.status['total_usage'] = self.status.get('total_usage', 0) + (max(0, delta) / 3600.0)
         self.last_usage_time = now
 
-        data = self._send_command("M99999")
-        if data:
-            # Structure from user's working example:
-            # response.get("Data", {}).get("Status", {}).get("PrintInfo", {})
-            wrapper = data.get("Data", {})
-            status = wrapper.get("Status", {})
-            info = status.get("PrintInfo", {})
-
-            # Status translation
-            status_code = status.get("CurrentStatus", -1)
-            status_map = {0: "Idle", 1: "Printing", 2: "Paused", 3: "Error"}
-            self.status['state'] = status_map.get(status_code, "Unknown").lower()
-            
-            if info:
-                self.status['layer'] = info.get("CurrentLayer", 0)
-                self.status['total_layers'] = info.get("TotalLayer", 0)
-                self.status['filename'] = info.get("Filename", "")
-                
-                # Progress calculation
-                if self.status['total_layers'] > 0:
-                    self.status['progress'] = (self.status['layer'] / self.status['total_layers']) * 100
-                else:
-                    self.status['progress'] = 0
-                
-                # Time calculation (ticks to minutes for fmtEta compatibility)
-                current_ticks = info.get("CurrentTicks", 0)
-                total_ticks = info.get("TotalTicks", 0)
-                if total_ticks > current_ticks:
-                    remaining_ticks = total_ticks - current_ticks
-                    # remaining_time in minutes for fmtEta
-                    self.status['remaining_time'] = (remaining_ticks // 1000) // 60
-                    
-                    # Estimate finish time string (HH:mm)
-                    remaining_seconds = remaining_ticks / 1000
-                    finish_dt = datetime.now() + timedelta(seconds=remaining_seconds)
-                    self.status['finish_time'] = finish_dt.strftime("%H:%M")
-                else:
-                    self.status['remaining_time'] = 0
-                    self.status['finish_time'] = '--'
-            
-            self.last_update = time.time()
+        if self._sdcp_live():
+            if now - self.sdcp.last_heartbeat > 30:
+                self.sdcp.heartbeat()
+            if now - self.sdcp.last_push > 5:
+                self.sdcp.request(ElegooSDCPClient.CMD_STATUS)
             return True
-        else:
+        if self.mode == 'sdcp' and self.sdcp:
+            if not self.sdcp.connected and now - self.last_update > 60:
+                self.status['state'] = 'offline'
+            return False
+
+        # Não bloqueia: o pedido sai pelo socket compartilhado e a resposta
+        # é aplicada pelo receptor do ELEGOO_UDP quando chegar (ou expirar).
+        if self.pending_poll and not self.pending_poll.done():
+            return False
+        try:
+            addr = self._udp_addr()
+        except OSError as e:
+            log_debug(f"Elegoo: não foi possível resolver {self.ip}: {e}")
             self.status['state'] = 'offline'
             return False
+        self.pending_poll = ELEGOO_UDP.request(addr, "M99999",
+                                               timeout=1.5, match=self._is_status_reply)
+        self.pending_poll.add_done_callback(self._on_status_reply)
+        return True
 
-    def send_command(self, command, **kwargs):
-        if command == 'pause':
-            self._send_command("M25")
-        elif command == 'resume':
-            self._send_command("M24")
-        elif command == 'stop':
-            self._send_command("M33")
+    def _on_status_reply(self, fut):
+        if not self.config.get('enabled', True):
+            return
+        try:
+            data = fut.result()
+        except TimeoutError:
+            self.status['state'] = 'offline'
+            return
+        except Exception as e:
+            log_debug(f"Elegoo error: {e}")
+            self.status['state'] = 'offline'
+            return
+        # Structure from user's working example:
+        # response.get("Data", {}).get("Status", {}).get("PrintInfo", {})
+        wrapper = data.get("Data", {})
+        if self.sdcp and not self.sdcp.mainboard_id:
+            self.sdcp.mainboard_id = wrapper.get("MainboardID") or wrapper.get("Attributes", {}).get("MainboardID", "")
+        self._apply_status(wrapper.get("Status", {}))
 
-    def stop(self):
-        self._reset_status()
+    def _apply_status(self, status):
+        """Aplica um bloco `Status` vindo do poll UDP ou de um push SDCP."""
+        info = status.get("PrintInfo", {})
 
-class BambuCameraThread(threading.Thread):
-    def __init__(self, ip, access_code, callback):
-        super().__init__(daemon=True)
-        self.ip = ip
-        self.access_code = access_code
-        self.callback = callback
-        self._stop_event = threading.Event()
+        # Status translation
+        status_code = status.get("CurrentStatus", -1)
+        if isinstance(status_code, list):
+            # SDCP: lista de estados da máquina; o detalhe vem de PrintInfo.Status
+            # (5/6 = pausando/pausado, 9 = concluído)
+            machine = status_code[0] if status_code else 0
+            print_state = info.get("Status", 0)
+            if machine == 1:
+                state = "paused" if print_state in (5, 6) else "printing"
+            elif print_state == 9:
+                state = "complete"
+            else:
+                state = "idle"
+            self.status['state'] = state
+        else:
+            status_map = {0: "Idle", 1: "Printing", 2: "Paused", 3: "Error"}
+            self.status['state'] = status_map.get(status_code, "Unknown").lower()
 
-    def stop(self):
-        self._stop_event.set()
+        if info:
+            self.status['layer'] = info.get("CurrentLayer", 0)
+            self.status['total_layers'] = info.get("TotalLayer", 0)
+            self.status['filename'] = info.get("Filename", "")
 
-    def run(self):
-        self.setName(f"BambuCamera-{self.ip}")
-        print(f"[{self.ip}] Iniciando thread da câmera (Match Exemplo)...")
-        
-        username = 'bblp'
-        port = 6000
-        
-        # Payload de autenticação - Montagem byte a byte idêntica ao exemplo funcional
-        auth_data = bytearray()
-        auth_data += struct.pack("<I", 0x40)   # Payload size (64 bytes)
-        auth_data += struct.pack("<I", 0x3000) # Type
-        auth_data += struct.pack("<I", 0)      # Seq
-        auth_data += struct.pack("<I", 0)      # Reserved
-        
-        # Username (32 bytes)
-        for i in range(len(username)):
-            auth_data += struct.pack("<c", username[i].encode('ascii'))
-        for i in range(32 - len(username)):
-            auth_data += struct.pack("<x")
-            
-        # Access Code (32 bytes) - Respeita o case fornecido pelo usuário
-        for i in range(len(self.access_code)):
-            auth_data += struct.pack("<c", self.access_code[i].encode('ascii'))
-        for i in range(32 - len(self.access_code)):
-            auth_data += struct.pack("<x")
-
-        # Contexto SSL - Refinado para X1C
-        ctx = ssl.create_default_context()
-        ctx.check_hostname = False
-        ctx.verify_mode = ssl.CERT_NONE
-        ctx.set_ciphers('DEFAULT@SECLEVEL=1:AES128-SHA')
-        # Desabilita protocolos inseguros mas mantém TLS 1.2
-        ctx.options |= ssl.OP_NO_SSLv2 | ssl.OP_NO_SSLv3 | ssl.OP_NO_TLSv1 | ssl.OP_NO_TLSv1_1
-
-        while not self._stop_event.is_set():
-            try:
-                # Usar socket puro para ter controle total do timeout antes do wrap
-                sock = socket.create_connection((self.ip, port), timeout=3)
-                sock.settimeout(3)
-                # server_hostname=None to avoid SNI issues with IP addresses on some firmware
-                try:
-                    sslSock = ctx.wrap_socket(sock, server_hostname=None)
-                except:
-                    sock.close()
-                    raise
-                
-                with sslSock:
-                    log_debug(f"[{self.ip}] Câmera: Conexão SSL estabelecida (Match Exemplo).")
-                    
-                    # Atraso crucial para a X1C processar o handshake antes do auth
-                    time.sleep(0.5)
-                    sslSock.sendall(auth_data)
-                    
-                    buffer = bytearray()
-                    sslSock.setblocking(False)
-                    
-                    while not self._stop_event.is_set():
-                        try:
-                            # Proteção contra soquetes fechados prematuramente
-                            try:
-                                ready = select.select([sslSock], [], [], 0.5)
-                            except (OSError, ValueError):
-                                break
-                                
-                            if not ready[0]: continue
-                            
-                            dr = sslSock.recv(16384)
-                            if not dr: break
-                            buffer += dr
-                            
-                            while len(buffer) >= 16:
-                                payload_size = int.from_bytes(buffer[0:4], byteorder='little')
-                                if payload_size > 1000000 or payload_size < 100:
-                                    buffer = buffer[1:]
-                                    continue
-                                    
-                                if len(buffer) < 16 + payload_size:
-                                    break
-                                
-                                img_data = buffer[16:16+payload_size]
-                                if img_data.startswith(b'\xff\xd8'):
-                                    self.callback(bytes(img_data))
-                                
-                                buffer = buffer[16+payload_size:]
-                                
-                        except ssl.SSLWantReadError:
-                            continue
-                        except Exception as e:
-                            log_debug(f"[{self.ip}] Câmera Loop: {e}")
-                            break
-            except Exception as e:
-                if not self._stop_event.is_set():
-                    # print(f"[{self.ip}] Câmera Erro: {e}")
-                    pass
-                if self._stop_event.wait(5): break
-            except Exception as e:
-                log_debug(f"[{self.ip}] Câmera: Erro de conexão/Auth: {e}")
-                if self._stop_event.wait(5): break
+            # Progress calculation
+            if self.status['total_layers'] > 0:
+                self.status['progress'] = (self.status['layer'] / self.status['total_layers']) * 100
+            else:
+                self.status['progress'] = 0
+
+            # Time calculation (ticks to minutes for fmtEta compatibility)
+            current_ticks = info.get("CurrentTicks", 0)
+            total_ticks = info.get("TotalTicks", 0)
+            if total_ticks > current_ticks:
+                remaining_ticks = total_ticks - current_ticks
+                # remaining_time in minutes for fmtEta
+                self.status['remaining_time'] = (remaining_ticks // 1000) // 60
+
+                # Estimate finish time string (HH:mm)
+                remaining_seconds = remaining_ticks / 1000
+                finish_dt = datetime.now() + timedelta(seconds=remaining_seconds)
+                self.status['finish_time'] = finish_dt.strftime("%H:%M")
+            else:
+                self.status['remaining_time'] = 0
+                self.status['finish_time'] = '--'
+
+        self.last_update = time.time()
+
+    def send_command(self, command, **kwargs):
+        gcode = {'pause': "M25", 'resume': "M24", 'stop': "M33"}.get(command)
+        if gcode is None:
+            raise ValueError(f"Comando não suportado: {command}")
+        if self.sdcp and self.sdcp.connected:
+            cmd = {'pause': ElegooSDCPClient.CMD_PAUSE, 'resume': ElegooSDCPClient.CMD_RESUME,
+                   'stop': ElegooSDCPClient.CMD_STOP}[command]
+            fut = self.sdcp.request_ack(cmd, timeout=COMMAND_ACK_TIMEOUT)
+            if fut is not None:
+                return fut
+        # UDP: a resposta ao comando (qualquer coisa que não seja status) é o ack
+        return ELEGOO_UDP.request(self._udp_addr(), gcode, timeout=COMMAND_ACK_TIMEOUT,
+                                  match=lambda payload: not self._is_status_reply(payload))
 
     def stop(self):
-        self._stop_event.set()
-        # Não damos join aqui para não travar o loop principal, 
-        # mas a thread é daemon então ok.
+        if self.sdcp:
+            self.sdcp.stop()
+        self._reset_status()
 
-# Helper for Implicit FTP TLS (used by Bambu Lab)
-class ImplicitFTP_TLS(ftplib.FTP_TLS):
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self._sock = None
+_mqtt_context_lock = threading.Lock()
+_mqtt_context = None
 
-    @property
-    def sock(self):
-        return self._sock
-
-    @sock.setter
-    def sock(self, value):
-        if value is not None and not isinstance(value, ssl.SSLSocket):
-            value = self.context.wrap_socket(value)
-        self._sock = value
-
-    def ntransfercmd(self, cmd, rest=None):
-        conn, size = ftplib.FTP.ntransfercmd(self, cmd, rest)
-        if self._prot_p:
-            session = self.sock.session
-            if isinstance(self.sock, ssl.SSLSocket):
-                session = self.sock.session
-            conn = self.context.wrap_socket(conn, server_hostname=self.host, session=session)
-        return conn, size
+def bambu_mqtt_context():
+    """SSLContext único para o MQTT de todas as Bambu (em vez de um por impressora)."""
+    global _mqtt_context
+    with _mqtt_context_lock:
+        if _mqtt_context is None:
+            # Contexto SSL - Igual ao exemplo que funciona
+            context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+            context.minimum_version = context.maximum_version = ssl.TLSVersion.TLSv1_2
+            context.set_ciphers('DEFAULT@SECLEVEL=1:AES128-SHA')
+            context.check_hostname = False
+            context.verify_mode = ssl.CERT_NONE
+            _mqtt_context = context
+        return _mqtt_context
 
 # Bambu Lab Implementation - MQTT
 class BambuPrinter(BasePrinter):
+    supports_upload = True
+
     def __init__(self, config):
         super().__init__(config)
         self.serial = config.get('serial')
@@ -614,9 +786,15 @@ class BambuPrinter(BasePrinter):
         self.client = None
         self.connected_flag = False
         self.lock = threading.Lock()
-        self.cam_thread = None
+        self.camera = None
+        self.camera_ready = False   # MQTT estabilizado: câmera pode ser aberta
         self.last_frame = None
+        self.frame_seq = 0
+        self.frame_cond = threading.Condition()
+        self.pending_acks = {}  # sequence_id -> (Future, prazo)
         self.metadata_thread = None
+        self.task_group = f"printer-{config.get('id')}"
+        self.ftp = FTPSession(self.ip, "bblp", self.access_code)
         self.current_filename = ""
         
         # New status fields
@@ -646,34 +824,30 @@ class BambuPrinter(BasePrinter):
         # Conexão em thread para não travar a inicialização do server
         if not self.config.get('enabled', True): return
         if self.client: return
-        thread = threading.Thread(target=self._do_connect, daemon=True)
-        thread.start()
+        SUPERVISOR.spawn(f"BambuConnect-{self.ip}", self._do_connect, group=self.task_group)
 
     def _do_connect(self):
         log_info(f"[{self.ip}] Conectando ao MQTT e Câmera...")
         self.client = mqtt.Client(client_id=f"aditiva-{int(time.time())}")
         self.client.username_pw_set("bblp", self.access_code)
         
-        # Contexto SSL - Igual ao exemplo que funciona
-        context = ssl.SSLContext(ssl.PROTOCOL_TLSv1_2)
-        context.set_ciphers('DEFAULT@SECLEVEL=1:AES128-SHA')
-        context.check_hostname = False
-        context.verify_mode = ssl.CERT_NONE
-        self.client.tls_set_context(context)
+        self.client.tls_set_context(bambu_mqtt_context())
         
         self.client.on_connect = self.on_connect
-        self.client.on_message = self.on_message
+        # Sem loop próprio: o reactor compartilhado cuida do socket e entrega
+        # as mensagens ao on_message por uma fila de workers
+        MQTT_REACTOR.attach(self.client, self.ip, self.on_message, group=self.task_group)
         
         try:
-            self.client.connect(self.ip, 8883, 10) 
-            self.client.loop_start()
+            MQTT_REACTOR.connect(self.client, self.ip, 8883, 10)
             
             # Aguardar o MQTT estabilizar antes de abrir a câmera (importante para X1C)
-            time.sleep(2)
+            if supervised_sleep(2): return
             
-            if not self.cam_thread:
-                self.cam_thread = BambuCameraThread(self.ip, self.access_code, self.on_frame)
-                self.cam_thread.start()
+            # A câmera só abre se houver consumidor (dashboard, MJPEG, nuvem)
+            self.camera_ready = True
+            if self.camera_consumers():
+                self._start_camera()
         except Exception as e:
             log_error(f"[{self.ip}] Falha na conexão MQTT: {e}")
             self.status['state'] = 'offline'
@@ -682,20 +856,62 @@ class BambuPrinter(BasePrinter):
         log_info(f"[{self.ip}] Parando serviços Bambu (Threads e MQTT)...")
         if self.client:
             try:
-                self.client.loop_stop()
-                self.client.disconnect()
-            except: pass
-        if self.cam_thread:
-            try:
-                self.cam_thread.stop()
+                MQTT_REACTOR.detach(self.client)
             except: pass
+        self._forget_metrics()
+        self.camera_ready = False
+        if self.camera:
+            CAMERA_REACTOR.close(self.camera)
+        # Cancela conexão, MQTT, câmera e metadados e espera (com prazo) o fim das threads
+        SUPERVISOR.cancel_group(self.task_group, timeout=2)
+        self.client = None
+        self.camera = None
+        self.ftp.close()
         self.connected_flag = False
+        self._fail_pending_acks(ConnectionError("impressora parada"))
         self._reset_status()
         self.status['state'] = 'off'
         
 
+    def _forget_metrics(self):
+        # Séries por impressora: recriadas na próxima mensagem se ela voltar (troca de IP)
+        printer_id = self.config.get('id')
+        for metric in (MQTT_MESSAGES, MQTT_BYTES, MQTT_ERRORS, FTP_FETCH_BYTES):
+            metric.remove(printer_id)
+        for result in FTP_FETCH_RESULTS:
+            FTP_FETCH_SECONDS.remove(printer_id, result)
+
+    def _start_camera(self):
+        with self._camera_lock:
+            if self.camera or not self.camera_ready:
+                return
+            log_debug(f"[{self.ip}] Iniciando câmera (reactor compartilhado)...")
+            self.camera = CAMERA_REACTOR.open(self.ip, self.access_code, self.on_frame, group=self.task_group)
+
+    def _stop_camera(self):
+        with self._camera_lock:
+            camera, self.camera = self.camera, None
+        if camera:
+            # last_frame fica como prévia até o próximo consumidor
+            log_debug(f"[{self.ip}] Câmera sem consumidores, desligando stream")
+            CAMERA_REACTOR.close(camera)
+
     def on_frame(self, frame):
-        self.last_frame = frame
+        with self.frame_cond:
+            self.last_frame = frame
+            self.frame_seq += 1
+            self.frame_cond.notify_all()
+
+    def has_camera(self):
+        return True
+
+    def wait_frame(self, last_seq, timeout=10):
+        with self.frame_cond:
+            # Sem frame ainda (câmera abrindo), espera em vez de voltar na hora
+            self.frame_cond.wait_for(lambda: self.frame_seq != last_seq and self.last_frame, timeout)
+            if self.frame_seq == last_seq or not self.last_frame:
+                return None, last_seq
+            return self.last_frame, self.frame_seq
 
     def on_connect(self, client, userdata, flags, rc):
         if rc == 0:
@@ -714,11 +930,17 @@ class BambuPrinter(BasePrinter):
         self.client.publish(f"device/{self.serial}/request", json.dumps(msg_info))
 
     def on_message(self, client, userdata, msg):
+        printer_id = self.config.get('id')
+        MQTT_MESSAGES.labels(printer_id).inc()
+        MQTT_BYTES.labels(printer_id).inc(len(msg.payload))
         try:
             payload = json.loads(msg.payload.decode())
+            if self.pending_acks:
+                self._resolve_acks(payload)
             self.parse_bambu_json(payload)
             self.last_update = time.time()
         except Exception as e:
+            MQTT_ERRORS.labels(printer_id).inc()
             log_error(f"Error parsing Bambu msg: {e}")
 
     def parse_bambu_json(self, data):
@@ -955,92 +1177,111 @@ class BambuPrinter(BasePrinter):
                 self.start_time = None
 
     def _start_metadata_fetch(self, filename):
-        if self.metadata_thread and self.metadata_thread.is_alive():
-            return
-        self.metadata_thread = threading.Thread(target=self._fetch_metadata_ftp, args=(filename,), daemon=True)
-        self.metadata_thread.start()
+        # Trabalhos repetidos: mostra o que já conhecemos na hora; o FTP só valida
+        cached = METADATA_CACHE.get(self.config.get('id'), filename)
+        if cached:
+            self._apply_metadata(cached)
+        # Nome fixo por impressora: se já houver uma busca em andamento, é reaproveitada
+        self.metadata_thread = SUPERVISOR.spawn(f"BambuMetadata-{self.ip}", self._fetch_metadata_ftp, filename,
+                                                group=self.task_group)
+
+    def _parse_3mf(self, z):
+        """Extrai peso, tempo estimado e miniatura da placa de um 3MF aberto."""
+        meta, thumbnail = None, None
+        try:
+            # Ler slice_info.config para peso
+            with z.open('Metadata/slice_info.config') as f:
+                tree = ET.parse(f)
+                plate = tree.find('plate')
+                if plate is not None:
+                    meta = {'weight': 0, 'prediction': 0, 'plate_index': '1'}
+                    for item in plate:
+                        if item.get('key') == 'weight':
+                            meta['weight'] = float(item.get('value'))
+                        elif item.get('key') == 'prediction':
+                            meta['prediction'] = float(item.get('value'))
+                        elif item.get('key') == 'index':
+                            meta['plate_index'] = item.get('value')
+
+                    # Tentar imagem do plate (fallback para plate_1 se o index falhar)
+                    for idx in (meta['plate_index'], '1'):
+                        try:
+                            with z.open(f'Metadata/plate_{idx}.png') as img_f:
+                                thumbnail = img_f.read()
+                            break
+                        except KeyError:
+                            continue
+        except Exception as e:
+            log_debug(f"[{self.ip}] Erro ao processar Zip: {e}")
+        return meta, thumbnail
+
+    def _apply_metadata(self, meta):
+        if meta.get('weight'):
+            self.status['print_weight'] = meta['weight']
+        if meta.get('prediction'):
+            # Estimativa de tempo em segundos para minutos
+            self.status['total_duration'] = int(meta['prediction'] / 60)
+        thumbnail = METADATA_CACHE.get_thumbnail(meta.get('thumb_hash'))
+        if thumbnail:
+            self.status['cover_image'] = base64.b64encode(thumbnail).decode('utf-8')
+
+    def _metadata_candidates(self, filename):
+        # X1C e P1P as vezes usam nomes fixos ou pastas diferentes
+        names = [filename]
+        if not filename.endswith('.3mf'):
+            names.append(filename + ".3mf")
+            names.append(filename + ".gcode.3mf")
+        # Nomes comuns em impressões via cloud
+        names.extend(["ftp_model.3mf", "model.3mf", "_model_.3mf"])
+        return names
 
     def _fetch_metadata_ftp(self, filename):
         # Retries are important for X1C as the file might not be ready immediately
         # Aumentado para 12 tentativas (aprox 60s) como no exemplo oficial
+        printer_id = self.config.get('id')
         for attempt in range(12):
+            started = time.perf_counter()
+            result = 'not_found'
             try:
                 log_debug(f"[{self.ip}] FTP Metadata (Tentativa {attempt+1}): {filename}")
-                context = ssl.SSLContext(ssl.PROTOCOL_TLSv1_2)
-                context.check_hostname = False
-                context.verify_mode = ssl.CERT_NONE
-                
-                ftp = ImplicitFTP_TLS(context=context)
-                ftp.connect(self.ip, 990, timeout=10)
-                ftp.login("bblp", self.access_code)
-                ftp.prot_p()
-                
-                # Lista de caminhos para tentar encontrar o 3mf
-                # X1C e P1P as vezes usam nomes fixos ou pastas diferentes
-                search_files = [filename]
-                if not filename.endswith('.3mf'):
-                    search_files.append(filename + ".3mf")
-                    search_files.append(filename + ".gcode.3mf")
-                
-                # Nomes comuns em impressões via cloud
-                search_files.extend(["ftp_model.3mf", "model.3mf", "_model_.3mf"])
-                
-                target_path = None
-                for f_name in search_files:
-                    for folder in ["/cache", ""]:
-                        p = f"{folder}/{f_name}" if folder else f"/{f_name}"
-                        try:
-                            # log_debug(f"[{self.ip}] Testando FTP: {p}")
-                            ftp.size(p)
-                            target_path = p
-                            break
-                        except: continue
-                    if target_path: break
-                    
-                if target_path:
-                    log_debug(f"[{self.ip}] FTP: Baixando {target_path}...")
-                    bio = io.BytesIO()
-                    ftp.retrbinary(f"RETR {target_path}", bio.write)
-                    ftp.quit()
-                    
-                    bio.seek(0)
-                    with zipfile.ZipFile(bio) as z:
-                        # Ler slice_info.config para peso
-                        try:
-                            with z.open('Metadata/slice_info.config') as f:
-                                tree = ET.parse(f)
-                                plate = tree.find('plate')
-                                if plate is not None:
-                                    plate_idx = '1'
-                                    for meta in plate:
-                                        if meta.get('key') == 'weight':
-                                            self.status['print_weight'] = float(meta.get('value'))
-                                        elif meta.get('key') == 'prediction':
-                                            # Estimativa de tempo em segundos para minutos
-                                            self.status['total_duration'] = int(float(meta.get('value')) / 60)
-                                        elif meta.get('key') == 'index':
-                                            plate_idx = meta.get('value')
-                                    
-                                    # Tentar imagem do plate
-                                    try:
-                                        with z.open(f'Metadata/plate_{plate_idx}.png') as img_f:
-                                            self.status['cover_image'] = base64.b64encode(img_f.read()).decode('utf-8')
-                                    except:
-                                        # Fallback para plate_1 se o index falhar
-                                        try:
-                                            with z.open(f'Metadata/plate_1.png') as img_f:
-                                                 self.status['cover_image'] = base64.b64encode(img_f.read()).decode('utf-8')
-                                        except: pass
-                        except Exception as e:
-                            log_debug(f"[{self.ip}] Erro ao processar Zip: {e}")
-                    return # Sucesso
-                else:
-                    ftp.quit()
+                with self.ftp.session() as ftp:
+                    # Uma listagem de /cache (e da raiz, se preciso) resolve o nome em memória
+                    found = find_file(ftp, self._metadata_candidates(filename))
+                    if found:
+                        target_path, size, mtime = found
+                        # NLST não traz tamanho/data: completar com SIZE + MDTM
+                        if size is None:
+                            try: size = ftp.size(target_path)
+                            except: pass
+                        if not mtime:
+                            try: mtime = ftp.voidcmd(f"MDTM {target_path}")[4:].strip()
+                            except: pass
+                        cached = METADATA_CACHE.get(self.config.get('id'), filename, size, mtime)
+                        if cached and (size is not None or mtime):
+                            log_debug(f"[{self.ip}] FTP: Metadados de {target_path} em cache")
+                            self._apply_metadata(cached)
+                            result = 'cached'
+                            return # Sucesso
+                        log_debug(f"[{self.ip}] FTP: Lendo metadados de {target_path}...")
+                        z, remote = open_remote_zip(ftp, target_path, size)
+                        with z, remote:
+                            meta, thumbnail = self._parse_3mf(z)
+                            if isinstance(remote, FTPRangeFile):
+                                FTP_FETCH_BYTES.labels(printer_id).inc(remote.bytes_fetched)
+                                log_debug(f"[{self.ip}] FTP: {remote.bytes_fetched // 1024} KB lidos de {remote.size // 1024} KB ({remote.requests} trechos)")
+                        if meta is not None:
+                            entry = METADATA_CACHE.put(self.config.get('id'), filename, meta, size, mtime, thumbnail)
+                            self._apply_metadata(entry)
+                        result = 'ok'
+                        return # Sucesso
             except Exception as e:
+                result = 'error'
                 log_debug(f"[{self.ip}] Erro FTP (Tentativa {attempt+1}): {e}")
+            finally:
+                FTP_FETCH_SECONDS.labels(printer_id, result).observe(time.perf_counter() - started)
             
             # Aguardar antes de tentar novamente
-            time.sleep(5)
+            if supervised_sleep(5): return
 
     def update(self):
         # Incrementar horas de uso se estiver imprimindo
@@ -1049,48 +1290,116 @@ class BambuPrinter(BasePrinter):
             delta = now - self.last_usage_time
             self.status['total_usage'] = self.status.get('total_usage', 0) + (max(0, delta) / 3600.0)
         self.last_usage_time = now
+        self.ftp.close_idle()
+        self._camera_tick()
+        self._expire_acks()
 
         if not self.connected_flag or (time.time() - self.last_update > 30):
             self.request_push()
             if time.time() - self.last_update > 60:
                  self.status['state'] = 'offline'
 
+    UPLOAD_FOLDER = '/cache'
+
+    def upload_file(self, fileobj, filename, size):
+        path = f"{self.UPLOAD_FOLDER}/{filename}"
+        # Sessão FTPS exclusiva durante o envio (a leitura de metadados espera)
+        with self.ftp.session() as ftp:
+            ftp.store(path, fileobj)
+        return path
+
+    def _start_print_params(self, filename, options):
+        path = f"{self.UPLOAD_FOLDER}/{filename}"
+        if not filename.lower().endswith('.3mf'):
+            return {"command": "gcode_file", "param": path}
+        plate = int(options.get('plate', 1))
+        return {
+            "command": "project_file",
+            "param": f"Metadata/plate_{plate}.gcode",
+            "url": f"ftp://{path}",
+            "subtask_name": os.path.splitext(filename)[0],
+            "bed_type": "auto",
+            "timelapse": bool(options.get('timelapse', False)),
+            "bed_leveling": bool(options.get('bed_leveling', True)),
+            "flow_cali": bool(options.get('flow_cali', True)),
+            "vibration_cali": bool(options.get('vibration_cali', True)),
+            "layer_inspect": True,
+            "use_ams": bool(options.get('use_ams', False)),
+            "ams_mapping": options.get('ams_mapping', [0]),
+            "profile_id": "0", "project_id": "0", "subtask_id": "0", "task_id": "0",
+        }
+
+    def _resolve_acks(self, payload):
+        # A resposta a um comando ecoa o sequence_id do pedido, com "result"
+        for section in ('print', 'system'):
+            block = payload.get(section)
+            if not isinstance(block, dict) or block.get('command') == 'push_status':
+                continue
+            entry = self.pending_acks.pop(str(block.get('sequence_id', '')), None)
+            if entry is None or entry[0].done():
+                continue
+            result = str(block.get('result', 'success')).lower()
+            if result in ('success', 'ok'):
+                entry[0].set_result(result)
+            else:
+                entry[0].set_exception(RuntimeError(block.get('reason') or result))
+
+    def _expire_acks(self):
+        now = time.monotonic()
+        for seq, (fut, deadline) in list(self.pending_acks.items()):
+            if deadline <= now:
+                self.pending_acks.pop(seq, None)
+                if not fut.done():
+                    fut.set_exception(TimeoutError())
+
+    def _fail_pending_acks(self, error):
+        pending, self.pending_acks = self.pending_acks, {}
+        for fut, _ in pending.values():
+            if not fut.done():
+                fut.set_exception(error)
+
     def send_command(self, command, **kwargs):
-        if not self.connected_flag: return
+        if not self.connected_flag or not self.client:
+            raise ConnectionError("MQTT desconectado")
         topic = f"device/{self.serial}/request"
-        
-        msg = {}
+        seq = str(next(_BAMBU_SEQUENCE))
+
         if command == 'pause':
-            msg = {"print": {"command": "pause", "sequence_id": "0"}}
+            msg = {"print": {"command": "pause", "sequence_id": seq}}
         elif command == 'resume':
-            msg = {"print": {"command": "resume", "sequence_id": "0"}}
+            msg = {"print": {"command": "resume", "sequence_id": seq}}
         elif command == 'stop':
-            msg = {"print": {"command": "stop", "sequence_id": "0"}}
+            msg = {"print": {"command": "stop", "sequence_id": seq}}
         elif command == 'led':
             val = int(kwargs.get('val', 0))
-            msg = {"system": {"sequence_id": "0", "command": "ledctrl", "led_node": "chamber_light", "led_mode": "on" if val > 0 else "off"}}
+            msg = {"system": {"sequence_id": seq, "command": "ledctrl", "led_node": "chamber_light", "led_mode": "on" if val > 0 else "off"}}
         elif command == 'speed':
             val = int(kwargs.get('val', 2))
-            msg = {"print": {"sequence_id": "0", "command": "speed_level", "param": str(val)}}
-        
-        # Movement and extrusion controls REMOVED as per user request
-        # elif command == 'home': ...
-        # elif command == 'move': ...
-        # elif command == 'extrude': ...
-        # elif command == 'motors_off': ...
-        
-        if msg:
-            self.client.publish(topic, json.dumps(msg))
+            msg = {"print": {"sequence_id": seq, "command": "speed_level", "param": str(val)}}
+        elif command == 'start_print':
+            msg = {"print": self._start_print_params(kwargs['filename'], kwargs)}
+            msg["print"]["sequence_id"] = seq
+        else:
+            # Movement and extrusion controls REMOVED as per user request
+            # (home, move, extrude, motors_off)
+            raise ValueError(f"Comando não suportado: {command}")
 
+        fut = Future()
+        fut.set_running_or_notify_cancel()
+        self.pending_acks[seq] = (fut, time.monotonic() + COMMAND_ACK_TIMEOUT)
+        info = self.client.publish(topic, json.dumps(msg))
+        if info.rc != mqtt.MQTT_ERR_SUCCESS:
+            self.pending_acks.pop(seq, None)
+            raise ConnectionError(f"Falha ao publicar comando MQTT (rc={info.rc})")
+        return fut
+
+PRINTER_CLASSES = {
+    'moonraker': MoonrakerPrinter,
+    'elegoo': ElegooPrinter,
+    'bambu': BambuPrinter,
+}
 
 def create_printer_from_config(config):
-    p_type = config.get('type')
-    if p_type == 'moonraker':
-        return MoonrakerPrinter(config)
-    elif p_type == 'elegoo':
-        return ElegooPrinter(config)
-    elif p_type == 'bambu':
-        p = BambuPrinter(config)
-        p.connect()
-        return p
-    return None
+    """Construção barata, sem rede. Quem cria deve chamar `connect()` (em paralelo)."""
+    cls = PRINTER_CLASSES.get(config.get('type'))
+    return cls(config) if cls else None
@@ -0,0 +1,112 @@
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+try:
+    import psutil  # tempo de CPU por thread
+except ImportError:
+    psutil = None
+
+MAX_SECONDS = 60
+_busy = threading.Lock()
+
+
+class ProfilerBusy(Exception):
+    pass
+
+
+def _thread_cpu():
+    """native_id -> segundos de CPU (user + system)."""
+    if psutil is None:
+        return {}
+    try:
+        return {t.id: t.user_time + t.system_time for t in psutil.Process(os.getpid()).threads()}
+    except Exception:
+        return {}
+
+
+def _frame_label(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def sample(seconds=10, interval=0.01):
+    """Amostra as pilhas de todas as threads por `seconds` segundos.
+
+    A cada `interval` lê `sys._current_frames()` (só Python, sem ferramentas
+    externas) e conta cada pilha no formato "collapsed" (raiz;...;folha), com o
+    nome da thread como raiz. Retorna (pilhas: Counter, threads: lista com
+    amostras e CPU por thread, duração real).
+
+    Só um perfil por vez: levanta `ProfilerBusy` se já houver outro rodando.
+    """
+    seconds = max(0.1, min(float(seconds), MAX_SECONDS))
+    if not _busy.acquire(blocking=False):
+        raise ProfilerBusy()
+    try:
+        me = threading.get_ident()
+        stacks = Counter()
+        per_thread = Counter()
+        labels = {}  # cache de rótulos por objeto code
+        names = {threading.get_native_id(): 'profiler (amostrador)'}
+        cpu_start = _thread_cpu()
+        started = time.perf_counter()
+        deadline = started + seconds
+        next_tick = started
+        while True:
+            now = time.perf_counter()
+            if now >= deadline:
+                break
+            if now < next_tick:
+                time.sleep(next_tick - now)
+            next_tick += interval
+            threads = {t.ident: t for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                thread = threads.get(ident)
+                name = thread.name if thread else f"thread-{ident}"
+                if thread is not None:
+                    names[thread.native_id] = name
+                parts = []
+                while frame is not None:
+                    code = frame.f_code
+                    label = labels.get(code)
+                    if label is None:
+                        label = labels[code] = _frame_label(code)
+                    parts.append(label)
+                    frame = frame.f_back
+                parts.append(name)
+                stacks[';'.join(reversed(parts))] += 1
+                per_thread[name] += 1
+        elapsed = time.perf_counter() - started
+        cpu_end = _thread_cpu()
+    finally:
+        _busy.release()
+
+    threads = []
+    for native_id, cpu in cpu_end.items():
+        delta = cpu - cpu_start.get(native_id, 0.0)
+        name = names.get(native_id) or ('main' if native_id == os.getpid() else f"native-{native_id}")
+        threads.append({
+            'name': name,
+            'native_id': native_id,
+            'cpu_seconds': round(delta, 3),
+            'cpu_percent': round(100.0 * delta / elapsed, 1) if elapsed else 0.0,
+            'samples': per_thread.get(name, 0),
+        })
+    if not cpu_end:
+        threads = [{'name': n, 'samples': c} for n, c in per_thread.items()]
+    threads.sort(key=lambda t: (t.get('cpu_seconds', 0), t['samples']), reverse=True)
+    return stacks, threads, elapsed
+
+
+def collapsed(stacks, only_threads=None):
+    """Texto no formato "collapsed" (flamegraph.pl, speedscope, inferno)."""
+    lines = []
+    for stack, count in stacks.most_common():
+        if only_threads is not None and stack.split(';', 1)[0] not in only_threads:
+            continue
+        lines.append(f"{stack} {count}")
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,64 @@
+const authStatus = document.getElementById('authStatus');
+const userName = document.getElementById('userName');
+const userEmail = document.getElementById('userEmail');
+const userAvatar = document.getElementById('userAvatar');
+const connectionBadge = document.getElementById('connectionBadge');
+const tokenInput = document.getElementById('token');
+
+async function verifyToken() {
+    try {
+        // Usar api/auth/profile que retorna email e token_raw
+        const res = await fetch('/api/auth/profile');
+        const data = await res.json();
+
+        if (data.success && data.data) {
+            authStatus.style.display = 'block';
+            userName.innerText = data.data.full_name || 'Authenticated User';
+            userEmail.innerText = data.data.email || 'N/A';
+            userAvatar.innerText = (data.data.full_name || 'A')[0].toUpperCase();
+
+            connectionBadge.innerText = 'Connected';
+            connectionBadge.className = 'sbadge sbadge-running';
+
+            // Preencher o token em texto puro se retornar
+            if (data.token_raw) {
+                tokenInput.value = data.token_raw;
+            }
+        } else {
+            authStatus.style.display = 'none';
+            connectionBadge.innerText = 'Disconnected';
+            connectionBadge.className = 'sbadge sbadge-offline';
+        }
+    } catch (e) {
+        console.error('Auth profile error:', e);
+    }
+}
+
+document.getElementById('tokenForm').addEventListener('submit', async (e) => {
+    e.preventDefault();
+    const token = tokenInput.value;
+    const msg = document.getElementById('msg');
+
+    const res = await fetch('/api/save_token', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ token })
+    });
+
+    const data = await res.json();
+
+    msg.style.display = 'block';
+    if (data.success) {
+        msg.style.backgroundColor = 'rgba(46, 160, 67, 0.2)';
+        msg.style.color = 'var(--success-color)';
+        msg.innerText = 'Token saved successfully! Verifying connection...';
+        setTimeout(verifyToken, 1000);
+    } else {
+        msg.style.backgroundColor = 'rgba(248, 81, 73, 0.2)';
+        msg.style.color = 'var(--danger-color)';
+        msg.innerText = 'Failed to save token.';
+    }
+});
+
+// Carregar informações ao abrir a página
+verifyToken();
@@ -0,0 +1,15 @@
+const sidebar = document.getElementById('sidebar');
+const toggleBtn = document.getElementById('toggle-sidebar-btn');
+const closeBtn = document.getElementById('close-sidebar-btn');
+
+toggleBtn?.addEventListener('click', () => sidebar.classList.add('open'));
+closeBtn?.addEventListener('click', () => sidebar.classList.remove('open'));
+
+document.addEventListener('click', (e) => {
+    if (window.innerWidth <= 768 &&
+        !sidebar.contains(e.target) &&
+        !toggleBtn.contains(e.target) &&
+        sidebar.classList.contains('open')) {
+        sidebar.classList.remove('open');
+    }
+});
@@ -0,0 +1,82 @@
+document.getElementById('init-time').innerText = new Date().toLocaleTimeString();
+
+let autoScroll = true;
+let lastLogId = 0;
+let logCount = 0;
+let filterTimer = null;
+
+function toggleAutoScroll() {
+    autoScroll = !autoScroll;
+    document.getElementById('btn-autoscroll').classList.toggle('active', autoScroll);
+}
+
+function clearConsole() {
+    document.getElementById('console-output').innerHTML = '';
+    logCount = 0;
+    updateCount();
+}
+
+function updateCount() {
+    document.getElementById('log-count').innerText = `(${logCount} lines)`;
+}
+
+function appendLog(log) {
+    const output = document.getElementById('console-output');
+    const line = document.createElement('div');
+    line.className = 'log-line';
+
+    const levelClass = `level-${log.level.toLowerCase()}`;
+
+    line.innerHTML = `
+        <span class="log-time">${log.time}</span>
+        <span class="log-level ${levelClass}">${log.level}</span>
+        <span class="log-msg">${log.message}</span>
+    `;
+
+    output.appendChild(line);
+    logCount++;
+    updateCount();
+
+    if (autoScroll) {
+        output.scrollTop = output.scrollHeight;
+    }
+
+    // Keep last 1000 lines
+    if (output.children.length > 1000) {
+        output.removeChild(output.firstChild);
+    }
+}
+
+function logQuery() {
+    const params = new URLSearchParams({ last_id: lastLogId });
+    const level = document.getElementById('filter-level').value;
+    const text = document.getElementById('filter-text').value.trim();
+    if (level) params.set('level', level);
+    if (text) params.set('q', text);
+    return params.toString();
+}
+
+function applyFilters() {
+    // Filtros são aplicados no servidor: recomeça do início do buffer
+    clearConsole();
+    lastLogId = 0;
+    fetchLogs();
+}
+
+async function fetchLogs() {
+    try {
+        const res = await fetch(`/api/logs?${logQuery()}`);
+        const logs = await res.json();
+
+        if (logs.length > 0) {
+            logs.forEach(log => {
+                appendLog(log);
+                lastLogId = Math.max(lastLogId, log.id);
+            });
+        }
+    } catch (e) {
+        console.error('Failed to fetch logs:', e);
+    }
+}
+
+setInterval(fetchLogs, 1000);
@@ -0,0 +1,818 @@
+/* ══════════════════════════════════════
+       SVG ICONS
+    ══════════════════════════════════════ */
+    const SVGS = {
+        bambu: `<svg viewBox="0 0 28 28" fill="none" > <rect x="3" y="7" width="22" height="16" rx="2.5" fill="#0a1a0a" stroke="#2ea043" stroke-width="1.2" /> <rect x="6" y="10" width="16" height="10" rx="1.5" fill="#050e05" stroke="#2ea043" stroke-width="0.8" /> <line x1="14" y1="7" x2="14" y2="3.5" stroke="#2ea043" stroke-width="1.5" stroke-linecap="round" /> <circle cx="14" cy="2.5" r="1.5" fill="#2ea043" /> <rect x="7" y="22" width="3" height="3" rx="0.8" fill="#2ea043" opacity="0.6" /> <rect x="18" y="22" width="3" height="3" rx="0.8" fill="#2ea043" opacity="0.6" /> <path d="M9 15 L14 12 L19 15" stroke="#3fb950" stroke-width="1.2" stroke-linecap="round" stroke-linejoin="round" /> </svg>`,
+        moonraker: `<svg viewBox="0 0 28 28" fill="none" > <rect x="4" y="8" width="20" height="14" rx="2" fill="#00151a" stroke="#03a9f4" stroke-width="1.2" /> <rect x="7" y="11" width="14" height="8" rx="1" fill="#00090d" stroke="#03a9f4" stroke-width="0.8" /> <line x1="14" y1="8" x2="14" y2="4" stroke="#03a9f4" stroke-width="1.5" stroke-linecap="round" /> <circle cx="14" cy="3" r="2" fill="#03a9f4" /> <rect x="5" y="22" width="18" height="2.5" rx="1.2" fill="#03a9f4" opacity="0.4" /> <path d="M10 16 L14 13.5 L18 16 L18 18 L10 18 Z" fill="#03a9f4" opacity="0.2" stroke="#03a9f4" stroke-width="0.8" /> </svg>`,
+        elegoo: `<svg viewBox="0 0 28 28" fill="none" > <rect x="6" y="3" width="16" height="22" rx="2.5" fill="#0a0015" stroke="#8957e5" stroke-width="1.2" /> <rect x="9" y="6" width="10" height="14" rx="1.5" fill="#060010" stroke="#8957e5" stroke-width="0.8" /> <line x1="10" y1="9" x2="18" y2="9" stroke="#8957e5" stroke-width="0.6" opacity="0.5" /> <line x1="10" y1="12" x2="18" y2="12" stroke="#8957e5" stroke-width="0.6" opacity="0.5" /> <line x1="10" y1="15" x2="18" y2="15" stroke="#8957e5" stroke-width="0.6" opacity="0.5" /> <rect x="9" y="22" width="10" height="2" rx="1" fill="#8957e5" opacity="0.5" /> </svg>`
+    };
+
+    const TYPE_META = {
+        bambu: {
+            accent: '#2ea043', label: 'Bambu Lab', pf: 'pf-bambu'
+        }
+
+        ,
+        moonraker: {
+            accent: '#03a9f4', label: 'Klipper/Moonraker', pf: 'pf-moonraker'
+        }
+
+        ,
+        elegoo: {
+            accent: '#8957e5', label: 'Elegoo Resin', pf: 'pf-elegoo'
+        }
+    };
+
+    /* ══════════════════════════════════════
+       HELPERS
+    ══════════════════════════════════════ */
+    function wifiSignalColor(dbm) {
+        if (!dbm) return 'var(--text-3)';
+        if (dbm >= -50) return '#3fb950'; // Excelente
+        if (dbm >= -60) return '#d29922'; // Bom
+        if (dbm >= -70) return '#f85149'; // Regular
+        return '#8b1418'; // Ruim
+    }
+
+    function stateOf(p) {
+        if (p.enabled === false || p.state === 'off') return 'offline';
+        const s = (p.state || '').toLowerCase();
+        if (s.includes('run') || s.includes('print')) return 'running';
+        if (s.includes('paus')) return 'paused';
+        if (s.includes('offline') || s.includes('disc')) return 'offline';
+        return 'idle';
+    }
+
+    function badgeCls(sc) {
+        const map = {
+            running: 'sbadge-running',
+            paused: 'sbadge-paused',
+            offline: 'sbadge-offline',
+            idle: 'sbadge-idle'
+        };
+        return map[sc] || 'sbadge-idle';
+    }
+
+    function tempCls(t) {
+        t = parseFloat(t);
+        if (t > 150) return 'c-hot';
+        if (t > 50) return 'c-warm';
+        return 'c-cool';
+    }
+
+    function fmtEta(mins) {
+        if (!mins || mins <= 0) return '--';
+        const h = Math.floor(mins / 60);
+        const m = Math.round(mins % 60);
+        return h > 0 ? `${h}h ${m}m` : `${m}m`;
+    }
+
+    function esc(obj) {
+        return JSON.stringify(obj).replace(/\\/g, '\\\\').replace(/'/g, "\\'").replace(/"/g, '&quot;');
+    }
+
+    function timeSince(ts) {
+        if (!ts || ts === 0) return '';
+        const sec = Math.floor(Date.now() / 1000 - ts);
+        if (sec < 2) return '<span class="time-since-label" style="color:var(--green); font-weight:bold; opacity:0.9; margin-left:6px;">[agora]</span>';
+        if (sec < 60) return `<span class="time-since-label" style="opacity:0.6; margin-left:6px;">[${sec}s]</span>`;
+        const mins = Math.floor(sec / 60);
+        return `<span class="time-since-label" style="opacity:0.5; margin-left:6px;">[${mins}m]</span>`;
+    }
+
+    function updateLocalTimers() {
+        document.querySelectorAll('.pcard').forEach(card => {
+            const ts = parseInt(card.dataset.lastUpdate);
+            const label = card.querySelector('.time-since-label');
+            if (!ts || !label) return;
+
+            const sec = Math.floor(Date.now() / 1000 - ts);
+            if (sec < 2) {
+                label.innerHTML = '[agora]';
+                label.style.color = 'var(--green)';
+                label.style.fontWeight = 'bold';
+                label.style.opacity = '0.9';
+            } else if (sec < 60) {
+                label.innerHTML = `[${sec}s]`;
+                label.style.color = '';
+                label.style.fontWeight = '';
+                label.style.opacity = '0.6';
+            } else {
+                const mins = Math.floor(sec / 60);
+                label.innerHTML = `[${mins}m]`;
+                label.style.opacity = '0.5';
+            }
+        });
+    }
+
+    /* ══════════════════════════════════════
+CARD BUILDER
+══════════════════════════════════════ */
+    function buildCard(p) {
+        const sc = stateOf(p);
+
+        const meta = TYPE_META[p.type] || { accent: '#58a6ff', label: p.type, pf: 'pf-bambu' };
+        const svg = SVGS[p.type] || SVGS.moonraker;
+        const prog = parseFloat(p.progress || 0).toFixed(1);
+        const nozzle = parseFloat(p.temp_nozzle || 0).toFixed(1);
+        const bed = parseFloat(p.temp_bed || 0).toFixed(1);
+        const targetNozzle = p.target_nozzle || 0;
+        const targetBed = p.target_bed || 0;
+        const layer = p.layer || 0;
+        const totalL = p.total_layers || 0;
+        const eta = fmtEta(p.remaining_time);
+        const finishTime = p.finish_time || '--';
+        const enabled = p.enabled !== false;
+        const camUrl = p.camera_url || '';
+        const pJson = esc(p);
+
+        /* Camera / Cover Image */
+        let finalCamUrl = camUrl;
+        if (p.type === 'bambu' && !camUrl && enabled) {
+            finalCamUrl = `/api/camera/${p.id}?size=thumb`;
+        }
+
+        // Moonraker auto-discovery
+        if (p.type === 'moonraker' && !p.custom_camera && p.auto_camera_url && enabled) {
+            finalCamUrl = p.auto_camera_url;
+        }
+
+        if (finalCamUrl && (p.camera_refresh || p.type === 'bambu')) {
+            finalCamUrl += (finalCamUrl.includes('?') ? '&' : '?') + 't=' + Date.now();
+        }
+
+        // Cover image placeholder or extracted image if available
+        const coverHtml = (p.cover_image) ? `
+            <div class="pcard-cover" style="margin: 0 1rem 0.5rem; border-radius:8px; overflow:hidden; border:1px solid var(--border); aspect-ratio:16/9; background:#000;">
+                <img src="${p.cover_image.startsWith('http') ? p.cover_image : 'data:image/png;base64,' + p.cover_image}" style="width:100%; height:100%; object-fit:contain;">
+            </div>
+        ` : '';
+
+        const cameraHtml = (finalCamUrl && enabled) ? `
+            <div class="pcard-camera">
+                <img src="${finalCamUrl}" alt="cam" onload="this.style.display='block';this.nextElementSibling.style.display='none'" onerror="this.style.display='none';this.nextElementSibling.style.display='flex'">
+                <div class="cam-offline" style="display:flex;">
+                    <i class="fas fa-video-slash"></i>
+                    <span>Camera offline</span>
+                </div>
+            </div>` : '';
+
+        /* Filename / Task Name */
+        const taskName = p.task_name || p.filename || '';
+        const fileHtml = taskName ? ` <div class="pcard-file" title="${p.filename || ''}"><i class="fas fa-cube" style="color:var(--accent);"></i><strong> ${taskName}</strong></div>` : '';
+
+        /* Print action buttons */
+        let printBtns = '';
+
+        if (sc === 'running') {
+            printBtns = ` <button class="ctrl-btn c-pause" onclick="ctrl('${p.id}','pause')" ><i class="fas fa-pause" ></i> Pause</button> <button class="ctrl-btn c-stop" onclick="ctrl('${p.id}','stop')" ><i class="fas fa-stop" ></i> Stop</button>`;
+        }
+
+        else if (sc === 'paused') {
+            printBtns = ` <button class="ctrl-btn c-resume" onclick="ctrl('${p.id}','resume')" ><i class="fas fa-play" ></i> Resume</button> <button class="ctrl-btn c-stop" onclick="ctrl('${p.id}','stop')" ><i class="fas fa-stop" ></i> Stop</button>`;
+        }
+
+        /* Advanced controls */
+        let advHtml = '';
+        const fw = p.firmware_update || {};
+        const err = p.print_error || {};
+
+        if (enabled && sc !== 'offline') {
+            if (p.type === 'moonraker') {
+                advHtml = `
+                    <div class="pcard-controls">
+                        <div class="ctrl-label"><i class="fas fa-lightbulb" style="margin-right:4px;"></i>Intensidade LED</div>
+                        <input type="range" class="led-slider" min="0" max="100" value="${p.led_val || 0}" 
+                               oninput="this.nextElementSibling.innerText = this.value + '%'"
+                               onchange="ctrlV('${p.id}','led',this.value)">
+                        <div style="font-size:0.6rem; color:var(--text-3); text-align:right; margin-top:-5px; margin-bottom:5px;">${p.led_val || 0}%</div>
+
+                        <div class="ctrl-label"><i class="fas fa-fan" style="margin-right:4px;"></i>Cooler Peça</div>
+                        <input type="range" class="led-slider" min="0" max="100" value="${p.fan_val || 0}" 
+                               oninput="this.nextElementSibling.innerText = this.value + '%'"
+                               onchange="ctrlV('${p.id}','fan',this.value)">
+                        <div style="font-size:0.6rem; color:var(--text-3); text-align:right; margin-top:-5px;">${p.fan_val || 0}%</div>
+
+                        <div class="ctrl-row" style="margin-top:0.8rem;">
+                            <button class="ctrl-btn c-pause" onclick="ctrl('${p.id}','pause')" title="Pause"><i class="fas fa-pause"></i></button>
+                            <button class="ctrl-btn c-resume" onclick="ctrl('${p.id}','resume')" title="Resume"><i class="fas fa-play"></i></button>
+                            <button class="ctrl-btn c-stop" onclick="ctrl('${p.id}','stop')" title="Cancel Print"><i class="fas fa-times-circle"></i> Cancel</button>
+                        </div>
+
+                        <div class="ctrl-row" style="margin-top:0.5rem; border-top:1px solid rgba(255,255,255,0.05); padding-top:0.5rem;">
+                            <button class="ctrl-btn c-home" onclick="ctrl('${p.id}','home')"><i class="fas fa-home"></i> Home</button>
+                            <button class="ctrl-btn c-danger" onclick="confirmMotors('${p.id}')"><i class="fas fa-power-off"></i> Motors</button>
+                            <button class="ctrl-btn c-stop" onclick="confirmReboot('${p.id}')"><i class="fas fa-sync-alt"></i> Reboot</button>
+                            <button class="ctrl-btn" onclick="openGcodeModal('${p.id}')"><i class="fas fa-terminal"></i> G-Code</button>
+                        </div>
+                    </div>`;
+            }
+            else if (p.type === 'elegoo') {
+                advHtml = ` <div class="pcard-controls" > <div class="ctrl-row" > <button class="ctrl-btn c-pause" onclick="ctrl('${p.id}','pause')" ><i class="fas fa-pause" ></i> Pause</button> <button class="ctrl-btn c-resume" onclick="ctrl('${p.id}','resume')" ><i class="fas fa-play" ></i> Resume</button> <button class="ctrl-btn c-stop" onclick="ctrl('${p.id}','stop')" ><i class="fas fa-stop" ></i> Stop</button> </div> </div>`;
+            }
+
+            /* Global Additional Info Block */
+            advHtml += `
+                <div class="pcard-controls">
+                    <div class="ctrl-label"><i class="fas fa-info-circle"></i> Informações Adicionais</div>
+                    <div style="display:grid; grid-template-columns: 1fr 1fr; gap:0.5rem; margin-top:5px;">
+                        ${p.wifi_signal ? `
+                        <div class="stat-box" style="padding: 5px;">
+                            <div class="stat-lbl">Wi-Fi Signal</div>
+                            <div class="stat-val" style="font-size:0.7rem; color:${wifiSignalColor(p.wifi_signal)}">${p.wifi_signal} dBm</div>
+                        </div>` : ''}
+                        ${(p.type === 'bambu' && p.active_tray_name) ? `
+                        <div class="stat-box" style="padding: 5px;" title="UUID: ${p.active_tray_uuid || 'N/A'}">
+                            <div class="stat-lbl">Active Tray</div>
+                            <div class="stat-val" style="font-size:0.7rem;">${p.active_tray_name}</div>
+                        </div>` : ''}
+                        ${(p.type === 'bambu' && p.print_weight) ? `
+                        <div class="stat-box" style="padding: 5px;">
+                            <div class="stat-lbl">Print Weight</div>
+                            <div class="stat-val" style="font-size:0.7rem;">${p.print_weight} g</div>
+                        </div>` : ''}
+                        ${fw.current ? `
+                        <div class="stat-box" style="padding: 5px; grid-column: span 2;">
+                            <div class="stat-lbl">Firmware Version</div>
+                            <div class="stat-val" style="font-size:0.7rem;">${fw.current}</div>
+                        </div>` : ''}
+                    </div>
+                </div>
+            `;
+
+            if (fw.available || (fw.current && fw.latest && fw.current !== fw.latest)) {
+                advHtml += `
+                    <div class="pcard-controls" style="border-top:none; padding-top:0;">
+                        <div class="hms-box" style="background:var(--accent-dim); border-color:var(--accent); color:var(--text-1); font-size:0.7rem;">
+                            <i class="fas fa-sync-alt"></i> Atualização disponível: ${fw.latest} (Atual: ${fw.current})
+                        </div>
+                    </div>
+                `;
+            }
+
+            if (err.code && err.code !== 0) {
+                advHtml += `
+                    <div class="pcard-controls" style="border-top:none; padding-top:0;">
+                        <div class="hms-box">
+                            <i class="fas fa-exclamation-circle"></i> Erro: ${err.message || err.code}
+                        </div>
+                    </div>
+                `;
+            }
+        }
+
+        /* Print controls row (Bambu / Klipper when printing) */
+        const printCtrlHtml = (printBtns && p.type !== 'elegoo' && p.type !== 'moonraker') ? ` <div class="pcard-controls" style="padding-top:0.5rem;border-top:none;" > <div class="ctrl-row" >${printBtns}
+                </div> </div>` : '';
+
+        const usageBox = `
+            <div class="stat-box" title="Horas totais acumuladas">
+                <div class="stat-lbl"><i class="fas fa-hourglass-half"></i> Horas</div>
+                <div class="stat-val">${parseFloat(p.total_usage || 0).toFixed(4)}h</div>
+            </div>`;
+
+        const statsHtml = p.type === 'elegoo' ? `
+            ${usageBox}
+            <div class="stat-box">
+                <div class="stat-lbl"><i class="fas fa-history"></i> Last Upd</div>
+                <div class="stat-val" style="font-size:0.7rem;">${new Date(p.last_update * 1000).toLocaleTimeString([], { hour: '2-digit', minute: '2-digit' })}</div>
+            </div>
+            <div class="stat-box">
+                <div class="stat-lbl"><i class="fas fa-layer-group"></i> Layer</div>
+                <div class="stat-val">${totalL > 0 ? `${layer}/${totalL}` : '--'}</div>
+            </div>
+            <div class="stat-box">
+                <div class="stat-lbl"><i class="fas fa-clock"></i> ETA</div>
+                <div class="stat-val">${eta}</div>
+            </div>
+            <div class="stat-box">
+                <div class="stat-lbl"><i class="fas fa-flag-checkered"></i> End</div>
+                <div class="stat-val">${finishTime}</div>
+            </div>
+        ` : `
+            <div class="stat-box">
+                <div class="stat-lbl"><i class="fas fa-thermometer-half"></i> Bico</div>
+                <div class="stat-val ${tempCls(nozzle)}">
+                    ${nozzle}°C${targetNozzle > 0 ? `<span class="target-val">/${targetNozzle}</span>` : ''}
+                </div>
+            </div>
+            <div class="stat-box">
+                <div class="stat-lbl"><i class="fas fa-bed"></i> Mesa</div>
+                <div class="stat-val ${tempCls(bed)}">
+                    ${bed}°C${targetBed > 0 ? `<span class="target-val">/${targetBed}</span>` : ''}
+                </div>
+            </div>
+            ${usageBox}
+            <div class="stat-box">
+                <div class="stat-lbl"><i class="fas fa-layer-group"></i> Camada</div>
+                <div class="stat-val">${totalL > 0 ? `${layer}/${totalL}` : '--'}</div>
+            </div>
+            <div class="stat-box">
+                <div class="stat-lbl"><i class="fas fa-clock"></i> ETA</div>
+                <div class="stat-val">${eta}</div>
+            </div>
+            <div class="stat-box">
+                <div class="stat-lbl"><i class="fas fa-hourglass-half"></i> Duração</div>
+                <div class="stat-val">${fmtEta(p.total_duration)}</div>
+            </div>
+            <div class="stat-box">
+                <div class="stat-lbl"><i class="fas fa-flag-checkered"></i> Fim</div>
+                <div class="stat-val">${finishTime}</div>
+            </div>
+        `;
+
+        return `
+            <div class="pcard t-${p.type} s-${sc} ${enabled ? '' : 'disabled'}" data-last-update="${p.last_update}">
+                <div class="pcard-stripe"></div>
+                <div class="pcard-header">
+                    <div class="pcard-icon" style="background:${meta.accent}18;border-color:${meta.accent}30;">
+                        ${svg}
+                    </div>
+                    <div class="pcard-meta">
+                        <div class="pcard-name">${p.name} ${timeSince(p.last_update)}</div>
+                        <div class="pcard-sub">
+                            <i class="fas fa-network-wired" style="opacity:0.4;font-size:0.6rem;"></i>
+                            ${p.ip} · ${meta.label}
+                        </div>
+                    </div>
+                    <div class="pcard-right">
+                        <span class="sbadge ${badgeCls(sc)}">${p.state || 'unknown'}</span>
+                        <label class="ptoggle" title="${enabled ? 'Enabled' : 'Disabled'}">
+                            <input type="checkbox"${enabled ? 'checked' : ''} onchange="togglePrinter('${p.id}')">
+                            <span class="ptoggle-slider"></span>
+                        </label>
+                    </div>
+                </div>
+
+                ${cameraHtml}
+                ${coverHtml}
+                ${fileHtml}
+
+                <div class="pcard-progress">
+                    <div class="prog-labels">
+                        <span>Progresso</span>
+                        <strong>${prog}%</strong>
+                    </div>
+                    <div class="prog-bar">
+                        <div class="prog-fill ${meta.pf}" style="width:${prog}%;"></div>
+                    </div>
+                </div>
+
+                ${p.hms && p.hms.length > 0 ? `
+                    <div class="hms-box">
+                        ${p.hms.map(h => `
+                            <div class="hms-item">
+                                <span><i class="fas fa-exclamation-triangle"></i> HMS ${h.attr.toString(16).toUpperCase()}</span>
+                                <a href="https://wiki.bambulab.com/en/x1/troubleshooting/hmscode/${h.attr.toString(16).padStart(8, '0').toUpperCase()}" target="_blank">WIKI</a>
+                            </div>
+                        `).join('')}
+                    </div>
+                ` : ''}
+
+                ${p.ams && p.ams.length > 0 ? (() => {
+                const units = {};
+                p.ams.forEach(t => {
+                    if (!units[t.ams]) units[t.ams] = { humidity: t.humidity, trays: [] };
+                    units[t.ams].trays.push(t);
+                });
+
+                return Object.keys(units).map(unitId => `
+                        <div class="ams-unit-container" style="margin-bottom:15px;">
+                            <div class="ams-label">
+                                ${parseInt(unitId) === 254 ? 'Carretel Externo' : `AMS ${parseInt(unitId) + 1}`} 
+                                <span style="margin-left:auto; font-size:0.65rem; background:rgba(255,255,255,0.05); padding:2px 6px; border-radius:4px; color:var(--text-2);">
+                                    ${parseInt(unitId) === 254 ? '' : `<i class="fas fa-tint"></i> Umidade: ${units[unitId].humidity}`}
+                                </span>
+                            </div>
+                            <div class="ams-grid">
+                                ${units[unitId].trays.map(t => {
+                    if (t.empty) return `<div class="ams-tray tray-empty" title="Vazio"></div>`;
+                    let hexColor = t.color || 'FFFFFF';
+                    if (hexColor.startsWith('#')) hexColor = hexColor.substring(1);
+                    const cleanColor = hexColor.substring(0, 6);
+                    const isLight = parseInt(cleanColor, 16) > 0x888888;
+                    const txtCol = isLight ? '#000' : '#fff';
+                    const prog = t.remain >= 0 ? t.remain : 0;
+                    return `
+                                        <div class="ams-tray ${t.active ? 'tray-active' : ''}" 
+                                             style="background:#${cleanColor};" 
+                                             title="${t.brand || ''} ${t.type} (${prog}%)\nUUID: ${t.uuid || 'N/A'}\n${parseInt(unitId) === 254 ? 'Externo' : `AMS ${parseInt(unitId) + 1}, Slot ${t.id + 1}`}">
+                                            <span style="font-size:0.5rem;opacity:0.6;position:absolute;top:1px;left:3px;color:${txtCol}; z-index:3;">${parseInt(unitId) === 254 ? 'E' : t.id + 1}</span>
+                                            <div class="ams-remain-bar" style="height:${100 - prog}%;"></div>
+                                            <div style="position:relative; z-index:2; color:${txtCol}; display:flex; flex-direction:column; line-height:1.1;">
+                                                <span style="font-size:0.5rem;opacity:0.8;">${t.brand || '---'}</span>
+                                                <span style="font-weight:bold;font-size:0.7rem;">${t.type}</span>
+                                            </div>
+                                        </div>`;
+                }).join('')}
+                            </div>
+                        </div>
+                    `).join('');
+            })() : ''}
+
+                <div class="pcard-stats">
+                    ${statsHtml}
+                </div>
+
+                ${printCtrlHtml}
+                ${advHtml}
+
+                <div class="pcard-footer">
+                    <div class="footer-left">
+                        <button class="icon-btn" title="Mover para Esquerda" onclick="reorder('${p.id}', 'up')">
+                            <i class="fas fa-chevron-left"></i>
+                        </button>
+                        <button class="icon-btn" title="Mover para Direita" onclick="reorder('${p.id}', 'down')">
+                            <i class="fas fa-chevron-right"></i>
+                        </button>
+                        <button class="icon-btn" title="Raw Data" onclick="openRaw('${p.id}')">
+                            <i class="fas fa-code"></i>
+                        </button>
+                    </div>
+                    <button class="icon-btn ib-settings" title="Settings" onclick="openEditModal(${pJson})">
+                        <i class="fas fa-cog"></i> Settings
+                    </button>
+                </div>
+            </div>`;
+
+    }
+
+    /* ══════════════════════════════════════
+FETCH & RENDER
+══════════════════════════════════════ */
+    let lastPrinters = [];
+    const interactionLocks = {}; // Locks printer UI updates for a few seconds
+
+    async function fetchPrinters() {
+        try {
+            const res = await fetch('/api/printers');
+            const printers = await res.json();
+            lastPrinters = printers;
+            const grid = document.getElementById('printerGrid');
+            if (!printers.length) {
+                if (grid.querySelectorAll('.pcard').length === 0) {
+                    grid.innerHTML = `<div class="empty-state"> <div class="empty-icon"><i class="fas fa-print"></i></div> <h3>No printers configured</h3> <p>Add your first printer to get started.</p> <button class="btn btn-primary" onclick="openAddModal()"> <i class="fas fa-plus"></i> Add Printer </button> </div>`;
+                }
+                return;
+            }
+
+            // Remove empty state if present
+            const emptyState = grid.querySelector('.empty-state');
+            if (emptyState) emptyState.remove();
+
+            // Surgical update to avoid resetting streams
+            const currentCards = Array.from(grid.querySelectorAll('.pcard'));
+            const currentIds = currentCards.map(c => c.dataset.id);
+            const newIds = printers.map(p => p.id);
+
+            // Remove deleted
+            currentCards.forEach(card => {
+                if (!newIds.includes(card.dataset.id)) card.remove();
+            });
+
+            // Update or Add
+            printers.forEach((p, idx) => {
+                // Skip rendering if printer is locked (user interacting)
+                if (interactionLocks[p.id] && Date.now() < interactionLocks[p.id]) {
+                    // merge backend meta but keep local control values
+                    const old = lastPrinters.find(x => x.id === p.id);
+                    if (old) {
+                        p.led_val = old.led_val;
+                        p.fan_val = old.fan_val;
+                        p.fan_aux_val = old.fan_aux_val;
+                        p.fan_chamber_val = old.fan_chamber_val;
+                    }
+                }
+
+                const cardHtml = buildCard(p);
+                let existingCard = grid.querySelector(`.pcard[data-id="${p.id}"]`);
+
+                if (existingCard) {
+                    const versionStr = JSON.stringify(p);
+                    if (existingCard.dataset.version !== versionStr) {
+                        // Skip UI update if user is interacting with this specific printer
+                        if (interactionLocks[p.id] && Date.now() < interactionLocks[p.id]) {
+                            // Only update non-control parts if needed, but for now just skip
+                            return;
+                        }
+
+                        const oldCam = existingCard.querySelector('.pcard-camera img');
+                        const temp = document.createElement('div');
+                        temp.innerHTML = cardHtml;
+                        const newCard = temp.firstElementChild;
+                        const newCam = newCard.querySelector('.pcard-camera img');
+
+                        if (!p.camera_refresh && oldCam && newCam && oldCam.getAttribute('src').split('?')[0] === newCam.getAttribute('src').split('?')[0]) {
+                            newCam.replaceWith(oldCam);
+                        }
+
+                        existingCard.innerHTML = newCard.innerHTML;
+                        existingCard.className = newCard.className;
+                        existingCard.dataset.version = versionStr;
+                        existingCard.dataset.lastUpdate = p.last_update;
+                    }
+
+                    // Always ensure order is correct by moving existing card
+                    if (grid.children[idx] !== existingCard) {
+                        grid.insertBefore(existingCard, grid.children[idx]);
+                    }
+                } else {
+                    const div = document.createElement('div');
+                    div.innerHTML = cardHtml;
+                    const newCard = div.firstElementChild;
+                    newCard.dataset.id = p.id;
+                    newCard.dataset.version = JSON.stringify(p);
+                    grid.insertBefore(newCard, grid.children[idx] || null);
+                }
+            });
+        }
+
+        catch (e) {
+            console.error('Fetch error:', e);
+        }
+    }
+
+    /* ══════════════════════════════════════
+CONTROLS
+══════════════════════════════════════ */
+    async function reorder(id, direction) {
+        await fetch('/api/reorder_printers', {
+            method: 'POST', headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ id, direction })
+        });
+        fetchPrinters();
+    }
+
+    async function ctrl(id, cmd) {
+        await fetch('/api/control', {
+            method: 'POST', headers: {
+                'Content-Type': 'application/json'
+            }
+
+            ,
+            body: JSON.stringify({
+                id, command: cmd
+            })
+        });
+        fetchPrinters();
+    }
+
+    async function ctrlV(id, cmd, val) {
+        // Set local lock to prevent UI jumping back while backend polls
+        interactionLocks[id] = Date.now() + 2000;
+
+        // Optimistic update
+        const p = lastPrinters.find(x => x.id === id);
+        if (p) {
+            if (cmd === 'led') p.led_val = parseInt(val);
+            if (cmd === 'fan') p.fan_val = parseInt(val);
+            if (cmd === 'fan_aux') p.fan_aux_val = parseInt(val);
+            if (cmd === 'fan_chamber') p.fan_chamber_val = parseInt(val);
+        }
+
+        await fetch('/api/control', {
+            method: 'POST', headers: {
+                'Content-Type': 'application/json'
+            },
+            body: JSON.stringify({
+                id, command: cmd, val
+            })
+        });
+        // We don't fetchPrinters immediately to let the optimistic update stay
+    }
+
+    async function togglePrinter(id) {
+        await fetch('/api/toggle_printer', {
+            method: 'POST', headers: {
+                'Content-Type': 'application/json'
+            }
+
+            ,
+            body: JSON.stringify({
+                id
+            })
+        });
+        setTimeout(fetchPrinters, 300);
+    }
+
+    function confirmMotors(id) {
+        if (confirm('Disable motors? The print head can be moved manually after this.')) ctrl(id, 'motors_off');
+    }
+
+    function confirmReboot(id) {
+        if (confirm('Reboot printer host? This will disconnect the gateway temporarily.')) ctrl(id, 'reboot');
+    }
+
+    /* ══════════════════════════════════════
+       G-CODE MODAL
+    ══════════════════════════════════════ */
+    function openGcodeModal(id) {
+        document.getElementById('gcodeTargetId').value = id;
+        document.getElementById('gcodeInput').value = '';
+        document.getElementById('gcodeModal').style.display = 'flex';
+        setTimeout(() => document.getElementById('gcodeInput').focus(), 80);
+    }
+
+    function closeGcodeModal() {
+        document.getElementById('gcodeModal').style.display = 'none';
+    }
+
+    async function sendGcode() {
+        const id = document.getElementById('gcodeTargetId').value;
+        const gcode = document.getElementById('gcodeInput').value.trim();
+        if (!gcode) return;
+
+        await fetch('/api/gcode', {
+            method: 'POST', headers: {
+                'Content-Type': 'application/json'
+            }
+
+            ,
+            body: JSON.stringify({
+                id, gcode
+            })
+        });
+        closeGcodeModal();
+    }
+
+    document.getElementById('gcodeInput').addEventListener('keydown', e => {
+        if (e.key === 'Enter') sendGcode();
+    });
+
+    /* ══════════════════════════════════════
+       ADD MODAL
+    ══════════════════════════════════════ */
+    const addModal = document.getElementById('addModal');
+    const editModal = document.getElementById('editModal');
+
+    function openAddModal() {
+        addModal.style.display = 'flex';
+    }
+
+    function closeAddModal() {
+        addModal.style.display = 'none';
+    }
+
+    function toggleAddFields() {
+        const isBambu = document.getElementById('pType').value === 'bambu';
+        document.getElementById('addBambuFields').style.display = isBambu ? 'block' : 'none';
+    }
+
+    document.getElementById('addForm').addEventListener('submit', async (e) => {
+        e.preventDefault();
+
+        const data = {
+            name: document.getElementById('pName').value,
+            type: document.getElementById('pType').value,
+            ip: document.getElementById('pIp').value,
+            serial: document.getElementById('pSerial').value,
+            access_code: document.getElementById('pAccess').value,
+            custom_camera: document.getElementById('pCustomCamera').checked,
+            camera_url: document.getElementById('pCamera').value,
+            refresh_interval: parseInt(document.getElementById('pRefresh').value),
+            platform_token: document.getElementById('pPlatformToken').value,
+            total_usage: parseFloat(document.getElementById('pUsage').value || 0)
+        };
+
+        const res = await fetch('/api/add_printer', {
+            method: 'POST', headers: {
+                'Content-Type': 'application/json'
+            }
+
+            ,
+            body: JSON.stringify(data)
+        });
+
+        if (res.ok) {
+            closeAddModal(); document.getElementById('addForm').reset(); fetchPrinters();
+        }
+    });
+
+    /* ══════════════════════════════════════
+       EDIT MODAL
+    ══════════════════════════════════════ */
+    function openEditModal(printer, goRaw = false) {
+        document.getElementById('ePrinterId').value = printer.id;
+        document.getElementById('eName').value = printer.name || '';
+        document.getElementById('eIp').value = printer.ip || '';
+        document.getElementById('eSerial').value = printer.serial || '';
+        document.getElementById('eAccess').value = printer.access_code || '';
+        const hasCustomCam = !!printer.custom_camera;
+        document.getElementById('eCustomCamera').checked = hasCustomCam;
+        document.getElementById('editCameraWrapper').style.display = hasCustomCam ? 'block' : 'none';
+        document.getElementById('eCameraUrl').value = printer.camera_url || '';
+        document.getElementById('eRefresh').value = printer.refresh_interval || 5000;
+        document.getElementById('ePlatformToken').value = printer.platform_token || '';
+        document.getElementById('eUsage').value = parseFloat(printer.total_usage || 0).toFixed(4);
+        document.getElementById('eType').value = printer.type || 'moonraker';
+        toggleEditFields();
+        switchTab(goRaw ? 'tabRaw' : 'tabEdit', goRaw ? 'tabRawBtn' : 'tabEditBtn');
+        if (goRaw) loadRaw();
+        editModal.style.display = 'flex';
+    }
+
+    function closeEditModal() {
+        editModal.style.display = 'none';
+    }
+
+    function toggleEditFields() {
+        const isBambu = document.getElementById('eType').value === 'bambu';
+        document.getElementById('editBambuFields').style.display = isBambu ? 'block' : 'none';
+    }
+
+    function switchTab(tabId, btnId) {
+        document.querySelectorAll('.tab-pane').forEach(p => p.classList.remove('active'));
+        document.querySelectorAll('.mtab').forEach(b => b.classList.remove('active'));
+        document.getElementById(tabId).classList.add('active');
+        document.getElementById(btnId).classList.add('active');
+    }
+
+    async function loadRaw() {
+        const id = document.getElementById('ePrinterId').value;
+        if (!id) return;
+        const viewer = document.getElementById('rawViewer');
+        viewer.textContent = 'Loading...';
+
+        try {
+            const res = await fetch(`/api/raw_status/${id}`);
+            const data = await res.json();
+            viewer.textContent = JSON.stringify(data, null, 2);
+        }
+
+        catch (e) {
+            viewer.textContent = 'Error: ' + e.message;
+        }
+    }
+
+    function openRaw(id) {
+        const p = lastPrinters.find(x => x.id === id);
+        if (p) openEditModal(p, true);
+    }
+
+    document.getElementById('editForm').addEventListener('submit', async (e) => {
+        e.preventDefault();
+
+        const data = {
+            id: document.getElementById('ePrinterId').value,
+            name: document.getElementById('eName').value,
+            type: document.getElementById('eType').value,
+            ip: document.getElementById('eIp').value,
+            serial: document.getElementById('eSerial').value,
+            access_code: document.getElementById('eAccess').value,
+            custom_camera: document.getElementById('eCustomCamera').checked,
+            camera_url: document.getElementById('eCameraUrl').value,
+            refresh_interval: parseInt(document.getElementById('eRefresh').value),
+            platform_token: document.getElementById('ePlatformToken').value,
+            total_usage: parseFloat(document.getElementById('eUsage').value || 0)
+        };
+
+        const res = await fetch('/api/update_printer', {
+            method: 'POST', headers: {
+                'Content-Type': 'application/json'
+            }
+
+            ,
+            body: JSON.stringify(data)
+        });
+
+        if (res.ok) {
+            closeEditModal(); fetchPrinters();
+        }
+    });
+
+    async function deletePrinterFromModal() {
+        const id = document.getElementById('ePrinterId').value;
+        const name = document.getElementById('eName').value;
+        if (!confirm(`Delete "${name}" ? This cannot be undone.`)) return;
+
+        const res = await fetch('/api/delete_printer', {
+            method: 'POST', headers: {
+                'Content-Type': 'application/json'
+            }
+
+            ,
+            body: JSON.stringify({
+                id
+            })
+        });
+
+        if (res.ok) {
+            closeEditModal(); fetchPrinters();
+        }
+    }
+
+    /* ══════════════════════════════════════
+       CLOSE ON BACKDROP
+    ══════════════════════════════════════ */
+    window.addEventListener('click', (e) => {
+        if (e.target === addModal) closeAddModal();
+        if (e.target === editModal) closeEditModal();
+        if (e.target === document.getElementById('gcodeModal')) closeGcodeModal();
+    });
+
+    /* ══════════════════════════════════════
+       AUTO REFRESH
+    ══════════════════════════════════════ */
+    setInterval(fetchPrinters, 3000);
+    setInterval(updateLocalTimers, 500);
+    fetchPrinters();
@@ -0,0 +1,132 @@
+// Configuration for Charts
+const maxDataPoints = 60;
+const initialLabels = Array(maxDataPoints).fill('');
+const initialData = Array(maxDataPoints).fill(0);
+
+function createConfig(label, color) {
+    return {
+        type: 'line',
+        data: {
+            labels: initialLabels,
+            datasets: [{
+                label: label,
+                data: [...initialData], // Clone array
+                borderColor: color,
+                backgroundColor: color + '33',
+                fill: true,
+                tension: 0.3,
+                pointRadius: 0,
+                borderWidth: 2
+            }]
+        },
+        options: {
+            responsive: true,
+            maintainAspectRatio: false,
+            animation: false, // Performance optimization
+            scales: {
+                x: { display: false },
+                y: {
+                    beginAtZero: true,
+                    grid: { color: '#30363d' },
+                    ticks: { color: '#8b949e' }
+                }
+            },
+            plugins: {
+                legend: { labels: { color: '#c9d1d9' } },
+            }
+        }
+    };
+}
+
+function formatBytes(bytes, decimals = 2) {
+    if (!bytes || bytes < 1) return '0 Bytes';
+    const k = 1024;
+    const dm = decimals < 0 ? 0 : decimals;
+    const sizes = ['Bytes', 'KB', 'MB', 'GB', 'TB', 'PB', 'EB', 'ZB', 'YB'];
+    const i = Math.floor(Math.log(bytes) / Math.log(k));
+    return parseFloat((bytes / Math.pow(k, i)).toFixed(dm)) + ' ' + sizes[i];
+}
+
+function formatTime(seconds) {
+    const d = Math.floor(seconds / (3600 * 24));
+    const h = Math.floor(seconds % (3600 * 24) / 3600);
+    const m = Math.floor(seconds % 3600 / 60);
+    const s = Math.floor(seconds % 60);
+
+    const dDisplay = d > 0 ? d + (d == 1 ? "d " : "d ") : "";
+    const hDisplay = h > 0 ? h + (h == 1 ? "h " : "h ") : "";
+    const mDisplay = m > 0 ? m + (m == 1 ? "m " : "m ") : "";
+    const sDisplay = s > 0 ? s + (s == 1 ? "s" : "s") : "";
+    return dDisplay + hDisplay + mDisplay + sDisplay;
+}
+
+const ctxAppCpu = document.getElementById('appCpuChart').getContext('2d');
+const chartAppCpu = new Chart(ctxAppCpu, createConfig('App CPU Usage (%)', '#58a6ff'));
+
+const ctxAppMem = document.getElementById('appMemChart').getContext('2d');
+const chartAppMem = new Chart(ctxAppMem, createConfig('App Memory', '#2ea043'));
+
+const ctxAppIo = document.getElementById('appIoChart').getContext('2d');
+const chartAppIo = new Chart(ctxAppIo, createConfig('App I/O Activity (Bytes/s)', '#d29922'));
+
+// Amostras vêm do coletor do servidor: pedimos só as novas desde a última recebida
+let lastSampleTs = null;
+
+async function updateStats() {
+    try {
+        const query = lastSampleTs === null ? `history=${maxDataPoints}` : `since=${lastSampleTs}`;
+        const res = await fetch(`/api/system_stats?${query}`);
+        const data = await res.json();
+        if (!data.ts) return; // coletor ainda sem amostras
+
+        // Store references
+        const cpuData = data.app.cpu;
+        const memData = data.app.memory_bytes;
+        const ioRead = data.app.io_read_bytes;
+        const ioWrite = data.app.io_write_bytes;
+
+        // Update Charts
+        (data.history || []).forEach(point => {
+            updateChartData(chartAppCpu, point.app_cpu);
+            updateChartData(chartAppMem, point.app_memory_bytes);
+            updateChartData(chartAppIo, point.app_io_speed);
+            lastSampleTs = point.ts;
+        });
+        const ioSpeed = data.app.io_read_speed + data.app.io_write_speed;
+        chartAppCpu.data.datasets[0].label = `App CPU Usage (${cpuData}%)`;
+        chartAppMem.data.datasets[0].label = `App Memory (${formatBytes(memData)})`;
+        chartAppIo.data.datasets[0].label = `App I/O (${formatBytes(ioSpeed)}/s) | Rx: ${formatBytes(ioRead)} | Tx: ${formatBytes(ioWrite)}`;
+        [chartAppCpu, chartAppMem, chartAppIo].forEach(chart => chart.update('none'));
+
+        // Update Uptime
+        setText('app-uptime', formatTime(data.app.uptime_seconds));
+
+        // Update System Cards
+        setText('sys-cpu-val', data.system.cpu + '%');
+
+        setText('sys-mem-val', data.system.memory_percent + '%');
+        setText('sys-mem-detail', `${formatBytes(data.system.memory_used_bytes)} / ${formatBytes(data.system.memory_total_bytes)}`);
+
+        setText('disk-val', data.system.disk_percent + '%');
+
+        setText('net-sent', `${formatBytes(data.system.net_sent_bytes)} (${formatBytes(data.system.net_sent_speed)}/s)`);
+        setText('net-recv', `${formatBytes(data.system.net_recv_bytes)} (${formatBytes(data.system.net_recv_speed)}/s)`);
+
+    } catch (e) {
+        console.error("Fetch error:", e);
+    }
+}
+
+function setText(id, val) {
+    const el = document.getElementById(id);
+    if (el) el.innerText = val;
+}
+
+function updateChartData(chart, newValue) {
+    const d = chart.data.datasets[0].data;
+    d.shift();
+    d.push(newValue);
+}
+
+setInterval(updateStats, 1000);
+updateStats();
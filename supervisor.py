@@ -0,0 +1,221 @@
+import os
+import threading
+import time
+from logger_config import log_info, log_error, log_debug, log_warn
+
+try:
+    import psutil  # opcional: tempo de CPU por thread em /api/threads
+except ImportError:
+    psutil = None
+
+_local = threading.local()
+
+
+class Task:
+    """Uma thread supervisionada: nome único, grupo (ex.: id da impressora),
+    evento de cancelamento, heartbeat e política de reinício.
+
+    Políticas: 'never' (padrão), 'on_failure' (reinicia se o alvo levantar
+    exceção) e 'always' (reinicia também se o alvo retornar). Os reinícios
+    acontecem na mesma thread, com backoff exponencial até `max_restarts`.
+    """
+
+    def __init__(self, supervisor, name, target, args=(), kwargs=None, group=None,
+                 restart='never', max_restarts=5, backoff=5, on_cancel=None):
+        self.supervisor = supervisor
+        self.name = name
+        self.target = target
+        self.args = args
+        self.kwargs = kwargs or {}
+        self.group = group
+        self.restart = restart
+        self.max_restarts = max_restarts
+        self.backoff = backoff
+        self.on_cancel = on_cancel
+        self.cancel_event = threading.Event()
+        self.restarts = 0
+        self.started_at = 0
+        self.last_heartbeat = 0
+        self.last_error = ''
+        self.native_id = None
+        self.thread = threading.Thread(target=self._run, daemon=True, name=name)
+
+    @property
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+    def wait(self, seconds):
+        """Dorme até `seconds` ou até o cancelamento. Retorna True se cancelada."""
+        return self.cancel_event.wait(seconds)
+
+    def heartbeat(self):
+        self.last_heartbeat = time.time()
+
+    def is_alive(self):
+        return self.thread.is_alive()
+
+    def join(self, timeout=None):
+        if self.thread is not threading.current_thread():
+            self.thread.join(timeout)
+
+    def cancel(self):
+        self.cancel_event.set()
+        if self.on_cancel:
+            try:
+                self.on_cancel()
+            except Exception as e:
+                log_debug(f"[Supervisor] on_cancel de {self.name}: {e}")
+
+    def _run(self):
+        _local.task = self
+        self.native_id = threading.get_native_id()
+        try:
+            while True:
+                self.started_at = self.last_heartbeat = time.time()
+                failed = False
+                try:
+                    self.target(*self.args, **self.kwargs)
+                except Exception as e:
+                    failed = True
+                    self.last_error = str(e)
+                    log_error(f"[Supervisor] Tarefa {self.name} falhou: {e}")
+                if self.cancelled:
+                    break
+                if self.restart == 'always' or (self.restart == 'on_failure' and failed):
+                    if self.restarts >= self.max_restarts:
+                        log_warn(f"[Supervisor] {self.name}: limite de {self.max_restarts} reinícios atingido")
+                        break
+                    delay = min(300, self.backoff * (2 ** self.restarts))
+                    self.restarts += 1
+                    log_debug(f"[Supervisor] Reiniciando {self.name} em {delay}s (#{self.restarts})")
+                    if self.wait(delay):
+                        break
+                    continue
+                break
+        finally:
+            self.supervisor._forget(self)
+
+    def snapshot(self, cpu_times=None):
+        return {
+            'name': self.name,
+            'group': self.group,
+            'alive': self.is_alive(),
+            'cancelled': self.cancelled,
+            'restart': self.restart,
+            'restarts': self.restarts,
+            'started_at': self.started_at,
+            'last_heartbeat': self.last_heartbeat,
+            'cpu_time': round((cpu_times or {}).get(self.native_id, 0.0), 3),
+            'last_error': self.last_error,
+        }
+
+
+class Supervisor:
+    """Dono de todas as threads de background do Hub.
+
+    `spawn` com um nome já em execução devolve a tarefa existente, o que
+    mantém uma thread por função por impressora mesmo com reconexões
+    repetidas. `cancel_group` cancela e aguarda (com prazo) todas as
+    tarefas de uma impressora.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.tasks = {}
+
+    def spawn(self, name, target, *args, group=None, restart='never', max_restarts=5,
+              backoff=5, on_cancel=None, **kwargs):
+        with self.lock:
+            task = self.tasks.get(name)
+            if task and task.is_alive() and not task.cancelled:
+                return task
+            task = Task(self, name, target, args, kwargs, group=group, restart=restart,
+                        max_restarts=max_restarts, backoff=backoff, on_cancel=on_cancel)
+            self.tasks[name] = task
+        task.thread.start()
+        return task
+
+    def _forget(self, task):
+        with self.lock:
+            if self.tasks.get(task.name) is task:
+                del self.tasks[task.name]
+
+    def get(self, name):
+        with self.lock:
+            return self.tasks.get(name)
+
+    def _join_all(self, tasks, timeout):
+        for task in tasks:
+            task.cancel()
+        deadline = time.monotonic() + timeout
+        for task in tasks:
+            task.join(max(0, deadline - time.monotonic()))
+        stuck = [t.name for t in tasks if t.is_alive()]
+        if stuck:
+            log_warn(f"[Supervisor] Tarefas não encerraram em {timeout}s: {', '.join(stuck)}")
+        return not stuck
+
+    def cancel(self, name, timeout=2.0):
+        task = self.get(name)
+        if task is None:
+            return True
+        return self._join_all([task], timeout)
+
+    def cancel_group(self, group, timeout=2.0):
+        with self.lock:
+            tasks = [t for t in self.tasks.values() if t.group == group]
+        return self._join_all(tasks, timeout)
+
+    def shutdown(self, timeout=5.0):
+        with self.lock:
+            tasks = list(self.tasks.values())
+        log_info(f"[Supervisor] Encerrando {len(tasks)} tarefas...")
+        return self._join_all(tasks, timeout)
+
+    def snapshot(self):
+        cpu_times = {}
+        if psutil:
+            try:
+                cpu_times = {t.id: t.user_time + t.system_time for t in psutil.Process(os.getpid()).threads()}
+            except Exception:
+                pass
+        with self.lock:
+            tasks = list(self.tasks.values())
+        supervised = {t.native_id for t in tasks}
+        return {
+            'process_threads': threading.active_count(),
+            'supervised': len(tasks),
+            'tasks': sorted((t.snapshot(cpu_times) for t in tasks), key=lambda s: s['name']),
+            # Threads fora do supervisor (Flask, executor, bibliotecas)
+            'unmanaged': sorted(t.name for t in threading.enumerate() if t.native_id not in supervised),
+        }
+
+
+def current_task():
+    return getattr(_local, 'task', None)
+
+
+def heartbeat():
+    """Marca atividade da tarefa supervisionada que está rodando nesta thread."""
+    task = current_task()
+    if task:
+        task.heartbeat()
+
+
+def cancelled():
+    task = current_task()
+    return bool(task and task.cancelled)
+
+
+def sleep(seconds):
+    """`time.sleep` que acorda no cancelamento da tarefa. Retorna True se cancelada."""
+    task = current_task()
+    if task is None:
+        time.sleep(seconds)
+        return False
+    task.heartbeat()
+    return task.wait(seconds)
+
+
+# Instância global usada pelo app e pelos drivers
+SUPERVISOR = Supervisor()
@@ -0,0 +1,161 @@
+import os
+import threading
+import time
+from collections import deque
+from logger_config import log_debug
+from supervisor import SUPERVISOR, cancelled, heartbeat
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+
+class SystemStatsCollector:
+    """Amostra CPU/memória/I-O do processo e do sistema numa tarefa de fundo.
+
+    Uma amostra por `interval` segundos enquanto alguém consulta (monitor
+    aberto) e uma a cada `idle_interval` sem consultas. `/api/system_stats` só
+    lê o último resultado e o histórico: várias abas abertas não multiplicam
+    as chamadas ao psutil e as taxas (bytes/s) são calculadas num lugar só.
+    """
+
+    DISK_EVERY = 10  # disk_usage muda devagar: uma leitura a cada N amostras
+
+    def __init__(self, interval=1.0, idle_interval=5.0, history=300, watch_timeout=30):
+        self.interval = interval
+        self.idle_interval = idle_interval
+        self.watch_timeout = watch_timeout
+        self.lock = threading.Lock()
+        self.history = deque(maxlen=history)
+        self.latest = None
+        self.started_at = time.time()
+        self._last_request = 0
+        self._wake = threading.Event()
+        self._task = None
+        self._process = None
+        self._prev = None
+        self._disk = None
+        self._samples = 0
+
+    def start(self):
+        if psutil is None:
+            return
+        if self._task and self._task.is_alive():
+            return
+        self._process = psutil.Process(os.getpid())
+        self._process.cpu_percent(interval=None)  # primeira chamada só inicia a medição
+        psutil.cpu_percent(interval=None)
+        self._task = SUPERVISOR.spawn("SystemStats", self._run, restart='on_failure',
+                                      on_cancel=self._wake.set)
+
+    def touch(self):
+        now = time.monotonic()
+        if now - self._last_request >= self.watch_timeout:
+            self._wake.set()  # primeira consulta depois de ocioso: volta ao ritmo normal já
+        self._last_request = now
+
+    def snapshot(self, since=None, history=None):
+        """Última amostra e, opcionalmente, o histórico (`since`: timestamp; `history`: N últimas)."""
+        self.touch()
+        with self.lock:
+            latest = self.latest
+            if since is not None:
+                points = [h for h in self.history if h['ts'] > since]
+            elif history:
+                points = list(self.history)[-history:]
+            else:
+                points = None
+        if latest is None:
+            # Antes da primeira amostra (ou sem psutil)
+            latest = {'app': {'uptime_seconds': int(time.time() - self.started_at)}, 'system': {}}
+        result = dict(latest)
+        if points is not None:
+            result['history'] = points
+        return result
+
+    def _run(self):
+        while not cancelled():
+            heartbeat()
+            try:
+                self._sample()
+            except Exception as e:
+                log_debug(f"[Stats] Erro ao amostrar: {e}")
+            watched = time.monotonic() - self._last_request < self.watch_timeout
+            self._wake.wait(self.interval if watched else self.idle_interval)
+            self._wake.clear()
+
+    def _sample(self):
+        process = self._process
+        now = time.time()
+        with process.oneshot():
+            app_cpu = process.cpu_percent(interval=None) / (psutil.cpu_count() or 1)
+            mem_info = process.memory_info()
+            mem_percent = process.memory_percent()
+            try:
+                io = process.io_counters()
+            except (AttributeError, psutil.Error):
+                io = None  # io_counters não existe em todas as plataformas
+        sys_cpu = psutil.cpu_percent(interval=None)
+        sys_mem = psutil.virtual_memory()
+        net = psutil.net_io_counters()
+        if self._disk is None or self._samples % self.DISK_EVERY == 0:
+            self._disk = psutil.disk_usage('/')
+        self._samples += 1
+
+        rates = {'io_read_speed': 0, 'io_write_speed': 0, 'net_sent_speed': 0, 'net_recv_speed': 0}
+        prev = self._prev
+        if prev and now > prev[0]:
+            elapsed = now - prev[0]
+            if io and prev[1]:
+                rates['io_read_speed'] = (io.read_bytes - prev[1].read_bytes) / elapsed
+                rates['io_write_speed'] = (io.write_bytes - prev[1].write_bytes) / elapsed
+            if net and prev[2]:
+                rates['net_sent_speed'] = (net.bytes_sent - prev[2].bytes_sent) / elapsed
+                rates['net_recv_speed'] = (net.bytes_recv - prev[2].bytes_recv) / elapsed
+        self._prev = (now, io, net)
+        rates = {k: round(max(0, v), 2) for k, v in rates.items()}
+
+        latest = {
+            'ts': now,
+            'app': {
+                'cpu': round(app_cpu, 2),
+                'memory_bytes': mem_info.rss,
+                'memory_percent': round(mem_percent, 2),
+                'io_read_speed': rates['io_read_speed'],
+                'io_write_speed': rates['io_write_speed'],
+                'io_read_bytes': io.read_bytes if io else 0,
+                'io_write_bytes': io.write_bytes if io else 0,
+                'uptime_seconds': int(now - self.started_at),
+            },
+            'system': {
+                'cpu': sys_cpu,
+                'memory_percent': sys_mem.percent,
+                'memory_used_bytes': sys_mem.used,
+                'memory_total_bytes': sys_mem.total,
+                'disk_percent': self._disk.percent,
+                'disk_used_bytes': self._disk.used,
+                'disk_total_bytes': self._disk.total,
+                'net_sent_bytes': net.bytes_sent if net else 0,
+                'net_recv_bytes': net.bytes_recv if net else 0,
+                'net_sent_speed': rates['net_sent_speed'],
+                'net_recv_speed': rates['net_recv_speed'],
+            },
+        }
+        point = {
+            'ts': now,
+            'app_cpu': latest['app']['cpu'],
+            'app_memory_bytes': mem_info.rss,
+            'app_io_speed': round(rates['io_read_speed'] + rates['io_write_speed'], 2),
+            'sys_cpu': sys_cpu,
+            'sys_memory_percent': sys_mem.percent,
+            'net_sent_speed': rates['net_sent_speed'],
+            'net_recv_speed': rates['net_recv_speed'],
+        }
+        with self.lock:
+            self.latest = latest
+            self.history.append(point)
+
+
+# Instância global usada pelo app
+SYSTEM_STATS = SystemStatsCollector()
@@ -0,0 +1,421 @@
+import mmap
+import os
+import queue
+import re
+import struct
+import threading
+import time
+from logger_config import log_info, log_error, log_debug, log_warn
+from supervisor import SUPERVISOR, heartbeat
+
+TIMELAPSE_DIR = 'timelapses'
+TIMELAPSE_INTERVAL = 30        # sem informação de camada: um frame a cada N segundos
+TIMELAPSE_MIN_GAP = 2          # nunca mais de um frame a cada N segundos (camadas rápidas)
+TIMELAPSE_FPS = 25
+TIMELAPSE_MAX_BYTES = 1024 * 1024 * 1024   # limite do AVI 1.0 (sem OpenDML)
+
+PRINTING_STATES = ('printing', 'running')
+# Estados que não encerram a gravação: pausa e quedas de conexão no meio da impressão
+HOLD_STATES = ('paused', 'pause', 'offline', 'unknown', '')
+
+# Registro do índice: offset, tamanho, camada, timestamp
+_INDEX_RECORD = struct.Struct('<QIId')
+
+
+class FrameContainer:
+    """Frames JPEG de uma impressão: `frames.bin` (append via mmap) + `index.bin`.
+
+    O arquivo de dados cresce em blocos de `grow` bytes e é mapeado em memória;
+    cada append é uma cópia para o mapa, sem syscall por frame. O índice tem
+    registros de tamanho fixo e é a fonte da verdade: depois de uma queda, os
+    bytes além do último registro são simplesmente ignorados.
+    """
+
+    def __init__(self, path, grow=4 * 1024 * 1024):
+        self.path = path
+        self.grow = grow
+        os.makedirs(path, exist_ok=True)
+        self.index = self._read_index()
+        self.used = self.index[-1][0] + self.index[-1][1] if self.index else 0
+        self._data = open(os.path.join(path, 'frames.bin'), 'a+b')
+        self._index_file = open(os.path.join(path, 'index.bin'), 'ab')
+        self._map = None
+        self._map_size = 0
+
+    def _read_index(self):
+        try:
+            with open(os.path.join(self.path, 'index.bin'), 'rb') as f:
+                raw = f.read()
+        except IOError:
+            return []
+        usable = len(raw) - len(raw) % _INDEX_RECORD.size
+        return [rec for rec in _INDEX_RECORD.iter_unpack(raw[:usable])]
+
+    def _ensure_capacity(self, needed):
+        if self._map is not None and self.used + needed <= self._map_size:
+            return
+        size = max(self._map_size, self.used) + max(self.grow, needed)
+        if self._map is not None:
+            self._map.close()
+        os.ftruncate(self._data.fileno(), size)
+        self._map = mmap.mmap(self._data.fileno(), size)
+        self._map_size = size
+
+    def append(self, frame, layer=0, timestamp=None):
+        self._ensure_capacity(len(frame))
+        offset = self.used
+        self._map[offset:offset + len(frame)] = frame
+        self.used += len(frame)
+        record = (offset, len(frame), layer, timestamp or time.time())
+        self.index.append(record)
+        self._index_file.write(_INDEX_RECORD.pack(*record))
+        self._index_file.flush()
+
+    def _mapped(self):
+        if self._map is None and self.used:
+            self._map = mmap.mmap(self._data.fileno(), 0)
+            self._map_size = len(self._map)
+        return self._map
+
+    def read(self, i):
+        offset, length, _layer, _ts = self.index[i]
+        return self._mapped()[offset:offset + length]
+
+    def frames(self):
+        """Itera os frames gravados (views do mapa, sem cópia)."""
+        self._mapped()
+        view = memoryview(self._map) if self._map is not None else None
+        try:
+            for offset, length, _layer, _ts in self.index:
+                yield view[offset:offset + length]
+        finally:
+            if view is not None:
+                view.release()
+
+    def close(self):
+        if self._map is not None:
+            self._map.flush()
+            self._map.close()
+            self._map = None
+        # Devolve ao disco o espaço pré-alocado e não usado
+        try:
+            os.ftruncate(self._data.fileno(), self.used)
+        except OSError:
+            pass
+        self._data.close()
+        self._index_file.close()
+
+    def remove(self):
+        for name in ('frames.bin', 'index.bin'):
+            try:
+                os.remove(os.path.join(self.path, name))
+            except OSError:
+                pass
+        try:
+            os.rmdir(self.path)
+        except OSError:
+            pass
+
+
+def jpeg_size(data):
+    """(largura, altura) lidas do marcador SOF de um JPEG, ou None."""
+    i = 2
+    n = len(data)
+    while i + 9 < n:
+        if data[i] != 0xFF:
+            i += 1
+            continue
+        marker = data[i + 1]
+        if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7 or marker == 0xFF:
+            i += 1 if marker == 0xFF else 2
+            continue
+        length = int.from_bytes(data[i + 2:i + 4], 'big')
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            height = int.from_bytes(data[i + 5:i + 7], 'big')
+            width = int.from_bytes(data[i + 7:i + 9], 'big')
+            return width, height
+        i += 2 + length
+    return None
+
+
+def write_mjpeg_avi(path, frames, count, fps=TIMELAPSE_FPS, size=None):
+    """Grava `frames` (iterável de JPEGs) como AVI Motion-JPEG em `path`.
+
+    Escreve em streaming: cabeçalhos com o total já conhecido (`count`), lista
+    `movi` frame a frame e o índice `idx1` no fim.
+    """
+    width, height = size or (0, 0)
+    usec = int(1000000 / fps)
+
+    def chunk(fourcc, payload):
+        return fourcc + struct.pack('<I', len(payload)) + payload
+
+    strh = struct.pack('<4s4sIHHIIIIIIIIhhhh', b'vids', b'MJPG', 0, 0, 0, 0,
+                       1, fps, 0, count, 0, 0xFFFFFFFF, 0, 0, 0, width, height)
+    strf = struct.pack('<IiiHH4sIiiII', 40, width, height, 1, 24, b'MJPG',
+                       width * height * 3, 0, 0, 0, 0)
+    strl = b'LIST' + struct.pack('<I', 4 + 8 + len(strh) + 8 + len(strf)) + b'strl' + \
+        chunk(b'strh', strh) + chunk(b'strf', strf)
+    avih = struct.pack('<IIIIIIIIII4I', usec, 0, 0, 0x10, count, 0, 1, 0, width, height, 0, 0, 0, 0)
+    hdrl_body = b'hdrl' + chunk(b'avih', avih) + strl
+    hdrl = b'LIST' + struct.pack('<I', len(hdrl_body)) + hdrl_body
+
+    index = []
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(b'RIFF\0\0\0\0AVI ')
+        f.write(hdrl)
+        movi_start = f.tell()
+        f.write(b'LIST\0\0\0\0movi')
+        pos = 4  # offsets do idx1 são relativos ao 'movi'
+        for frame in frames:
+            length = len(frame)
+            f.write(b'00dc' + struct.pack('<I', length))
+            f.write(frame)
+            if length % 2:
+                f.write(b'\0')
+            index.append(struct.pack('<4sIII', b'00dc', 0x10, pos, length))
+            pos += 8 + length + (length % 2)
+        movi_end = f.tell()
+        f.write(chunk(b'idx1', b''.join(index)))
+        end = f.tell()
+        f.seek(4)
+        f.write(struct.pack('<I', end - 8))
+        f.seek(movi_start + 4)
+        f.write(struct.pack('<I', movi_end - movi_start - 8))
+    os.replace(tmp_path, path)
+
+
+def _safe_name(text):
+    text = os.path.splitext(os.path.basename(text or 'print'))[0]
+    return re.sub(r'[^A-Za-z0-9._-]+', '_', text)[:60] or 'print'
+
+
+class _Recording:
+    def __init__(self, printer_id, filename, container, name):
+        self.printer_id = printer_id
+        self.filename = filename
+        self.container = container
+        self.name = name
+        self.last_seq = None
+        self.frame_size = None
+        self.full = False
+
+
+class TimelapseRecorder:
+    """Timelapse das impressões, alimentado pelo loop de status.
+
+    `observe(printer, status)` roda a cada ciclo de polling e só compara
+    números: decide se há frame a capturar (mudança de camada ou intervalo) ou
+    impressão encerrada, e enfileira o trabalho. Captura, escrita em disco e
+    montagem do AVI acontecem numa única tarefa do supervisor.
+
+    Opt-in por impressora (`"timelapse": true` na configuração).
+    """
+
+    def __init__(self, base_dir=TIMELAPSE_DIR):
+        self.base_dir = base_dir
+        self.lock = threading.Lock()
+        self._active = {}       # printer_id -> {'filename', 'last_layer', 'last_capture'}
+        self._recordings = {}   # printer_id -> _Recording (só usado na tarefa)
+        self._jobs = queue.Queue(maxsize=200)
+        self._task = None
+
+    # --- Caminho quente (thread de polling) ----------------------------------
+    def observe(self, printer, status):
+        pid = printer.config.get('id')
+        state = str(status.get('state', '')).lower()
+        enabled = printer.config.get('timelapse', False) and printer.config.get('enabled', True)
+        with self.lock:
+            active = self._active.get(pid)
+            if active and (not enabled or (state not in PRINTING_STATES and state not in HOLD_STATES)
+                           or (state in PRINTING_STATES and status.get('filename') != active['filename'])):
+                del self._active[pid]
+                self._submit(('finish', pid, None, 0))
+                active = None
+            if not enabled or state not in PRINTING_STATES:
+                return
+            if active is None:
+                active = self._active[pid] = {'filename': status.get('filename'), 'last_layer': None,
+                                              'last_capture': 0}
+                self._submit(('start', pid, printer, 0))
+            now = time.monotonic()
+            layer = status.get('layer') or 0
+            if now - active['last_capture'] < TIMELAPSE_MIN_GAP:
+                due = False
+            elif layer:
+                due = layer != active['last_layer']
+            else:
+                due = now - active['last_capture'] >= TIMELAPSE_INTERVAL
+            if due:
+                active['last_layer'] = layer
+                active['last_capture'] = now
+        # A câmera fica ligada durante a gravação
+        printer.acquire_camera('timelapse', ttl=60)
+        if due:
+            self._submit(('frame', pid, printer, layer))
+
+    def finish(self, printer_id):
+        """Encerra a gravação da impressora (removida/desligada) e monta o AVI."""
+        with self.lock:
+            if self._active.pop(printer_id, None) is None:
+                return
+        self._submit(('finish', printer_id, None, 0))
+
+    def _submit(self, job):
+        self._ensure_started()
+        try:
+            self._jobs.put_nowait(job)
+        except queue.Full:
+            log_debug(f"[Timelapse] Fila cheia, descartando {job[0]} de {job[1]}")
+
+    def _ensure_started(self):
+        if self._task and self._task.is_alive():
+            return
+        self._task = SUPERVISOR.spawn("Timelapse", self._run, restart='on_failure')
+
+    # --- Tarefa de gravação --------------------------------------------------
+    def _run(self):
+        self._recover()
+        while True:
+            try:
+                job = self._jobs.get(timeout=5)
+            except queue.Empty:
+                heartbeat()
+                continue
+            heartbeat()
+            kind, pid, printer, layer = job
+            try:
+                if kind == 'start':
+                    self._start(pid, printer)
+                elif kind == 'frame':
+                    self._capture(pid, printer, layer)
+                elif kind == 'finish':
+                    self._finish(pid)
+            except Exception as e:
+                log_error(f"[Timelapse] Erro ({kind}) na impressora {pid}: {e}")
+
+    def _recover(self):
+        # Gravações interrompidas (processo encerrado no meio da impressão): o
+        # índice diz o que é válido, então monta o AVI com o que foi salvo
+        try:
+            printer_dirs = os.listdir(self.base_dir)
+        except OSError:
+            return
+        for pid in printer_dirs:
+            folder = os.path.join(self.base_dir, pid)
+            try:
+                names = [n for n in os.listdir(folder) if n.endswith('.frames')]
+            except OSError:
+                continue
+            for name in names:
+                if any(r.container.path == os.path.join(folder, name) for r in self._recordings.values()):
+                    continue
+                container = FrameContainer(os.path.join(folder, name))
+                rec = _Recording(pid, '', container, name[:-len('.frames')])
+                if container.index:
+                    rec.frame_size = jpeg_size(container.read(0))
+                self._recordings[('recover', pid, name)] = rec
+                log_info(f"[Timelapse] Recuperando gravação interrompida {rec.name}")
+                self._finish(('recover', pid, name))
+
+    def _start(self, pid, printer):
+        if pid in self._recordings:
+            self._finish(pid)
+        filename = printer.status.get('filename', '')
+        name = f"{time.strftime('%Y%m%d-%H%M%S')}_{_safe_name(filename)}"
+        container = FrameContainer(os.path.join(self.base_dir, str(pid), name + '.frames'))
+        self._recordings[pid] = _Recording(pid, filename, container, name)
+        log_info(f"[Timelapse] {printer.name}: gravando {name}")
+
+    def _capture(self, pid, printer, layer):
+        rec = self._recordings.get(pid)
+        if rec is None or rec.full:
+            return
+        frame = None
+        if hasattr(printer, 'frame_seq'):
+            # Stream: só grava se chegou frame novo desde a última captura
+            if printer.last_frame and printer.frame_seq != rec.last_seq:
+                frame = printer.last_frame
+                rec.last_seq = printer.frame_seq
+        elif hasattr(printer, 'get_snapshot'):
+            frame = printer.get_snapshot()
+        if not frame:
+            return
+        if rec.container.used + len(frame) > TIMELAPSE_MAX_BYTES:
+            rec.full = True
+            log_warn(f"[Timelapse] {printer.name}: limite de tamanho atingido, parando captura")
+            return
+        if rec.frame_size is None:
+            rec.frame_size = jpeg_size(frame)
+        rec.container.append(frame, layer)
+
+    def _finish(self, pid):
+        rec = self._recordings.pop(pid, None)
+        if rec is None:
+            return
+        container = rec.container
+        count = len(container.index)
+        if count < 2:
+            container.close()
+            container.remove()
+            log_debug(f"[Timelapse] {rec.name}: poucos frames ({count}), descartado")
+            return
+        out = os.path.join(self.base_dir, str(rec.printer_id), rec.name + '.avi')
+        start = time.time()
+        frames = container.frames()
+        try:
+            write_mjpeg_avi(out, frames, count, size=rec.frame_size)
+        finally:
+            frames.close()
+            container.close()
+        container.remove()
+        log_info(f"[Timelapse] {rec.name}.avi pronto: {count} frames em {time.time() - start:.1f}s")
+
+    # --- Consulta ------------------------------------------------------------
+    def list(self, printer_id=None):
+        result = []
+        try:
+            printer_dirs = [printer_id] if printer_id else os.listdir(self.base_dir)
+        except OSError:
+            return result
+        for pid in printer_dirs:
+            folder = self._printer_dir(pid)
+            if folder is None:
+                continue
+            try:
+                names = os.listdir(folder)
+            except OSError:
+                continue
+            for name in names:
+                if name.endswith('.avi'):
+                    st = os.stat(os.path.join(folder, name))
+                    result.append({'printer_id': pid, 'name': name, 'size': st.st_size,
+                                   'created': st.st_mtime})
+        with self.lock:
+            recording = set(self._active)
+        for item in result:
+            item['recording'] = False
+        for pid in recording:
+            if printer_id in (None, pid):
+                result.append({'printer_id': pid, 'name': None, 'recording': True})
+        return sorted(result, key=lambda r: r.get('created', time.time()), reverse=True)
+
+    def path_for(self, printer_id, name):
+        folder = self._printer_dir(printer_id)
+        if folder is None or os.path.basename(name) != name or not name.endswith('.avi'):
+            return None
+        path = os.path.join(folder, name)
+        return path if os.path.isfile(path) else None
+
+    def _printer_dir(self, printer_id):
+        # Pasta da impressora, ou None se o id escapar de base_dir ('..', '.', caminhos)
+        base = os.path.realpath(self.base_dir)
+        folder = os.path.realpath(os.path.join(base, str(printer_id)))
+        if folder == base or os.path.commonpath([base, folder]) != base:
+            return None
+        return folder
+
+
+# Instância global usada pelo app
+TIMELAPSE = TimelapseRecorder()
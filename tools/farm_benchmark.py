@@ -0,0 +1,224 @@
+"""
+Benchmark de escala do Hub contra o simulador de fazenda.
+
+Sobe o simulador (tools/farm_simulator.py) com o tamanho máximo pedido, roda o
+Hub num diretório temporário e vai aumentando o config.json em degraus,
+medindo a cada degrau:
+
+    * CPU (%), memória RSS e número de threads do processo do Hub
+    * tempo de resposta de /api/printers (p50/p95)
+    * latência de polling: idade de `last_update` das impressoras online
+
+Exemplo:
+    python tools/farm_benchmark.py --steps 10,50,100 --mix moonraker=4,elegoo=2,bambu=4 \\
+        --output bench.json
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import psutil
+import requests
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+SIMULATOR = os.path.join(ROOT, 'tools', 'farm_simulator.py')
+
+HUB_BOOTSTRAP = """
+import sys
+sys.path.insert(0, {root!r})
+import app
+app.start_background_tasks()
+app.app.run(host='127.0.0.1', port={port}, threaded=True, use_reloader=False)
+"""
+
+
+def log(msg):
+    print(f"{time.strftime('%H:%M:%S')} [Bench] {msg}", flush=True)
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    k = max(0, min(len(values) - 1, int(round(pct / 100.0 * (len(values) - 1)))))
+    return values[k]
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(','):
+        kind, _, weight = part.partition('=')
+        mix[kind.strip()] = float(weight or 1)
+    total = sum(mix.values()) or 1
+    return {k: v / total for k, v in mix.items()}
+
+
+def split_counts(total, mix):
+    counts = {k: int(total * w) for k, w in mix.items()}
+    # Distribui o resto para os tipos com maior peso
+    for kind in sorted(mix, key=mix.get, reverse=True):
+        if sum(counts.values()) >= total:
+            break
+        counts[kind] += 1
+    return counts
+
+
+def pick_printers(manifest, counts):
+    by_type = {}
+    for entry in manifest:
+        by_type.setdefault(entry['type'], []).append(entry)
+    chosen = []
+    for kind, n in counts.items():
+        chosen.extend(by_type.get(kind, [])[:n])
+    return chosen
+
+
+def write_config(workdir, printers):
+    path = os.path.join(workdir, 'config.json')
+    with open(path + '.tmp', 'w') as f:
+        json.dump(printers, f, indent=4)
+    os.replace(path + '.tmp', path)
+
+
+def sample(hub_proc, base_url, expected_ids):
+    t0 = time.perf_counter()
+    resp = requests.get(f"{base_url}/api/printers", timeout=30)
+    api_ms = (time.perf_counter() - t0) * 1000
+    printers = resp.json()
+    now = time.time()
+    online = [p for p in printers if p.get('id') in expected_ids and p.get('state') not in ('offline', 'off')]
+    ages = [now - p['last_update'] for p in online if p.get('last_update')]
+    return {
+        'api_ms': api_ms,
+        'api_bytes': len(resp.content),
+        'online': len(online),
+        'poll_age_p50': percentile(ages, 50),
+        'poll_age_max': max(ages) if ages else 0.0,
+        'cpu': hub_proc.cpu_percent(interval=None),
+        'rss': hub_proc.memory_info().rss,
+        'threads': hub_proc.num_threads(),
+    }
+
+
+def run_step(hub_proc, base_url, printers, args):
+    expected = {p['id'] for p in printers}
+    log(f"Degrau: {len(printers)} impressoras, aguardando {args.settle}s para estabilizar...")
+    time.sleep(args.settle)
+    hub_proc.cpu_percent(interval=None)
+    samples = []
+    for _ in range(args.samples):
+        time.sleep(args.interval)
+        try:
+            samples.append(sample(hub_proc, base_url, expected))
+        except requests.RequestException as e:
+            log(f"Falha ao consultar o Hub: {e}")
+    if not samples:
+        return None
+    api = [s['api_ms'] for s in samples]
+    return {
+        'printers': len(printers),
+        'online': statistics.median(s['online'] for s in samples),
+        'cpu_percent': round(statistics.mean(s['cpu'] for s in samples), 1),
+        'rss_mb': round(max(s['rss'] for s in samples) / 1048576, 1),
+        'threads': max(s['threads'] for s in samples),
+        'api_ms_p50': round(percentile(api, 50), 1),
+        'api_ms_p95': round(percentile(api, 95), 1),
+        'api_kb': round(statistics.mean(s['api_bytes'] for s in samples) / 1024, 1),
+        'poll_age_p50': round(statistics.median(s['poll_age_p50'] for s in samples), 2),
+        'poll_age_max': round(max(s['poll_age_max'] for s in samples), 2),
+    }
+
+
+def print_table(results):
+    cols = ['printers', 'online', 'cpu_percent', 'rss_mb', 'threads', 'api_ms_p50', 'api_ms_p95',
+            'api_kb', 'poll_age_p50', 'poll_age_max']
+    print(' | '.join(f"{c:>12}" for c in cols))
+    for r in results:
+        print(' | '.join(f"{r[c]:>12}" for c in cols))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark de escala do Hub com impressoras simuladas")
+    parser.add_argument('--steps', default='10,25,50,100', help="Tamanhos da fazenda, separados por vírgula")
+    parser.add_argument('--mix', default='moonraker=4,elegoo=2,bambu=4', help="Proporção entre tipos")
+    parser.add_argument('--settle', type=float, default=30.0, help="Espera (s) após cada degrau")
+    parser.add_argument('--samples', type=int, default=15)
+    parser.add_argument('--interval', type=float, default=2.0, help="Intervalo (s) entre amostras")
+    parser.add_argument('--port', type=int, default=5055, help="Porta HTTP do Hub sob teste")
+    parser.add_argument('--sim-args', default='', help="Argumentos extras para o simulador")
+    parser.add_argument('--output', default=None, help="Arquivo JSON com os resultados")
+    parser.add_argument('--keep', action='store_true', help="Não apagar o diretório de trabalho")
+    args = parser.parse_args(argv)
+
+    steps = sorted(int(s) for s in args.steps.split(',') if s.strip())
+    mix = parse_mix(args.mix)
+    max_counts = split_counts(steps[-1], mix)
+
+    workdir = tempfile.mkdtemp(prefix='hub-bench-')
+    manifest_path = os.path.join(workdir, 'farm.json')
+    sim_cmd = [sys.executable, SIMULATOR, '--manifest', manifest_path] + \
+        [f"--{k}={v}" for k, v in max_counts.items()] + args.sim_args.split()
+    log(f"Iniciando simulador: {' '.join(sim_cmd[1:])}")
+    sim = subprocess.Popen(sim_cmd)
+    hub = None
+    results = []
+    try:
+        deadline = time.time() + 60
+        while not os.path.exists(manifest_path) and time.time() < deadline:
+            if sim.poll() is not None:
+                log("Simulador terminou inesperadamente.")
+                return 1
+            time.sleep(0.5)
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+
+        write_config(workdir, [])
+        hub = subprocess.Popen([sys.executable, '-c', HUB_BOOTSTRAP.format(root=ROOT, port=args.port)],
+                               cwd=workdir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        hub_proc = psutil.Process(hub.pid)
+        base_url = f"http://127.0.0.1:{args.port}"
+        deadline = time.time() + 30
+        while time.time() < deadline:
+            try:
+                requests.get(f"{base_url}/api/printers", timeout=2)
+                break
+            except requests.RequestException:
+                time.sleep(0.5)
+        log(f"Hub em execução (pid {hub.pid}, dir {workdir})")
+
+        for n in steps:
+            printers = pick_printers(manifest, split_counts(n, mix))
+            write_config(workdir, printers)
+            result = run_step(hub_proc, base_url, printers, args)
+            if result:
+                results.append(result)
+                log(json.dumps(result))
+    except KeyboardInterrupt:
+        log("Interrompido.")
+    finally:
+        for proc in (hub, sim):
+            if proc and proc.poll() is None:
+                proc.terminate()
+                try:
+                    proc.wait(timeout=10)
+                except subprocess.TimeoutExpired:
+                    proc.kill()
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    if results:
+        print_table(results)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=4)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
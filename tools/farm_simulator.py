@@ -0,0 +1,1165 @@
+"""
+Simulador de fazenda de impressoras para testes de escala do Hub.
+
+Sobe N impressoras falsas em localhost, cada uma com seu próprio IP de
+loopback (127.0.0.0/8), expondo os mesmos protocolos que os drivers usam:
+
+    * Moonraker: HTTP + WebSocket (JSON-RPC) na porta 7125
+    * Elegoo:    UDP na porta 3000 (M99999 / M24 / M25 / M33) e, com
+                 --elegoo-sdcp, WebSocket SDCP com push de status na 3030
+    * Bambu:     MQTT/TLS 8883, FTPS implícito 990 e câmera TLS 6000
+
+Exemplo:
+    python tools/farm_simulator.py --moonraker 40 --elegoo 20 --bambu 40 \\
+        --manifest farm.json
+
+O manifesto gerado é uma lista no mesmo formato do config.json do Hub.
+
+Notas:
+    * Endereços 127.x.y.z só respondem sem configuração extra no Linux.
+    * A porta 990 (FTPS Bambu) é privilegiada: rode como root ou libere com
+      `sysctl net.ipv4.ip_unprivileged_port_start=0`.
+    * O certificado TLS autoassinado é gerado com o binário `openssl`.
+"""
+import argparse
+import base64
+import hashlib
+import io
+import json
+import os
+import random
+import selectors
+import socket
+import ssl
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import zipfile
+import zlib
+from http.server import BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+JOBS = [
+    # (nome, camadas, duração em segundos, peso em gramas)
+    ("Benchy", 240, 900, 12.4),
+    ("Bracket_v3", 180, 600, 31.0),
+    ("Gridfinity_2x3", 320, 1500, 58.7),
+]
+
+MOONRAKER_PORT = 7125
+ELEGOO_PORT = 3000
+ELEGOO_SDCP_PORT = 3030
+BAMBU_MQTT_PORT = 8883
+BAMBU_FTP_PORT = 990
+BAMBU_CAMERA_PORT = 6000
+
+
+def log(msg):
+    print(f"{time.strftime('%H:%M:%S')} [Sim] {msg}", flush=True)
+
+
+# ---------------------------------------------------------------------------
+# Geração de mídia (JPEG/PNG/3MF) sem dependências externas
+# ---------------------------------------------------------------------------
+def _huffman_codes(bits, vals):
+    codes = {}
+    code = 0
+    k = 0
+    for length in range(1, 17):
+        for _ in range(bits[length - 1]):
+            codes[vals[k]] = (code, length)
+            code += 1
+            k += 1
+        code <<= 1
+    return codes
+
+
+_DC_BITS = [0, 1, 5, 1, 1, 1, 1, 1, 1, 0, 0, 0, 0, 0, 0, 0]
+_DC_VALS = list(range(12))
+_DC_CODES = _huffman_codes(_DC_BITS, _DC_VALS)
+
+
+def make_jpeg(width, height, shade, pad_bytes=0):
+    """JPEG baseline em tons de cinza, um valor por bloco 8x8 (só coeficiente DC).
+
+    `shade(bx, by)` devolve o nível de cinza (0-255) de cada bloco. `pad_bytes`
+    infla o arquivo com segmentos COM para simular frames de tamanho real.
+    """
+    out = bytearray(b'\xff\xd8')
+    out += b'\xff\xe0' + struct.pack('>H', 16) + b'JFIF\x00\x01\x01\x00\x00\x01\x00\x01\x00\x00'
+    out += b'\xff\xdb' + struct.pack('>H', 67) + b'\x00' + b'\x01' * 64
+    out += b'\xff\xc0' + struct.pack('>HBHHB', 11, 8, height, width, 1) + b'\x01\x11\x00'
+    out += b'\xff\xc4' + struct.pack('>H', 31) + b'\x00' + bytes(_DC_BITS) + bytes(_DC_VALS)
+    # Tabela AC mínima: apenas EOB (todos os AC são zero)
+    out += b'\xff\xc4' + struct.pack('>H', 20) + b'\x10' + bytes([1] + [0] * 15) + b'\x00'
+    while pad_bytes > 0:
+        chunk = min(pad_bytes, 65000)
+        out += b'\xff\xfe' + struct.pack('>H', chunk + 2) + b'\x00' * chunk
+        pad_bytes -= chunk
+    out += b'\xff\xda' + struct.pack('>HB', 8, 1) + b'\x01\x00' + b'\x00\x3f\x00'
+
+    acc = 0
+    nbits = 0
+    data = bytearray()
+
+    def put(value, length):
+        nonlocal acc, nbits
+        acc = (acc << length) | value
+        nbits += length
+        while nbits >= 8:
+            nbits -= 8
+            byte = (acc >> nbits) & 0xFF
+            data.append(byte)
+            if byte == 0xFF:
+                data.append(0x00)
+        acc &= (1 << nbits) - 1
+
+    prev = 0
+    for by in range((height + 7) // 8):
+        for bx in range((width + 7) // 8):
+            dc = 8 * (max(0, min(255, int(shade(bx, by)))) - 128)
+            diff = dc - prev
+            prev = dc
+            cat = abs(diff).bit_length()
+            code, length = _DC_CODES[cat]
+            put(code, length)
+            if cat:
+                put(diff if diff >= 0 else diff + (1 << cat) - 1, cat)
+            put(0, 1)  # EOB
+    if nbits:
+        put((1 << (8 - nbits)) - 1, 8 - nbits)
+    out += data + b'\xff\xd9'
+    return bytes(out)
+
+
+def make_png(width, height, rgb):
+    def chunk(tag, payload):
+        return struct.pack('>I', len(payload)) + tag + payload + struct.pack('>I', zlib.crc32(tag + payload) & 0xFFFFFFFF)
+    row = b'\x00' + bytes(rgb) * width
+    raw = zlib.compress(row * height)
+    return (b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0))
+            + chunk(b'IDAT', raw) + chunk(b'IEND', b''))
+
+
+def make_3mf(job, payload):
+    """3MF mínimo com slice_info.config, thumbnail do plate e um G-code de recheio."""
+    name, layers, duration, weight = job
+    slice_info = (
+        '<?xml version="1.0" encoding="UTF-8"?>\n<config>\n  <plate>\n'
+        '    <metadata key="index" value="1"/>\n'
+        f'    <metadata key="prediction" value="{duration}"/>\n'
+        f'    <metadata key="weight" value="{weight}"/>\n'
+        '  </plate>\n</config>\n'
+    )
+    bio = io.BytesIO()
+    with zipfile.ZipFile(bio, 'w') as z:
+        z.writestr('Metadata/slice_info.config', slice_info, compress_type=zipfile.ZIP_DEFLATED)
+        z.writestr('Metadata/plate_1.png', make_png(128, 128, (40, 160, 90)))
+        z.writestr('Metadata/plate_1.gcode', payload, compress_type=zipfile.ZIP_STORED)
+    return bio.getvalue()
+
+
+# ---------------------------------------------------------------------------
+# Estado simulado
+# ---------------------------------------------------------------------------
+class SimPrinter:
+    """Máquina de estados comum: idle -> printing -> complete -> idle."""
+
+    def __init__(self, index, ip, kind):
+        self.index = index
+        self.ip = ip
+        self.kind = kind
+        self.serial = f"SIM{kind[:2].upper()}{index:05d}"
+        self.access_code = f"{index:08d}"
+        self.lock = threading.Lock()
+        self.state = 'idle'
+        self.job = None
+        self.elapsed = 0.0
+        self.idle_for = random.uniform(2, 20)
+        self.temp_nozzle = 25.0
+        self.temp_bed = 25.0
+        self.led = 1.0
+        self.fan = 0.0
+        self.listeners = []
+
+    @property
+    def progress(self):
+        if not self.job:
+            return 0.0
+        return min(1.0, self.elapsed / self.job[2])
+
+    @property
+    def layer(self):
+        return int(self.progress * self.job[1]) if self.job else 0
+
+    def start(self, job=None):
+        self.job = job or random.choice(JOBS)
+        self.elapsed = 0.0
+        self.state = 'printing'
+
+    def tick(self, dt, speedup):
+        with self.lock:
+            if self.state == 'printing':
+                self.elapsed += dt * speedup
+                self.temp_nozzle += (215 - self.temp_nozzle) * 0.2
+                self.temp_bed += (60 - self.temp_bed) * 0.2
+                self.fan = 1.0
+                if self.elapsed >= self.job[2]:
+                    self.state = 'complete'
+                    self.idle_for = random.uniform(5, 30)
+            elif self.state == 'paused':
+                pass
+            else:
+                self.temp_nozzle += (25 - self.temp_nozzle) * 0.1
+                self.temp_bed += (25 - self.temp_bed) * 0.1
+                self.fan = 0.0
+                self.idle_for -= dt
+                if self.idle_for <= 0:
+                    self.start()
+        for cb in list(self.listeners):
+            try:
+                cb(self)
+            except Exception:
+                pass
+
+    def command(self, name):
+        with self.lock:
+            if name == 'pause' and self.state == 'printing':
+                self.state = 'paused'
+            elif name == 'resume' and self.state == 'paused':
+                self.state = 'printing'
+            elif name == 'stop' and self.state in ('printing', 'paused'):
+                self.state = 'cancelled'
+                self.idle_for = random.uniform(5, 30)
+            elif name == 'start':
+                self.start()
+            else:
+                return False
+        return True
+
+    def camera_frame(self, width, height, pad_bytes):
+        # Barra de progresso horizontal + leve ruído no fundo
+        filled = int(self.progress * ((width + 7) // 8))
+        seed = int(self.elapsed) & 0x3F
+
+        def shade(bx, by):
+            if by >= ((height + 7) // 8) - 4:
+                return 220 if bx < filled else 60
+            return 90 + ((bx * 7 + by * 13 + seed) % 24)
+        return make_jpeg(width, height, shade, pad_bytes)
+
+
+# ---------------------------------------------------------------------------
+# Aceitador compartilhado: um único select() para todos os listeners TCP
+# ---------------------------------------------------------------------------
+class Acceptor(threading.Thread):
+    def __init__(self):
+        super().__init__(daemon=True, name="SimAcceptor")
+        self.sel = selectors.DefaultSelector()
+        self.lock = threading.Lock()
+
+    def listen(self, ip, port, handler):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((ip, port))
+        sock.listen(32)
+        sock.setblocking(False)
+        with self.lock:
+            self.sel.register(sock, selectors.EVENT_READ, handler)
+        return sock
+
+    def run(self):
+        while True:
+            with self.lock:
+                if not self.sel.get_map():
+                    events = []
+                else:
+                    events = self.sel.select(timeout=0.5)
+            if not events:
+                time.sleep(0.05)
+                continue
+            for key, _ in events:
+                try:
+                    conn, addr = key.fileobj.accept()
+                except (BlockingIOError, OSError):
+                    continue
+                conn.setblocking(True)
+                threading.Thread(target=self._serve, args=(key.data, conn, addr), daemon=True).start()
+
+    @staticmethod
+    def _serve(handler, conn, addr):
+        try:
+            handler(conn, addr)
+        except (OSError, ssl.SSLError, ValueError):
+            pass
+        finally:
+            try:
+                conn.close()
+            except OSError:
+                pass
+
+
+# ---------------------------------------------------------------------------
+# Moonraker (HTTP + WebSocket)
+# ---------------------------------------------------------------------------
+MOON_STATE = {'idle': 'standby', 'printing': 'printing', 'paused': 'paused',
+              'complete': 'complete', 'cancelled': 'cancelled'}
+
+
+def moonraker_status(sp):
+    with sp.lock:
+        filename = f"{sp.job[0]}.gcode" if sp.job else ''
+        prog = sp.progress
+        return {
+            'print_stats': {
+                'state': MOON_STATE.get(sp.state, 'standby'),
+                'filename': filename,
+                'print_duration': sp.elapsed,
+                'total_duration': sp.elapsed,
+                'info': {'current_layer': sp.layer, 'total_layer': sp.job[1] if sp.job else 0},
+            },
+            'extruder': {'temperature': round(sp.temp_nozzle, 2), 'target': 215 if sp.state == 'printing' else 0},
+            'heater_bed': {'temperature': round(sp.temp_bed, 2), 'target': 60 if sp.state == 'printing' else 0},
+            'display_status': {'progress': prog, 'message': None},
+            'fan': {'speed': sp.fan},
+            'toolhead': {'position': [100.0, 100.0, sp.layer * 0.2, 0.0], 'homed_axes': 'xyz'},
+            'virtual_sdcard': {'progress': prog, 'is_active': sp.state == 'printing',
+                               'file_path': f"/home/pi/printer_data/gcodes/{filename}" if filename else None,
+                               'file_size': 1048576 if filename else 0},
+            'output_pin caselight': {'value': sp.led},
+            'temperature_sensor mcu_temp': {'temperature': 41.0},
+            'temperature_sensor chamber_temp': {'temperature': 28.0},
+            'system_stats': {'sysload': 0.2, 'cputime': sp.elapsed, 'memavail': 512000},
+        }
+
+
+def _ws_accept_key(key):
+    return base64.b64encode(hashlib.sha1((key + '258EAFA5-E914-47DA-95CA-C5AB0DC85B11').encode()).digest()).decode()
+
+
+def ws_send(sock, payload, opcode=0x1):
+    data = payload.encode() if isinstance(payload, str) else payload
+    header = bytearray([0x80 | opcode])
+    if len(data) < 126:
+        header.append(len(data))
+    elif len(data) < 65536:
+        header.append(126)
+        header += struct.pack('>H', len(data))
+    else:
+        header.append(127)
+        header += struct.pack('>Q', len(data))
+    sock.sendall(bytes(header) + data)
+
+
+def ws_recv(rfile):
+    """Lê um frame WebSocket (cliente -> servidor, sempre mascarado)."""
+    head = rfile.read(2)
+    if len(head) < 2:
+        return None, None
+    opcode = head[0] & 0x0F
+    length = head[1] & 0x7F
+    if length == 126:
+        length = struct.unpack('>H', rfile.read(2))[0]
+    elif length == 127:
+        length = struct.unpack('>Q', rfile.read(8))[0]
+    mask = rfile.read(4) if head[1] & 0x80 else b'\x00\x00\x00\x00'
+    data = bytearray(rfile.read(length))
+    for i in range(len(data)):
+        data[i] ^= mask[i % 4]
+    return opcode, bytes(data)
+
+
+class MoonrakerHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    printer = None
+    sim = None
+
+    def log_message(self, fmt, *args):
+        pass
+
+    def _json(self, obj, code=200):
+        body = json.dumps(obj).encode()
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _bytes(self, body, ctype):
+        self.send_response(200)
+        self.send_header('Content-Type', ctype)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _query_objects(self, names):
+        full = moonraker_status(self.printer)
+        if not names:
+            return full
+        return {k: full[k] for k in names if k in full}
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        qs = parse_qs(url.query, keep_blank_values=True)
+        sp = self.printer
+        if url.path == '/websocket':
+            return self._websocket()
+        if url.path == '/printer/objects/list':
+            return self._json({'result': {'objects': list(moonraker_status(sp).keys())}})
+        if url.path == '/printer/objects/query':
+            return self._json({'result': {'eventtime': time.monotonic(), 'status': self._query_objects(list(qs.keys()))}})
+        if url.path == '/server/webcams/list':
+            return self._json({'result': {'webcams': [{
+                'name': 'cam', 'enabled': True, 'service': 'mjpegstreamer',
+                'stream_url': '/webcam/?action=stream', 'snapshot_url': '/webcam/?action=snapshot'}]}})
+        if url.path == '/server/files/metadata':
+            filename = qs.get('filename', [''])[0]
+            job = next((j for j in JOBS if f"{j[0]}.gcode" == filename), None)
+            if not job:
+                return self._json({'error': {'code': 404, 'message': 'Metadata not available'}}, 404)
+            return self._json({'result': {
+                'filename': filename, 'size': 1048576, 'modified': self.sim.started_at,
+                'estimated_time': job[2], 'filament_weight_total': job[3], 'layer_count': job[1],
+                'thumbnails': [{'width': 32, 'height': 32, 'relative_path': f".thumbs/{job[0]}-32x32.png"},
+                               {'width': 300, 'height': 300, 'relative_path': f".thumbs/{job[0]}-300x300.png"}]}})
+        if url.path.startswith('/server/files/gcodes/.thumbs/'):
+            return self._bytes(self.sim.thumb_png, 'image/png')
+        if url.path.startswith('/webcam'):
+            return self._bytes(self.sim.frame_for(sp), 'image/jpeg')
+        if url.path in ('/server/info', '/printer/info'):
+            return self._json({'result': {'state': 'ready', 'klippy_state': 'ready', 'hostname': sp.serial}})
+        self._json({'error': {'code': 404, 'message': 'Not Found'}}, 404)
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        qs = parse_qs(url.query, keep_blank_values=True)
+        length = int(self.headers.get('Content-Length', 0) or 0)
+        sp = self.printer
+        if url.path == '/server/files/upload':
+            remaining = length
+            while remaining > 0:
+                chunk = self.rfile.read(min(65536, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+            return self._json({'result': {'item': {'path': 'upload.gcode', 'root': 'gcodes'}, 'print_started': False}}, 201)
+        body = self.rfile.read(length) if length else b''
+        if url.path.startswith('/printer/print/'):
+            action = url.path.rsplit('/', 1)[-1]
+            sp.command({'cancel': 'stop'}.get(action, action))
+            return self._json({'result': 'ok'})
+        if url.path == '/printer/gcode/script':
+            script = ''
+            try:
+                script = json.loads(body or b'{}').get('script', '')
+            except ValueError:
+                script = qs.get('script', [''])[0]
+            self._apply_gcode(script)
+            return self._json({'result': 'ok'})
+        if url.path == '/machine/reboot':
+            return self._json({'result': 'ok'})
+        self._json({'error': {'code': 404, 'message': 'Not Found'}}, 404)
+
+    def _apply_gcode(self, script):
+        sp = self.printer
+        for line in script.splitlines():
+            parts = line.strip().split()
+            if not parts:
+                continue
+            if parts[0].upper() == 'SET_PIN':
+                for arg in parts[1:]:
+                    if arg.upper().startswith('VALUE='):
+                        sp.led = float(arg.split('=', 1)[1])
+            elif parts[0].upper() == 'M106':
+                for arg in parts[1:]:
+                    if arg.upper().startswith('S'):
+                        sp.fan = int(arg[1:]) / 255.0
+
+    def _websocket(self):
+        key = self.headers.get('Sec-WebSocket-Key')
+        if not key:
+            return self._json({'error': {'code': 400, 'message': 'Expected WebSocket'}}, 400)
+        self.send_response(101, 'Switching Protocols')
+        self.send_header('Upgrade', 'websocket')
+        self.send_header('Connection', 'Upgrade')
+        self.send_header('Sec-WebSocket-Accept', _ws_accept_key(key))
+        self.end_headers()
+        self.wfile.flush()
+        sock = self.connection
+        send_lock = threading.Lock()
+        subscribed = []
+
+        def push(sp):
+            if not subscribed:
+                return
+            msg = json.dumps({'jsonrpc': '2.0', 'method': 'notify_status_update',
+                              'params': [self._query_objects(subscribed), time.monotonic()]})
+            with send_lock:
+                ws_send(sock, msg)
+
+        self.printer.listeners.append(push)
+        try:
+            while True:
+                opcode, data = ws_recv(self.rfile)
+                if opcode is None or opcode == 0x8:
+                    break
+                if opcode == 0x9:
+                    with send_lock:
+                        ws_send(sock, data, opcode=0xA)
+                    continue
+                if opcode != 0x1:
+                    continue
+                req = json.loads(data)
+                method = req.get('method', '')
+                params = req.get('params') or {}
+                result = 'ok'
+                if method in ('printer.objects.query', 'printer.objects.subscribe'):
+                    names = list((params.get('objects') or {}).keys())
+                    if method == 'printer.objects.subscribe':
+                        subscribed[:] = names
+                    result = {'eventtime': time.monotonic(), 'status': self._query_objects(names)}
+                elif method == 'printer.objects.list':
+                    result = {'objects': list(moonraker_status(self.printer).keys())}
+                elif method.startswith('printer.print.'):
+                    action = method.rsplit('.', 1)[-1]
+                    self.printer.command({'cancel': 'stop'}.get(action, action))
+                elif method == 'printer.gcode.script':
+                    self._apply_gcode(params.get('script', ''))
+                elif method in ('server.info', 'printer.info'):
+                    result = {'state': 'ready', 'klippy_state': 'ready'}
+                with send_lock:
+                    ws_send(sock, json.dumps({'jsonrpc': '2.0', 'id': req.get('id'), 'result': result}))
+        finally:
+            if push in self.printer.listeners:
+                self.printer.listeners.remove(push)
+            self.close_connection = True
+
+
+# ---------------------------------------------------------------------------
+# Elegoo (UDP)
+# ---------------------------------------------------------------------------
+ELEGOO_STATE = {'idle': 0, 'printing': 1, 'paused': 2, 'complete': 0, 'cancelled': 0}
+
+
+class ElegooResponder(threading.Thread):
+    """Um único loop select() atende todos os sockets UDP simulados."""
+
+    def __init__(self):
+        super().__init__(daemon=True, name="SimElegooUDP")
+        self.sel = selectors.DefaultSelector()
+
+    def add(self, sp):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.bind((sp.ip, ELEGOO_PORT))
+        sock.setblocking(False)
+        self.sel.register(sock, selectors.EVENT_READ, sp)
+
+    def run(self):
+        while True:
+            if not self.sel.get_map():
+                time.sleep(0.5)
+                continue
+            for key, _ in self.sel.select(timeout=1.0):
+                try:
+                    data, addr = key.fileobj.recvfrom(1024)
+                except OSError:
+                    continue
+                reply = self.handle(key.data, data.decode(errors='ignore').strip())
+                if reply is not None:
+                    try:
+                        key.fileobj.sendto(json.dumps(reply).encode(), addr)
+                    except OSError:
+                        pass
+
+    @staticmethod
+    def handle(sp, cmd):
+        if cmd == 'M99999':
+            with sp.lock:
+                total_ticks = int(sp.job[2] * 1000) if sp.job else 0
+                return {'Id': sp.serial, 'Data': {
+                    'Attributes': {'Name': f"Saturn Sim {sp.index}", 'MachineName': 'Saturn 3 Ultra',
+                                   'BrandName': 'ELEGOO', 'MainboardIP': sp.ip, 'MainboardID': sp.serial,
+                                   'ProtocolVersion': 'V1.0.0', 'FirmwareVersion': 'V1.4.2'},
+                    'Status': {'CurrentStatus': ELEGOO_STATE.get(sp.state, 0), 'PrintInfo': {
+                        'Status': ELEGOO_STATE.get(sp.state, 0),
+                        'CurrentLayer': sp.layer, 'TotalLayer': sp.job[1] if sp.job else 0,
+                        'CurrentTicks': int(sp.elapsed * 1000), 'TotalTicks': total_ticks,
+                        'Filename': f"{sp.job[0]}.ctb" if sp.job else ''}}}}
+        action = {'M25': 'pause', 'M24': 'resume', 'M33': 'stop'}.get(cmd)
+        if action:
+            ok = sp.command(action)
+            return {'Id': sp.serial, 'Data': {'Cmd': cmd, 'Ack': 0 if ok else 1}}
+        return None
+
+
+SDCP_PRINT_STATE = {'idle': 0, 'printing': 3, 'paused': 6, 'complete': 9, 'cancelled': 8}
+
+
+def sdcp_status(sp):
+    with sp.lock:
+        return {
+            'Status': {
+                'CurrentStatus': [1 if sp.state in ('printing', 'paused') else 0],
+                'PrintInfo': {
+                    'Status': SDCP_PRINT_STATE.get(sp.state, 0),
+                    'CurrentLayer': sp.layer, 'TotalLayer': sp.job[1] if sp.job else 0,
+                    'CurrentTicks': int(sp.elapsed * 1000), 'TotalTicks': int(sp.job[2] * 1000) if sp.job else 0,
+                    'Filename': f"{sp.job[0]}.ctb" if sp.job else '', 'ErrorNumber': 0},
+            },
+            'MainboardID': sp.serial,
+            'TimeStamp': int(time.time()),
+            'Topic': f"sdcp/status/{sp.serial}",
+        }
+
+
+class SDCPHandler(MoonrakerHandler):
+    """WebSocket SDCP (v3) de uma impressora Elegoo simulada."""
+
+    def do_GET(self):
+        if urlparse(self.path).path != '/websocket':
+            return self._json({'error': 'Not Found'}, 404)
+        key = self.headers.get('Sec-WebSocket-Key')
+        if not key:
+            return self._json({'error': 'Expected WebSocket'}, 400)
+        self.send_response(101, 'Switching Protocols')
+        self.send_header('Upgrade', 'websocket')
+        self.send_header('Connection', 'Upgrade')
+        self.send_header('Sec-WebSocket-Accept', _ws_accept_key(key))
+        self.end_headers()
+        self.wfile.flush()
+        sock = self.connection
+        send_lock = threading.Lock()
+        sp = self.printer
+        period = [1.0]
+        last_push = [0.0]
+
+        def send(obj):
+            with send_lock:
+                ws_send(sock, obj if isinstance(obj, str) else json.dumps(obj))
+
+        def push(_sp):
+            if time.time() - last_push[0] >= period[0]:
+                last_push[0] = time.time()
+                send(sdcp_status(sp))
+
+        sp.listeners.append(push)
+        try:
+            while True:
+                opcode, data = ws_recv(self.rfile)
+                if opcode is None or opcode == 0x8:
+                    break
+                if opcode == 0x9:
+                    with send_lock:
+                        ws_send(sock, data, opcode=0xA)
+                    continue
+                if data == b'ping':
+                    send('pong')
+                    continue
+                req = json.loads(data).get('Data', {})
+                cmd = req.get('Cmd')
+                ack = 0
+                if cmd == 0:
+                    send(sdcp_status(sp))
+                elif cmd == 1:
+                    send({'Attributes': {'Name': f"Saturn Sim {sp.index}", 'MachineName': 'Saturn 4 Ultra',
+                                         'MainboardIP': sp.ip, 'MainboardID': sp.serial,
+                                         'ProtocolVersion': 'V3.0.0'},
+                          'MainboardID': sp.serial, 'Topic': f"sdcp/attributes/{sp.serial}"})
+                elif cmd in (129, 130, 131):
+                    ack = 0 if sp.command({129: 'pause', 130: 'stop', 131: 'resume'}[cmd]) else 1
+                elif cmd == 512:
+                    period[0] = max(0.2, req.get('Data', {}).get('TimePeriod', 1000) / 1000.0)
+                send({'Id': req.get('RequestID'), 'Data': {'Cmd': cmd, 'Data': {'Ack': ack},
+                                                           'RequestID': req.get('RequestID'),
+                                                           'MainboardID': sp.serial},
+                      'Topic': f"sdcp/response/{sp.serial}"})
+        finally:
+            if push in sp.listeners:
+                sp.listeners.remove(push)
+            self.close_connection = True
+
+
+# ---------------------------------------------------------------------------
+# Bambu (MQTT / FTPS / Câmera)
+# ---------------------------------------------------------------------------
+BAMBU_STATE = {'idle': 'IDLE', 'printing': 'RUNNING', 'paused': 'PAUSE',
+               'complete': 'FINISH', 'cancelled': 'FAILED'}
+
+
+def bambu_report(sp, full=False):
+    with sp.lock:
+        remaining = int((sp.job[2] - sp.elapsed) / 60) if sp.job and sp.state in ('printing', 'paused') else 0
+        p = {
+            'command': 'push_status',
+            'msg': 0 if full else 1,
+            'sequence_id': str(int(time.time())),
+            'gcode_state': BAMBU_STATE.get(sp.state, 'IDLE'),
+            'mc_percent': int(sp.progress * 100),
+            'mc_remaining_time': max(0, remaining),
+            'layer_num': sp.layer,
+            'total_layer_num': sp.job[1] if sp.job else 0,
+            'nozzle_temper': round(sp.temp_nozzle, 1),
+            'nozzle_target_temper': 220 if sp.state == 'printing' else 0,
+            'bed_temper': round(sp.temp_bed, 1),
+            'bed_target_temper': 60 if sp.state == 'printing' else 0,
+            'cooling_fan_speed': str(int(sp.fan * 15)),
+            'big_fan1_speed': '0',
+            'big_fan2_speed': '0',
+        }
+        if full:
+            p.update({
+                'subtask_name': sp.job[0] if sp.job else '',
+                'gcode_file': "/data/Metadata/plate_1.gcode" if sp.job else '',
+                'chamber_temper': 28,
+                'spd_lvl': 2,
+                'wifi_signal': '-48dBm',
+                'hms': [],
+                'print_error': 0,
+                'lights_report': [{'node': 'chamber_light', 'mode': 'on' if sp.led > 0 else 'off'}],
+                'ams': {'tray_now': '1', 'ams': [{'id': '0', 'humidity': '4', 'temp': '27.0', 'tray': [
+                    {'id': '0', 'tray_type': 'PLA', 'tray_color': 'FFFFFFFF', 'tray_info_idx': 'GFA00',
+                     'tray_sub_brands': 'PLA Basic', 'remain': 80, 'tray_uuid': f"{sp.serial}A0"},
+                    {'id': '1', 'tray_type': 'PETG', 'tray_color': '000000FF', 'tray_info_idx': 'GFG00',
+                     'tray_sub_brands': 'PETG Basic', 'remain': 45, 'tray_uuid': f"{sp.serial}A1"},
+                    {'id': '2'}, {'id': '3'}]}]},
+                'vt_tray': {'id': '254', 'tray_type': '', 'tray_color': '00000000'},
+            })
+        elif sp.state == 'printing' and sp.layer <= 1:
+            p['subtask_name'] = sp.job[0]
+        return {'print': p}
+
+
+def _mqtt_read_packet(f):
+    head = f.read(1)
+    if not head:
+        return None, None
+    mult, length = 1, 0
+    while True:
+        b = f.read(1)
+        if not b:
+            return None, None
+        length += (b[0] & 0x7F) * mult
+        if not b[0] & 0x80:
+            break
+        mult *= 128
+    return head[0], f.read(length)
+
+
+def _mqtt_packet(ptype, body):
+    out = bytearray([ptype])
+    n = len(body)
+    while True:
+        byte = n % 128
+        n //= 128
+        out.append(byte | (0x80 if n else 0))
+        if not n:
+            break
+    return bytes(out) + body
+
+
+def _mqtt_str(data, pos):
+    n = struct.unpack('>H', data[pos:pos + 2])[0]
+    return data[pos + 2:pos + 2 + n].decode(errors='ignore'), pos + 2 + n
+
+
+def _mqtt_publish(topic, payload):
+    t = topic.encode()
+    return _mqtt_packet(0x30, struct.pack('>H', len(t)) + t + payload)
+
+
+class BambuSim:
+    """Servidores MQTT, FTPS e câmera de uma impressora Bambu simulada."""
+
+    def __init__(self, sim, sp):
+        self.sim = sim
+        self.sp = sp
+        now = time.time()
+        self.files = {f"/cache/{job[0]}.gcode.3mf": (sim.three_mf[job[0]], now) for job in JOBS}
+
+    # --- MQTT ---------------------------------------------------------------
+    def serve_mqtt(self, conn, addr):
+        tls = self.sim.server_ctx.wrap_socket(conn, server_side=True)
+        f = tls.makefile('rb')
+        lock = threading.Lock()
+        report = f"device/{self.sp.serial}/report"
+        subscribed = threading.Event()
+        last_state = [None]
+
+        def send(pkt):
+            with lock:
+                tls.sendall(pkt)
+
+        def push(sp):
+            if not subscribed.is_set():
+                return
+            msg = bambu_report(sp, full=(sp.state != last_state[0]))
+            last_state[0] = sp.state
+            send(_mqtt_publish(report, json.dumps(msg).encode()))
+
+        try:
+            while True:
+                ptype, body = _mqtt_read_packet(f)
+                if ptype is None:
+                    break
+                kind = ptype >> 4
+                if kind == 1:  # CONNECT
+                    _, pos = _mqtt_str(body, 0)
+                    flags = body[pos + 1]
+                    pos += 4
+                    _, pos = _mqtt_str(body, pos)  # client id
+                    user = password = ''
+                    if flags & 0x80:
+                        user, pos = _mqtt_str(body, pos)
+                    if flags & 0x40:
+                        password, pos = _mqtt_str(body, pos)
+                    ok = user == 'bblp' and password == self.sp.access_code
+                    send(_mqtt_packet(0x20, bytes([0, 0 if ok else 5])))
+                    if not ok:
+                        break
+                    self.sp.listeners.append(push)
+                elif kind == 8:  # SUBSCRIBE
+                    pid = body[:2]
+                    topic, _ = _mqtt_str(body, 2)
+                    send(_mqtt_packet(0x90, pid + b'\x00'))
+                    if topic == report:
+                        subscribed.set()
+                elif kind == 3:  # PUBLISH
+                    _, pos = _mqtt_str(body, 0)
+                    if (ptype >> 1) & 0x03:
+                        send(_mqtt_packet(0x40, body[pos:pos + 2]))
+                        pos += 2
+                    self._handle_request(json.loads(body[pos:] or b'{}'), send, report)
+                elif kind == 12:  # PINGREQ
+                    send(_mqtt_packet(0xD0, b''))
+                elif kind == 14:  # DISCONNECT
+                    break
+        finally:
+            if push in self.sp.listeners:
+                self.sp.listeners.remove(push)
+
+    def _handle_request(self, req, send, report):
+        reply = None
+        if 'pushing' in req:
+            reply = bambu_report(self.sp, full=True)
+        elif 'info' in req:
+            reply = {'info': {'command': 'get_version', 'sequence_id': req['info'].get('sequence_id', '0'),
+                              'module': [{'name': 'ota', 'sw_ver': '01.08.02.00', 'sn': self.sp.serial}]}}
+        elif 'print' in req:
+            cmd = req['print'].get('command')
+            ok = True
+            if cmd in ('pause', 'resume', 'stop'):
+                ok = self.sp.command(cmd)
+            elif cmd in ('project_file', 'gcode_file'):
+                ok = self.sp.command('start')
+            reply = {'print': {'command': cmd, 'sequence_id': req['print'].get('sequence_id', '0'),
+                               'result': 'success' if ok else 'failed', 'reason': ''}}
+        elif 'system' in req:
+            cmd = req['system'].get('command')
+            if cmd == 'ledctrl':
+                self.sp.led = 1.0 if req['system'].get('led_mode') == 'on' else 0.0
+            reply = {'system': {'command': cmd, 'sequence_id': req['system'].get('sequence_id', '0'),
+                                'result': 'success'}}
+        if reply:
+            send(_mqtt_publish(report, json.dumps(reply).encode()))
+
+    # --- FTPS implícito -----------------------------------------------------
+    def serve_ftp(self, conn, addr):
+        ctx = self.sim.server_ctx
+        tls = ctx.wrap_socket(conn, server_side=True)
+        f = tls.makefile('rb')
+
+        def reply(line):
+            tls.sendall((line + '\r\n').encode())
+
+        reply('220 Bambu FTPS simulator ready')
+        pasv = None
+        rest = 0
+        authed = False
+        try:
+            while True:
+                raw = f.readline()
+                if not raw:
+                    break
+                line = raw.decode(errors='ignore').strip()
+                cmd, _, arg = line.partition(' ')
+                cmd = cmd.upper()
+                if cmd == 'USER':
+                    reply('331 Password required')
+                elif cmd == 'PASS':
+                    authed = arg == self.sp.access_code
+                    reply('230 Logged in' if authed else '530 Login incorrect')
+                elif not authed and cmd not in ('QUIT', 'FEAT', 'SYST'):
+                    reply('530 Please login with USER and PASS')
+                elif cmd in ('PBSZ', 'PROT', 'TYPE', 'OPTS', 'NOOP', 'MODE', 'STRU'):
+                    reply('200 OK')
+                elif cmd == 'FEAT':
+                    reply('211-Features:\r\n MDTM\r\n MLSD\r\n REST STREAM\r\n SIZE\r\n PBSZ\r\n PROT\r\n211 End')
+                elif cmd == 'SYST':
+                    reply('215 UNIX Type: L8')
+                elif cmd == 'PWD':
+                    reply('257 "/"')
+                elif cmd == 'CWD':
+                    reply('250 OK')
+                elif cmd in ('PASV', 'EPSV'):
+                    if pasv:
+                        pasv.close()
+                    pasv = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                    pasv.bind((self.sp.ip, 0))
+                    pasv.listen(1)
+                    pasv.settimeout(10)
+                    port = pasv.getsockname()[1]
+                    if cmd == 'EPSV':
+                        reply(f'229 Entering Extended Passive Mode (|||{port}|)')
+                    else:
+                        h = self.sp.ip.replace('.', ',')
+                        reply(f'227 Entering Passive Mode ({h},{port >> 8},{port & 0xFF})')
+                elif cmd == 'SIZE':
+                    entry = self.files.get(self._path(arg))
+                    reply(f'213 {len(entry[0])}' if entry else '550 No such file')
+                elif cmd == 'MDTM':
+                    entry = self.files.get(self._path(arg))
+                    reply(f"213 {time.strftime('%Y%m%d%H%M%S', time.gmtime(entry[1]))}" if entry else '550 No such file')
+                elif cmd == 'REST':
+                    rest = int(arg or 0)
+                    reply(f'350 Restarting at {rest}')
+                elif cmd in ('RETR', 'NLST', 'LIST', 'MLSD', 'STOR'):
+                    if not pasv:
+                        reply('425 Use PASV first')
+                        continue
+                    path = self._path(arg)
+                    if cmd == 'RETR' and path not in self.files:
+                        reply('550 No such file')
+                        continue
+                    reply('150 Opening data connection')
+                    try:
+                        data_conn, _ = pasv.accept()
+                    except OSError:
+                        reply('425 Cannot open data connection')
+                        continue
+                    finally:
+                        pasv.close()
+                        pasv = None
+                    data = ctx.wrap_socket(data_conn, server_side=True)
+                    try:
+                        if cmd == 'RETR':
+                            blob = self.files[path][0]
+                            view = memoryview(blob)[rest:]
+                            for i in range(0, len(view), 65536):
+                                data.sendall(view[i:i + 65536])
+                        elif cmd == 'STOR':
+                            bio = io.BytesIO()
+                            while True:
+                                chunk = data.recv(65536)
+                                if not chunk:
+                                    break
+                                bio.write(chunk)
+                            self.files[path] = (bio.getvalue(), time.time())
+                        else:
+                            data.sendall(self._listing(cmd, arg).encode())
+                        try:
+                            data.unwrap()
+                        except (OSError, ssl.SSLError):
+                            pass
+                        reply('226 Transfer complete')
+                    except (OSError, ssl.SSLError):
+                        reply('426 Connection closed; transfer aborted')
+                    finally:
+                        rest = 0
+                        data.close()
+                elif cmd == 'DELE':
+                    reply('250 Deleted' if self.files.pop(self._path(arg), None) else '550 No such file')
+                elif cmd == 'ABOR':
+                    reply('226 Abort successful')
+                elif cmd == 'QUIT':
+                    reply('221 Bye')
+                    break
+                else:
+                    reply('502 Command not implemented')
+        finally:
+            if pasv:
+                pasv.close()
+
+    @staticmethod
+    def _path(arg):
+        arg = arg.strip()
+        return arg if arg.startswith('/') else '/' + arg
+
+    def _listing(self, cmd, arg):
+        folder = self._path(arg or '/').rstrip('/')
+        lines = []
+        for path, (blob, mtime) in sorted(self.files.items()):
+            parent, _, name = path.rpartition('/')
+            if parent != folder:
+                continue
+            if cmd == 'NLST':
+                lines.append(name)
+            elif cmd == 'MLSD':
+                lines.append(f"type=file;size={len(blob)};modify={time.strftime('%Y%m%d%H%M%S', time.gmtime(mtime))}; {name}")
+            else:
+                lines.append(f"-rw-r--r-- 1 root root {len(blob)} {time.strftime('%b %d %H:%M', time.gmtime(mtime))} {name}")
+        return ''.join(line + '\r\n' for line in lines)
+
+    # --- Câmera (porta 6000) ------------------------------------------------
+    def serve_camera(self, conn, addr):
+        tls = self.sim.server_ctx.wrap_socket(conn, server_side=True)
+        auth = b''
+        while len(auth) < 80:
+            chunk = tls.recv(80 - len(auth))
+            if not chunk:
+                return
+            auth += chunk
+        user = auth[16:48].rstrip(b'\x00').decode(errors='ignore')
+        code = auth[48:80].rstrip(b'\x00').decode(errors='ignore')
+        if user != 'bblp' or code != self.sp.access_code:
+            return
+        interval = 1.0 / max(0.1, self.sim.args.camera_fps)
+        while True:
+            frame = self.sim.frame_for(self.sp)
+            tls.sendall(struct.pack('<IIII', len(frame), 0, 1, 0) + frame)
+            time.sleep(interval)
+
+
+# ---------------------------------------------------------------------------
+# Orquestração
+# ---------------------------------------------------------------------------
+class Farm:
+    def __init__(self, args):
+        self.args = args
+        self.printers = []
+        self.started_at = time.time()
+        self.acceptor = Acceptor()
+        self.elegoo = ElegooResponder()
+        self.thumb_png = make_png(300, 300, (60, 120, 200))
+        self._frames = {}
+        self._frames_lock = threading.Lock()
+        self.server_ctx = None
+        self.three_mf = {}
+
+    def _make_tls(self):
+        workdir = tempfile.mkdtemp(prefix='farm-sim-')
+        cert = os.path.join(workdir, 'cert.pem')
+        key = os.path.join(workdir, 'key.pem')
+        subprocess.run(['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-keyout', key,
+                        '-out', cert, '-days', '30', '-subj', '/CN=bambu-sim'],
+                       check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        ctx = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        ctx.set_ciphers('DEFAULT@SECLEVEL=1:AES128-SHA')
+        ctx.load_cert_chain(cert, key)
+        return ctx
+
+    def frame_for(self, sp):
+        # Um frame por impressora por segundo, compartilhado entre todos os clientes
+        key = (sp.index, sp.kind, int(time.time()))
+        with self._frames_lock:
+            frame = self._frames.get(key)
+            if frame is None:
+                self._frames = {k: v for k, v in self._frames.items() if k[2] >= key[2] - 1}
+                frame = sp.camera_frame(self.args.camera_width, self.args.camera_height, self.args.frame_kb * 1024)
+                self._frames[key] = frame
+        return frame
+
+    def build(self):
+        a = self.args
+        manifest = []
+        base_id = int(time.time()) * 1000
+        if a.bambu:
+            self.server_ctx = self._make_tls()
+            payload = os.urandom(int(a.three_mf_mb * 1024 * 1024))
+            self.three_mf = {job[0]: make_3mf(job, payload) for job in JOBS}
+
+        def ip_for(octet, i):
+            return f"127.{octet}.{i // 250}.{i % 250 + 1}"
+
+        for i in range(a.moonraker):
+            sp = SimPrinter(i, ip_for(10, i), 'moonraker')
+            handler = type('BoundMoonrakerHandler', (MoonrakerHandler,), {'printer': sp, 'sim': self})
+            self.acceptor.listen(sp.ip, MOONRAKER_PORT, lambda c, a_, h=handler: h(c, a_, None))
+            self.printers.append(sp)
+            manifest.append({'id': str(base_id + len(manifest)), 'name': f"Sim Klipper {i}", 'type': 'moonraker',
+                             'ip': f"{sp.ip}:{MOONRAKER_PORT}", 'port': MOONRAKER_PORT, 'serial': sp.serial,
+                             'access_code': '', 'camera_url': '', 'custom_camera': False,
+                             'camera_refresh': False, 'refresh_interval': 5000, 'platform_token': '',
+                             'enabled': True})
+        for i in range(a.elegoo):
+            sp = SimPrinter(i, ip_for(20, i), 'elegoo')
+            self.elegoo.add(sp)
+            if a.elegoo_sdcp:
+                handler = type('BoundSDCPHandler', (SDCPHandler,), {'printer': sp, 'sim': self})
+                self.acceptor.listen(sp.ip, ELEGOO_SDCP_PORT, lambda c, a_, h=handler: h(c, a_, None))
+            self.printers.append(sp)
+            manifest.append({'id': str(base_id + len(manifest)), 'name': f"Sim Saturn {i}", 'type': 'elegoo',
+                             'ip': sp.ip, 'port': ELEGOO_PORT, 'serial': sp.serial, 'access_code': '',
+                             'camera_url': '', 'custom_camera': False, 'camera_refresh': False,
+                             'refresh_interval': 5000, 'platform_token': '', 'enabled': True})
+        for i in range(a.bambu):
+            sp = SimPrinter(i, ip_for(30, i), 'bambu')
+            bs = BambuSim(self, sp)
+            self.acceptor.listen(sp.ip, BAMBU_MQTT_PORT, bs.serve_mqtt)
+            self.acceptor.listen(sp.ip, BAMBU_FTP_PORT, bs.serve_ftp)
+            self.acceptor.listen(sp.ip, BAMBU_CAMERA_PORT, bs.serve_camera)
+            self.printers.append(sp)
+            manifest.append({'id': str(base_id + len(manifest)), 'name': f"Sim Bambu {i}", 'type': 'bambu',
+                             'ip': sp.ip, 'port': BAMBU_MQTT_PORT, 'serial': sp.serial,
+                             'access_code': sp.access_code, 'camera_url': '', 'custom_camera': False,
+                             'camera_refresh': False, 'refresh_interval': 5000, 'platform_token': '',
+                             'enabled': True})
+        return manifest
+
+    def run(self):
+        self.acceptor.start()
+        self.elegoo.start()
+        last = time.monotonic()
+        while True:
+            time.sleep(self.args.tick)
+            now = time.monotonic()
+            dt, last = now - last, now
+            for sp in self.printers:
+                sp.tick(dt, self.args.speedup)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Simulador de fazenda de impressoras (Moonraker/Elegoo/Bambu)")
+    parser.add_argument('--moonraker', type=int, default=0, help="Quantidade de impressoras Moonraker")
+    parser.add_argument('--elegoo', type=int, default=0, help="Quantidade de impressoras Elegoo (UDP)")
+    parser.add_argument('--bambu', type=int, default=0, help="Quantidade de impressoras Bambu")
+    parser.add_argument('--elegoo-sdcp', action='store_true', help="Elegoo também expõe SDCP/WebSocket (3030)")
+    parser.add_argument('--manifest', default='-', help="Arquivo de saída com as entradas de config ('-' = stdout)")
+    parser.add_argument('--speedup', type=float, default=10.0, help="Aceleração do tempo de impressão")
+    parser.add_argument('--tick', type=float, default=1.0, help="Intervalo (s) entre atualizações de estado/push")
+    parser.add_argument('--camera-fps', type=float, default=1.0)
+    parser.add_argument('--camera-width', type=int, default=640)
+    parser.add_argument('--camera-height', type=int, default=480)
+    parser.add_argument('--frame-kb', type=int, default=60, help="Preenchimento de cada frame JPEG (KB)")
+    parser.add_argument('--three-mf-mb', type=float, default=8.0, help="Tamanho do G-code dentro de cada 3MF (MB)")
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args(argv)
+    if args.seed is not None:
+        random.seed(args.seed)
+
+    farm = Farm(args)
+    try:
+        manifest = farm.build()
+    except OSError as e:
+        log(f"Falha ao abrir sockets: {e}")
+        return 1
+
+    text = json.dumps(manifest, indent=4)
+    if args.manifest == '-':
+        print(text, flush=True)
+    else:
+        with open(args.manifest, 'w') as f:
+            f.write(text)
+    log(f"{len(manifest)} impressoras simuladas ativas "
+        f"(moonraker={args.moonraker}, elegoo={args.elegoo}, bambu={args.bambu})")
+    try:
+        farm.run()
+    except KeyboardInterrupt:
+        log("Encerrando.")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,161 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from logger_config import log_info, log_error
+from metrics import METRICS
+from command_queue import COMMANDS
+
+UPLOAD_BYTES = METRICS.counter('hub_upload_bytes_total', 'Bytes de arquivos de impressão enviados às impressoras',
+                               ('type',))
+
+COPY_BUFFER = 1024 * 1024
+
+
+class _ProgressReader:
+    """Lê o arquivo do spool contando os bytes já entregues ao driver."""
+
+    def __init__(self, fileobj, target, counter):
+        self._fileobj = fileobj
+        self._target = target
+        self._counter = counter
+
+    def read(self, size=-1):
+        data = self._fileobj.read(size)
+        self._target['sent'] += len(data)
+        self._counter.inc(len(data))
+        return data
+
+
+class UploadManager:
+    """Envio de um arquivo de impressão para várias impressoras de uma vez.
+
+    O arquivo recebido é gravado uma vez num arquivo temporário (spool) e cada
+    impressora o lê com seu próprio handle, em paralelo, em blocos: a memória
+    usada não depende do tamanho do arquivo. Cada destino tem estado e bytes
+    enviados; com `start_print`, ao terminar o envio a impressão é iniciada pela
+    fila de comandos (o id do comando fica no destino). O spool é apagado
+    quando todos os destinos terminam.
+    """
+
+    def __init__(self, workers=8, keep=100):
+        self.keep = keep
+        self.lock = threading.Lock()
+        self._jobs = OrderedDict()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='Upload')
+
+    def submit(self, source, filename, printers, start_print=False, options=None):
+        """Grava `source` (file-like) no spool e inicia o envio para `printers`."""
+        fd, path = tempfile.mkstemp(prefix='hub-upload-', suffix=os.path.splitext(filename)[1])
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                shutil.copyfileobj(source, out, COPY_BUFFER)
+        except Exception:
+            os.remove(path)
+            raise
+        return self.send(path, filename, printers, start_print, options, owned=True)
+
+    def send(self, path, filename, printers, start_print=False, options=None, owned=False, on_done=None):
+        """Envia um arquivo já em disco. Com `owned` o arquivo é apagado no fim;
+        `on_done(upload)` é chamado quando todos os destinos terminarem."""
+        job = {
+            'id': uuid.uuid4().hex[:12],
+            'filename': filename,
+            'size': os.path.getsize(path),
+            'start_print': bool(start_print),
+            'options': dict(options or {}),
+            'created_at': time.time(),
+            'finished_at': None,
+            'targets': [{
+                'printer_id': p.config.get('id'),
+                'name': p.name,
+                'state': 'queued',
+                'sent': 0,
+                'remote_path': None,
+                'command_id': None,
+                'error': None,
+            } for p in printers],
+        }
+        job['_path'] = path
+        job['_owned'] = owned
+        job['_on_done'] = on_done
+        job['_pending'] = len(printers)
+        with self.lock:
+            self._jobs[job['id']] = job
+            self._trim()
+        log_info(f"[Upload] {filename} ({job['size']} bytes) para {len(printers)} impressoras")
+        if not printers:
+            self._cleanup(job)
+        for printer, target in zip(printers, job['targets']):
+            self._executor.submit(self._transfer, job, target, printer)
+        return self._public(job)
+
+    def get(self, job_id):
+        with self.lock:
+            job = self._jobs.get(job_id)
+            return self._public(job) if job else None
+
+    def list(self, limit=20):
+        with self.lock:
+            jobs = list(reversed(self._jobs.values()))[:limit]
+            return [self._public(j) for j in jobs]
+
+    def _transfer(self, job, target, printer):
+        target['state'] = 'uploading'
+        try:
+            with open(job['_path'], 'rb') as f:
+                reader = _ProgressReader(f, target, UPLOAD_BYTES.labels(printer.type))
+                target['remote_path'] = printer.upload_file(reader, job['filename'], job['size'])
+            if job['start_print']:
+                cmd = COMMANDS.submit(printer, 'start_print', dict(job['options'], filename=job['filename']),
+                                      source='upload')
+                target['command_id'] = cmd['id']
+            target['state'] = 'done'
+        except Exception as e:
+            target['state'] = 'failed'
+            target['error'] = str(e) or type(e).__name__
+            log_error(f"[Upload] {job['filename']} para {printer.name} falhou: {target['error']}")
+        finally:
+            with self.lock:
+                job['_pending'] -= 1
+                last = job['_pending'] == 0
+            if last:
+                self._cleanup(job)
+
+    def _cleanup(self, job):
+        job['finished_at'] = time.time()
+        if job['_owned']:
+            try:
+                os.remove(job['_path'])
+            except OSError:
+                pass
+        ok = sum(1 for t in job['targets'] if t['state'] == 'done')
+        log_info(f"[Upload] {job['filename']}: {ok}/{len(job['targets'])} impressoras concluídas")
+        if job['_on_done'] is not None:
+            try:
+                job['_on_done'](self._public(job))
+            except Exception as e:
+                log_error(f"[Upload] Callback de {job['id']} falhou: {e}")
+
+    @staticmethod
+    def _public(job):
+        data = {k: v for k, v in job.items() if not k.startswith('_')}
+        data['targets'] = [dict(t, progress=round(100.0 * t['sent'] / job['size'], 1) if job['size'] else 100.0)
+                           for t in job['targets']]
+        data['done'] = job['finished_at'] is not None
+        return data
+
+    def _trim(self):
+        while len(self._jobs) > self.keep:
+            oldest = next(iter(self._jobs.values()))
+            if oldest['finished_at'] is None:
+                break
+            self._jobs.popitem(last=False)
+
+
+# Instância global usada pelo app
+UPLOADS = UploadManager()